@@ -0,0 +1,274 @@
+"""
+Compaction of idle conversations out of the hot `messages` table.
+
+A conversation whose newest message is older than ARCHIVE_IDLE_HOURS has its
+messages packed into one zlib-compressed JSON blob in `conversation_archives`;
+the rows are then deleted and `Conversation.end_time` is set to the last message.
+The newest archived row stays behind as a tombstone at `archived_until_id`: MySQL 5.7
+(after a restart) and SQLite hand out max(id) + 1 as the next id, so without it new
+messages could get ids at or below the boundary. Readers skip it (`hot_messages`).
+Reads go through `load_messages`, which merges the archive with any rows written
+after it, so callers never see the difference. A new turn on an archived
+conversation reopens it (end_time back to NULL); the next compaction folds the
+new messages into the existing blob.
+
+    python -m backend.backend.archive [--idle-hours N]
+"""
+import asyncio
+import json
+import os
+import sys
+import zlib
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from . import models
+from .shared_state import shared_state
+from .telemetry import log_event, metrics
+
+ARCHIVE_IDLE_HOURS = float(os.getenv("ARCHIVE_IDLE_HOURS", "168"))
+# Conversations compacted per transaction; keeps row locks and undo short on MySQL.
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "100"))
+# Background compaction interval; 0 leaves it to the CLI (or an external scheduler).
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", "0"))
+ARCHIVE_COMPRESSION_LEVEL = int(os.getenv("ARCHIVE_COMPRESSION_LEVEL", "6"))
+ARCHIVE_CODEC = "zlib-json"
+ARCHIVE_LOCK_TTL_SECONDS = 3600
+# Held per conversation while its batch is compacted; chat turns wait on the same lock.
+ARCHIVE_CONVERSATION_LOCK_TTL_SECONDS = 120
+
+ARCHIVED_CONVERSATIONS = metrics.counter("archive_conversations_total", "Conversations compacted into the archive.")
+ARCHIVED_MESSAGES = metrics.counter("archive_messages_total", "Messages moved out of the messages table.")
+ARCHIVED_BYTES = metrics.counter("archive_bytes_total", "Message content bytes written to archives, before and after compression.", ["stage"])
+
+
+def encode_messages(messages: Sequence[models.Message]) -> bytes:
+    rows = [[msg.id, msg.sender, msg.content, msg.timestamp.isoformat() if msg.timestamp else None] for msg in messages]
+    return zlib.compress(json.dumps(rows, separators=(",", ":")).encode("utf-8"), ARCHIVE_COMPRESSION_LEVEL)
+
+
+def decode_messages(conversation_id: int, codec: str, payload: bytes) -> List[models.Message]:
+    """Transient (session-less) Message objects, oldest first."""
+    if codec != ARCHIVE_CODEC:
+        raise ValueError(f"Unknown archive codec: {codec}")
+    return [
+        models.Message(id=id_, conversation_id=conversation_id, sender=sender, content=content,
+                       timestamp=datetime.fromisoformat(timestamp) if timestamp else None)
+        for id_, sender, content, timestamp in json.loads(zlib.decompress(payload))
+    ]
+
+
+async def load_archived_messages(db: AsyncSession, conversation_id: int) -> List[models.Message]:
+    archive = (await db.execute(
+        select(models.ConversationArchive.codec, models.ConversationArchive.payload)
+        .where(models.ConversationArchive.conversation_id == conversation_id)
+    )).first()
+    if archive is None:
+        return []
+    return decode_messages(conversation_id, archive.codec, archive.payload)
+
+
+def hot_messages(conversation_id: int, archived_until_id: Optional[int]):
+    """Messages of a conversation still in the messages table, without the archive's tombstone."""
+    condition = models.Message.conversation_id == conversation_id
+    if archived_until_id:
+        condition = and_(condition, models.Message.id > archived_until_id)
+    return condition
+
+
+async def load_messages(db: AsyncSession, conversation_id: int, archived_until_id: Optional[int],
+                        after_id: Optional[int] = None, before_id: Optional[int] = None) -> List[models.Message]:
+    """All messages of a conversation with after_id < id < before_id, oldest first, archive included."""
+    messages: List[models.Message] = []
+    if archived_until_id and (after_id is None or after_id < archived_until_id):
+        messages = [
+            msg for msg in await load_archived_messages(db, conversation_id)
+            if (after_id is None or msg.id > after_id) and (before_id is None or msg.id < before_id)
+        ]
+    if before_id is None or not archived_until_id or before_id > archived_until_id:
+        query = select(models.Message).where(hot_messages(conversation_id, archived_until_id))
+        if after_id:
+            query = query.where(models.Message.id > after_id)
+        if before_id is not None:
+            query = query.where(models.Message.id < before_id)
+        messages.extend((await db.scalars(query.order_by(models.Message.id))).all())
+    return messages
+
+
+async def idle_conversation_ids(db: AsyncSession, cutoff: datetime, limit: int, after_id: int = 0) -> List[int]:
+    # Tombstones don't count: a conversation with nothing new since its last compaction isn't picked again.
+    return list((await db.scalars(
+        select(models.Message.conversation_id)
+        .join(models.Conversation, models.Conversation.id == models.Message.conversation_id)
+        .where(models.Message.conversation_id > after_id,
+               models.Message.id > func.coalesce(models.Conversation.archived_until_id, 0))
+        .group_by(models.Message.conversation_id)
+        .having(func.max(models.Message.timestamp) < cutoff)
+        .order_by(models.Message.conversation_id)
+        .limit(limit)
+    )).all())
+
+
+async def archive_conversations(db: AsyncSession, conversation_ids: Sequence[int],
+                                cutoff: Optional[datetime] = None) -> Tuple[int, int]:
+    """
+    Moves the messages of `conversation_ids` into the archive in one transaction; returns
+    (conversations, messages) moved.
+    With a `cutoff`, a conversation that got a message at or after it since it was picked is left alone.
+    """
+    boundaries = dict((await db.execute(
+        select(models.Conversation.id, models.Conversation.archived_until_id)
+        .where(models.Conversation.id.in_(conversation_ids))
+    )).all())
+    rows = (await db.scalars(
+        select(models.Message)
+        .join(models.Conversation, models.Conversation.id == models.Message.conversation_id)
+        .where(models.Message.conversation_id.in_(conversation_ids),
+               models.Message.id > func.coalesce(models.Conversation.archived_until_id, 0))
+        .order_by(models.Message.conversation_id, models.Message.id)
+    )).all()
+    by_conversation: Dict[int, List[models.Message]] = {}
+    for msg in rows:
+        by_conversation.setdefault(msg.conversation_id, []).append(msg)
+    if cutoff is not None:
+        by_conversation = {
+            conversation_id: messages for conversation_id, messages in by_conversation.items()
+            if max(msg.timestamp for msg in messages) < cutoff
+        }
+    existing = {
+        archive.conversation_id: archive for archive in (await db.scalars(
+            select(models.ConversationArchive).where(models.ConversationArchive.conversation_id.in_(list(by_conversation)))
+        )).all()
+    }
+
+    now = datetime.now()
+    moved = 0
+    for conversation_id, messages in by_conversation.items():
+        archive = existing.get(conversation_id)
+        merged = [*(decode_messages(conversation_id, archive.codec, archive.payload) if archive else []), *messages]
+        payload = encode_messages(merged)
+        if archive is None:
+            archive = models.ConversationArchive(conversation_id=conversation_id)
+            db.add(archive)
+        archive.codec = ARCHIVE_CODEC
+        archive.message_count = len(merged)
+        archive.last_message_id = messages[-1].id
+        archive.payload = payload
+        archive.archived_at = now
+
+        await db.execute(
+            update(models.Conversation).where(models.Conversation.id == conversation_id)
+            .values(end_time=messages[-1].timestamp, archived_until_id=messages[-1].id)
+        )
+        # Exactly the rows packed above (a turn written while this batch ran stays in the hot
+        # table) and the previous tombstone; the newest packed row becomes the new tombstone.
+        stale = [msg.id for msg in messages[:-1]]
+        if boundaries.get(conversation_id):
+            stale.append(boundaries[conversation_id])
+        if stale:
+            await db.execute(
+                delete(models.Message)
+                .where(models.Message.id.in_(stale))
+                .execution_options(synchronize_session=False)
+            )
+        moved += len(messages)
+        ARCHIVED_BYTES.inc(sum(len(msg.content) for msg in merged), stage="raw")
+        ARCHIVED_BYTES.inc(len(payload), stage="compressed")
+    await db.commit()
+    ARCHIVED_CONVERSATIONS.inc(len(by_conversation))
+    ARCHIVED_MESSAGES.inc(moved)
+    return len(by_conversation), moved
+
+
+async def compact(session_factory: async_sessionmaker, idle_hours: float = ARCHIVE_IDLE_HOURS,
+                  batch_size: int = ARCHIVE_BATCH_SIZE) -> Dict[str, int]:
+    """Archives every conversation idle for `idle_hours`, batch by batch."""
+    # Every worker runs the archiver; only one compacts at a time.
+    lock = shared_state.lock("archive", ttl=ARCHIVE_LOCK_TTL_SECONDS)
+    if not await lock.acquire(wait=0):
+        return {"conversations": 0, "messages": 0, "skipped": 1}
+    cutoff = datetime.now() - timedelta(hours=idle_hours)
+    conversations = messages = skipped = 0
+    after_id = 0
+    try:
+        while True:
+            async with session_factory() as db:
+                ids = await idle_conversation_ids(db, cutoff, batch_size, after_id)
+                if not ids:
+                    break
+                after_id = ids[-1]
+                # A conversation with a turn in flight is skipped; the next run picks it up if still idle.
+                held = []
+                try:
+                    for conversation_id in ids:
+                        conversation_lock = shared_state.lock(f"conversation:{conversation_id}",
+                                                              ttl=ARCHIVE_CONVERSATION_LOCK_TTL_SECONDS)
+                        if await conversation_lock.acquire(wait=0):
+                            held.append((conversation_id, conversation_lock))
+                    skipped += len(ids) - len(held)
+                    if held:
+                        archived, moved = await archive_conversations(
+                            db, [conversation_id for conversation_id, _ in held], cutoff)
+                        conversations += archived
+                        messages += moved
+                finally:
+                    for _, conversation_lock in held:
+                        await conversation_lock.release()
+    finally:
+        await lock.release()
+    if conversations:
+        log_event("archive_compacted", conversations=conversations, messages=messages, busy=skipped)
+    return {"conversations": conversations, "messages": messages, "busy": skipped}
+
+
+class ConversationArchiver:
+    """Runs `compact` every ARCHIVE_INTERVAL_SECONDS in the background."""
+
+    def __init__(self, session_factory: async_sessionmaker, interval: float = ARCHIVE_INTERVAL_SECONDS):
+        self.session_factory = session_factory
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await compact(self.session_factory)
+            except Exception as e:
+                log_event("archive_failed", error=repr(e))
+
+
+def main(argv: List[str]) -> int:
+    from .database import AsyncSessionLocal, async_engine
+
+    idle_hours = float(argv[argv.index("--idle-hours") + 1]) if "--idle-hours" in argv else ARCHIVE_IDLE_HOURS
+
+    async def run():
+        try:
+            print(await compact(AsyncSessionLocal, idle_hours=idle_hours))
+        finally:
+            await async_engine.dispose()
+
+    asyncio.run(run())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,155 @@
+import heapq
+import re
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+
+# Relative weight of a token hit in each indexed field.
+FIELD_WEIGHTS = {"name": 3.0, "brand": 2.0, "category": 2.0, "department": 1.0}
+# Minimum trigram similarity for a fuzzy token match (typos, partial words).
+MIN_TRIGRAM_SIMILARITY = 0.4
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    # "T-Shirts" and "Levi's" should match "tshirt" and "levis".
+    text = text.lower().replace("-", "").replace("'", "")
+    tokens = []
+    for token in _TOKEN_RE.findall(text):
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def trigrams(token: str) -> Set[str]:
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def serialize_product(product: models.Product) -> dict:
+    return {
+        "id": product.id,
+        "name": product.name,
+        "category": product.category,
+        "brand": product.brand,
+        "retail_price": float(product.retail_price) if product.retail_price is not None else None,
+        "department": product.department,
+        "sku": product.sku
+    }
+
+
+class ProductCatalogIndex:
+    """
+    Immutable in-memory search index over the products table.
+
+    `refresh()` builds a complete new index and swaps it in with a single attribute
+    assignment, so concurrent readers always see either the old or the new catalog.
+    """
+
+    def __init__(self):
+        self._state = None
+        self.loaded_at: Optional[float] = None
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._state is not None
+
+    def __len__(self) -> int:
+        return len(self._state["products"]) if self._state else 0
+
+    def build(self, products: Iterable[dict]) -> None:
+        by_id: Dict[int, dict] = {}
+        by_sku: Dict[str, dict] = {}
+        postings: Dict[str, Dict[int, float]] = defaultdict(dict)
+        vocabulary_trigrams: Dict[str, Set[str]] = defaultdict(set)
+
+        for product in products:
+            by_id[product["id"]] = product
+            if product.get("sku"):
+                by_sku[product["sku"].lower()] = product
+            for field, weight in FIELD_WEIGHTS.items():
+                for token in tokenize(product.get(field)):
+                    # A token counts once per product, at its best-weighted field.
+                    if postings[token].get(product["id"], 0.0) < weight:
+                        postings[token][product["id"]] = weight
+
+        for token in postings:
+            for gram in trigrams(token):
+                vocabulary_trigrams[gram].add(token)
+
+        self._state = {
+            "products": by_id,
+            "skus": by_sku,
+            "postings": dict(postings),
+            "trigrams": dict(vocabulary_trigrams),
+        }
+        self.loaded_at = time.time()
+
+    async def refresh(self, db: AsyncSession) -> int:
+        products = (await db.scalars(select(models.Product))).all()
+        self.build(serialize_product(product) for product in products)
+        return len(products)
+
+    def get(self, product_id: int) -> Optional[dict]:
+        if not self._state:
+            return None
+        return self._state["products"].get(product_id)
+
+    def get_by_sku(self, sku: str) -> Optional[dict]:
+        if not self._state or not sku:
+            return None
+        return self._state["skus"].get(sku.strip().lower())
+
+    def _fuzzy_tokens(self, token: str) -> Dict[str, float]:
+        grams = trigrams(token)
+        candidates: Dict[str, int] = defaultdict(int)
+        for gram in grams:
+            for vocab_token in self._state["trigrams"].get(gram, ()):
+                candidates[vocab_token] += 1
+
+        matches = {}
+        for vocab_token, shared in candidates.items():
+            similarity = shared / len(grams | trigrams(vocab_token))
+            if similarity >= MIN_TRIGRAM_SIMILARITY:
+                matches[vocab_token] = similarity
+        return matches
+
+    def search(self, query: str, limit: int = 5) -> List[dict]:
+        """Ranks products by weighted token hits, falling back to trigram matches per token."""
+        if not self._state:
+            return []
+
+        postings = self._state["postings"]
+        scores: Dict[int, float] = defaultdict(float)
+        matched_terms: Dict[int, int] = defaultdict(int)
+        query_tokens = list(dict.fromkeys(tokenize(query)))
+
+        for token in query_tokens:
+            if token in postings:
+                expansions = {token: 1.0}
+            else:
+                expansions = self._fuzzy_tokens(token)
+            hit_ids = set()
+            for vocab_token, similarity in expansions.items():
+                for product_id, weight in postings[vocab_token].items():
+                    scores[product_id] += weight * similarity
+                    hit_ids.add(product_id)
+            for product_id in hit_ids:
+                matched_terms[product_id] += 1
+
+        # Products matching more of the query terms always rank first.
+        ranked = heapq.nlargest(limit, scores, key=lambda pid: (matched_terms[pid], scores[pid], -pid))
+        products = self._state["products"]
+        return [products[product_id] for product_id in ranked]
+
+
+product_catalog = ProductCatalogIndex()
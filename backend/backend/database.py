@@ -1,30 +1,122 @@
 import os
-from dotenv import load_dotenv
-from sqlalchemy import create_engine
+import time
+from sqlalchemy import create_engine, exc
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import QueuePool
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
-load_dotenv() # Load from .env
+from . import env  # noqa: F401  (loads .env before the settings below are read)
+from .telemetry import DB_POOL_TIMEOUTS, DB_POOL_WAIT_SECONDS, metrics
 
 MYSQL_HOST = os.getenv("MYSQL_HOST") # Will now load 'host.docker.internal'
 MYSQL_DATABASE = os.getenv("MYSQL_DATABASE")
 MYSQL_USER = os.getenv("MYSQL_USER")
 MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD")
 
-SQLALCHEMY_DATABASE_URL = (
+# DATABASE_URL / ASYNC_DATABASE_URL override the MySQL settings (e.g. SQLite for the benchmarks).
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL") or (
     f"mysql+mysqlconnector://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:3306/{MYSQL_DATABASE}"
     "?ssl_disabled=True"
 )
 
+# Async driver for the request path; the sync engine above is kept for schema creation and scripts.
+ASYNC_SQLALCHEMY_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or (
+    f"mysql+aiomysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:3306/{MYSQL_DATABASE}"
+)
+
+# Pool sizing. Each process opens up to (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections per
+# engine, so workers * that total has to stay below MySQL's max_connections.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Recycle before MySQL's wait_timeout (or a proxy's idle timeout) drops the connection.
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+
+class TimedPoolMixin:
+    """Records how long checkouts take (queueing for a free connection, connect and pre-ping)."""
+    label = "sync"
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            DB_POOL_TIMEOUTS.inc(pool=self.label)
+            raise
+        finally:
+            DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - start, pool=self.label)
+
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    label = "sync"
+
+
+class TimedAsyncQueuePool(TimedPoolMixin, AsyncAdaptedQueuePool):
+    label = "async"
+
+
+def pool_options() -> dict:
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
-    pool_pre_ping=True,
-    poolclass=QueuePool
+    poolclass=TimedQueuePool,
+    **pool_options(),
+)
+
+async_engine = create_async_engine(
+    ASYNC_SQLALCHEMY_DATABASE_URL,
+    poolclass=TimedAsyncQueuePool,
+    **pool_options(),
 )
 
+
+def pool_stats(pool) -> dict:
+    """Current occupancy of a QueuePool plus the checkout wait totals recorded for it."""
+    wait_count, wait_total = DB_POOL_WAIT_SECONDS.totals().get((pool.label,), (0, 0.0))
+    return {
+        "size": pool.size(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "capacity": pool.size() + DB_MAX_OVERFLOW,
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        # QueuePool counts overflow from -size; only connections beyond pool_size are reported.
+        "overflow": max(0, pool.overflow()),
+        "timeout_s": pool.timeout(),
+        "recycle_s": DB_POOL_RECYCLE,
+        "checkouts": wait_count,
+        "mean_wait_ms": round(wait_total / wait_count * 1000, 3) if wait_count else None,
+        "timeouts": DB_POOL_TIMEOUTS.value(pool=pool.label),
+    }
+
+
+POOLS = {"sync": engine.pool, "async": async_engine.pool}
+metrics.gauge("db_pool_checked_out", "Connections currently checked out of the pool.",
+              lambda: {(name,): pool.checkedout() for name, pool in POOLS.items()}, ["pool"])
+metrics.gauge("db_pool_overflow", "Connections open beyond pool_size.",
+              lambda: {(name,): max(0, pool.overflow()) for name, pool in POOLS.items()}, ["pool"])
+metrics.gauge("db_pool_capacity", "pool_size + max_overflow.",
+              lambda: {(name,): pool.size() + DB_MAX_OVERFLOW for name, pool in POOLS.items()}, ["pool"])
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
 Base = declarative_base()
 
 def get_db():
@@ -32,4 +124,8 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,8 @@
+"""
+Loads .env into os.environ exactly once. Modules that read settings at import time
+import this first; variables already set in the environment win over the file.
+"""
+from dotenv import load_dotenv
+
+# Searches upward from this package: backend/backend/.env locally, /app/.env in the Docker image.
+load_dotenv()
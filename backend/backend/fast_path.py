@@ -0,0 +1,142 @@
+"""
+Answers messages with an unambiguous structured intent ("status of order 12345",
+"price of SKU ABC-123") without the LLM: compiled patterns pick out the id, the
+registered tool runs directly, and the reply comes from a template. Each routed turn
+saves the classification call and the follow-up call that would phrase the tool result.
+
+Anything the patterns aren't sure about (several ids, a request to cancel or return, a
+lookup that finds nothing, a tool error) goes to the LLM as before. `stats()` reports the fraction of turns handled.
+"""
+import json
+import os
+import re
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from .telemetry import metrics
+from .tools import ToolRegistry
+
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").lower() == "true"
+# Longer messages usually carry more than a lookup; the LLM gets those.
+FAST_PATH_MAX_WORDS = int(os.getenv("FAST_PATH_MAX_WORDS", "16"))
+
+# "order #2", "order number 2", "order id: 2"; without a marker only a 4+ digit number is an
+# id, so "order 2 shirts" and "an order 2 days ago" aren't lookups.
+ORDER_ID_RE = re.compile(
+    r"\border\s*(?:(?:id|number|no\.?)\s*(?:is|:)?\s*#?|#\s*|(?:is|:)?\s*(?=\d{4}))(\d{1,12})\b", re.IGNORECASE
+)
+BARE_ORDER_ID_RE = re.compile(r"#(\d{1,12})\b")
+# A SKU has at least one digit, so "the sku for the blue jeans" doesn't capture "for".
+SKU_RE = re.compile(r"\bsku\s*(?:#|:|is)?\s*((?=[a-z-]*\d)[a-z0-9][a-z0-9-]{2,31})\b", re.IGNORECASE)
+ORDER_WORDS_RE = re.compile(r"\b(?:orders?|package|parcel|shipment)\b", re.IGNORECASE)
+ORDER_STATUS_RE = re.compile(
+    r"\b(?:status|track(?:ing)?|where|when|arriv\w*|ship\w*|deliver\w*|update|check|details?|info)\b", re.IGNORECASE
+)
+PRODUCT_INFO_RE = re.compile(r"\b(?:price|cost|how much|details?|info|about|what)\b", re.IGNORECASE)
+# Requests the templates can't serve; these always go to the LLM.
+DEFER_RE = re.compile(
+    r"\b(?:cancel\w*|return\w*|refund\w*|exchange\w*|change\w*|modify|wrong|broken|damaged|missing|complain\w*|"
+    r"address|compare|vs|versus|similar|alternatives?|recommend\w*|cheaper)\b",
+    re.IGNORECASE,
+)
+
+FAST_PATH_TURNS = metrics.counter(
+    "fast_path_turns_total", "Chat turns seen by the rule-based fast path, by intent and outcome.", ["intent", "outcome"]
+)
+
+
+class Route(NamedTuple):
+    intent: str
+    tool: str
+    arguments: dict
+
+
+def route(message: str) -> Optional[Route]:
+    """The structured lookup `message` asks for, or None when it isn't clear-cut."""
+    words = len(message.split())
+    if words > FAST_PATH_MAX_WORDS or DEFER_RE.search(message):
+        return None
+    skus = set(SKU_RE.findall(message))
+    order_ids = set(ORDER_ID_RE.findall(message))
+    if not order_ids and ORDER_WORDS_RE.search(message):
+        order_ids = set(BARE_ORDER_ID_RE.findall(message))
+    if len(skus) + len(order_ids) != 1:
+        return None
+    # A bare "order #123" / "SKU X" is a lookup too.
+    if order_ids and (words <= 3 or ORDER_STATUS_RE.search(message)):
+        return Route("order_status", "get_order_details", {"order_id": int(order_ids.pop())})
+    if skus and (words <= 3 or PRODUCT_INFO_RE.search(message)):
+        return Route("product_sku", "get_product_details", {"sku": skus.pop()})
+    return None
+
+
+def _money(value) -> str:
+    return f"${value:,.2f}" if value is not None else "price unavailable"
+
+
+def render_order(order: dict) -> str:
+    placed = order.get("created_at")
+    if isinstance(placed, str):
+        placed = datetime.fromisoformat(placed)
+    lines = [f"Order #{order['order_id']} is currently {order['status'] or 'being processed'}."]
+    if placed:
+        lines[0] += f" It was placed on {placed.strftime('%B %d, %Y').replace(' 0', ' ')}."
+    items = order.get("items") or []
+    if items:
+        lines.append(f"It contains {len(items)} item{'s' if len(items) != 1 else ''}:")
+        lines.extend(f"- {item['product_name']} ({item['status']}, {_money(item['sale_price'])})" for item in items)
+    return "\n".join(lines)
+
+
+def render_product(product: dict) -> str:
+    maker = f" by {product['brand']}" if product.get("brand") else ""
+    return (f"{product['name']}{maker} (SKU {product['sku']}) costs {_money(product['retail_price'])}. "
+            f"It's in our {product['department']} {product['category']} range.")
+
+
+class FastPathRouter:
+    def __init__(self, registry: ToolRegistry, enabled: bool = FAST_PATH_ENABLED):
+        self.registry = registry
+        self.enabled = enabled
+        self.turns = 0
+        self.answered = 0
+
+    async def answer(self, session_factory: async_sessionmaker, message: str, user_id: int) -> Optional[str]:
+        """The templated reply to `message`, or None when the turn needs the LLM."""
+        if not self.enabled:
+            return None
+        self.turns += 1
+        matched = route(message)
+        if matched is None:
+            FAST_PATH_TURNS.inc(intent="none", outcome="llm")
+            return None
+        result = await self.registry.call(
+            session_factory,
+            {"id": "fast_path", "type": "function", "function": {"name": matched.tool, "arguments": matched.arguments}},
+            user_id,
+        )
+        output = json.loads(result["content"])
+        if isinstance(output, dict) and "error" in output:
+            FAST_PATH_TURNS.inc(intent=matched.intent, outcome="tool_error")
+            return None
+        # Nothing found usually means the pattern misread the message; the LLM sees it instead.
+        if not output:
+            FAST_PATH_TURNS.inc(intent=matched.intent, outcome="not_found")
+            return None
+        FAST_PATH_TURNS.inc(intent=matched.intent, outcome="answered")
+        self.answered += 1
+        if matched.intent == "order_status":
+            return render_order(output)
+        return render_product(output)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "turns": self.turns,
+            "answered": self.answered,
+            "handled_fraction": round(self.answered / self.turns, 4) if self.turns else 0.0,
+            # Every answered turn skips the classification call and the follow-up call.
+            "llm_calls_saved": 2 * self.answered,
+        }
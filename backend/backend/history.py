@@ -0,0 +1,112 @@
+import os
+from typing import List, Optional, Sequence, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .archive import hot_messages, load_archived_messages, load_messages
+
+# Most recent messages sent verbatim to the LLM (a turn is one user + one ai message).
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "12"))
+# Token budget for summary + recent messages; llama3-8b-8192 also has to fit the
+# system prompt, tool output and the 250-token completion.
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "3000"))
+SUMMARY_TOKEN_BUDGET = int(os.getenv("SUMMARY_TOKEN_BUDGET", "600"))
+SUMMARY_LINE_CHARS = 200
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    # ~4 characters per token is close enough for budgeting llama3 prompts.
+    if not text:
+        return 0
+    return len(text) // 4 + 1
+
+
+def llm_role(sender: str) -> str:
+    return "assistant" if sender == "ai" else sender
+
+
+async def load_recent_messages(db: AsyncSession, conversation_id: int, limit: int = HISTORY_MAX_MESSAGES,
+                               archived_until_id: Optional[int] = None) -> List[models.Message]:
+    """Returns the newest `limit` messages of a conversation, oldest first."""
+    rows = (await db.scalars(
+        select(models.Message)
+        .where(hot_messages(conversation_id, archived_until_id))
+        .order_by(models.Message.timestamp.desc(), models.Message.id.desc())
+        .limit(limit)
+    )).all()
+    rows = list(reversed(rows))
+    if len(rows) < limit and archived_until_id:
+        # A reopened conversation: top the window up from its archive.
+        archived = await load_archived_messages(db, conversation_id)
+        rows = archived[max(0, len(archived) - (limit - len(rows))):] + rows
+    return rows
+
+
+async def load_unsummarized_messages(db: AsyncSession, conversation: models.Conversation, before_id: int) -> List[models.Message]:
+    """Messages that have left the window but are not folded into the summary yet."""
+    if (conversation.archived_until_id or 0) > (conversation.summarized_until_id or 0):
+        return await load_messages(db, conversation.id, conversation.archived_until_id,
+                                   after_id=conversation.summarized_until_id, before_id=before_id)
+    query = (
+        select(models.Message)
+        .where(hot_messages(conversation.id, conversation.archived_until_id), models.Message.id < before_id)
+        .order_by(models.Message.id)
+    )
+    if conversation.summarized_until_id:
+        query = query.where(models.Message.id > conversation.summarized_until_id)
+    return list((await db.scalars(query)).all())
+
+
+def fold_into_summary(summary: Optional[str], messages: Sequence[models.Message], budget: int = SUMMARY_TOKEN_BUDGET) -> str:
+    """Appends one clipped line per message and drops the oldest lines once over budget."""
+    lines = summary.splitlines() if summary else []
+    for msg in messages:
+        content = " ".join(msg.content.split())
+        if len(content) > SUMMARY_LINE_CHARS:
+            content = content[:SUMMARY_LINE_CHARS].rstrip() + "..."
+        lines.append(f"- {msg.sender}: {content}")
+
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > budget:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def summary_message(summary: str) -> dict:
+    return {"role": "system", "content": f"Summary of earlier messages in this conversation:\n{summary}"}
+
+
+async def build_history_window(
+    db: AsyncSession, conversation: models.Conversation, reserved_tokens: int = 0
+) -> Tuple[List[dict], Optional[Tuple[str, int]]]:
+    """
+    Builds the LLM history for a conversation: the rolling summary followed by as many
+    recent messages as fit in HISTORY_TOKEN_BUDGET. Messages that drop out of the window
+    are folded into the summary, returned as a (summary, summarized_until_id) update for
+    the caller to persist with the rest of the turn (None when unchanged).
+    """
+    recent = await load_recent_messages(db, conversation.id, archived_until_id=conversation.archived_until_id)
+
+    budget = HISTORY_TOKEN_BUDGET - reserved_tokens - estimate_tokens(conversation.summary)
+    window: List[models.Message] = []
+    used = 0
+    for msg in reversed(recent):
+        cost = estimate_tokens(msg.content)
+        if window and used + cost > budget:
+            break
+        window.append(msg)
+        used += cost
+    window.reverse()
+
+    summary = conversation.summary
+    summary_update = None
+    if window:
+        evicted = await load_unsummarized_messages(db, conversation, before_id=window[0].id)
+        if evicted:
+            summary = fold_into_summary(summary, evicted)
+            summary_update = (summary, evicted[-1].id)
+
+    history = [summary_message(summary)] if summary else []
+    history.extend({"role": llm_role(msg.sender), "content": msg.content} for msg in window)
+    return history, summary_update
@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from .shared_state import REDIS_URL, SHARED_STATE_BACKEND
+from .telemetry import log_event
+
+# Defaults to Redis when workers share state through it, so they also share cached answers.
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", SHARED_STATE_BACKEND)  # memory | redis | none
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", "900"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2048"))
+
+# Parts of the prompt that change without changing the answer; stripped before hashing.
+VOLATILE_PATTERNS = [
+    re.compile(r"Today's date is \d{4}-\d{2}-\d{2}\."),
+]
+
+
+class InMemoryLRUBackend:
+    """Process-local LRU with per-entry expiry; also the stand-in for shared backends in tests."""
+
+    def __init__(self, max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: str, ttl: int) -> None:
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def clear(self) -> None:
+        self._entries.clear()
+
+
+class RedisBackend:
+    """Cache shared by every worker/replica. Needs the optional `redis` package."""
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = "llm-cache:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("LLM_CACHE_BACKEND=redis requires the 'redis' package") from e
+        self.prefix = prefix
+        self._client = redis.from_url(url, decode_responses=True)
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self._client.get(self.prefix + key)
+
+    async def set(self, key: str, value: str, ttl: int) -> None:
+        await self._client.set(self.prefix + key, value, ex=ttl)
+
+    async def clear(self) -> None:
+        async for key in self._client.scan_iter(match=self.prefix + "*"):
+            await self._client.delete(key)
+
+
+class LLMResponseCache:
+    """
+    Caches completions for deterministic (temperature 0) LLM calls, keyed on the
+    normalized prompt, model and sampling settings.
+    """
+
+    def __init__(self, backend=None, ttl: int = LLM_CACHE_TTL_SECONDS):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    @staticmethod
+    def make_key(messages: List[dict], model: str, temperature: float, max_tokens: int, tools: Optional[List[dict]] = None) -> str:
+        normalized = []
+        for message in messages:
+            content = message.get("content") or ""
+            for pattern in VOLATILE_PATTERNS:
+                content = pattern.sub("", content)
+            normalized.append([message.get("role"), content, message.get("tool_calls"), message.get("tool_call_id")])
+        payload = json.dumps([model, temperature, max_tokens, normalized, tools or []], separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        try:
+            value = await self.backend.get(key)
+        except Exception as e:
+            # A cache outage must never fail a chat turn.
+            self.errors += 1
+            log_event("llm_cache_read_failed", error=repr(e))
+            value = None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: str, value: str) -> None:
+        if not self.enabled or value is None:
+            return
+        try:
+            await self.backend.set(key, value, self.ttl)
+        except Exception as e:
+            self.errors += 1
+            log_event("llm_cache_write_failed", error=repr(e))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        stats = {
+            "backend": type(self.backend).__name__ if self.backend else None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+        if isinstance(self.backend, InMemoryLRUBackend):
+            stats["size"] = len(self.backend)
+            stats["max_entries"] = self.backend.max_entries
+            stats["evictions"] = self.backend.evictions
+        return stats
+
+
+def create_cache_backend(name: str = LLM_CACHE_BACKEND):
+    if name == "none":
+        return None
+    if name == "redis":
+        return RedisBackend()
+    return InMemoryLRUBackend()
+
+
+llm_response_cache = LLMResponseCache(create_cache_backend())
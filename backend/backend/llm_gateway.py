@@ -0,0 +1,293 @@
+"""
+Single entry point for LLM completions.
+
+Every call goes through, in order: the circuit breaker (fail fast while the provider
+is down), single-flight coalescing (identical non-streaming requests already in
+flight share one upstream call), a concurrency semaphore and a token-bucket rate
+limiter (both bounded by LLM_QUEUE_TIMEOUT_SECONDS), and retries with exponential
+backoff and full jitter for 429s, 5xx, timeouts and connection errors.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional
+
+from .shared_state import shared_state
+from .telemetry import log_event, metrics
+
+# Per worker process; the rate limit below is shared by all workers.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+# 0 disables the rate limiter; Groq's limits depend on the account tier.
+LLM_RATE_LIMIT_PER_MINUTE = float(os.getenv("LLM_RATE_LIMIT_PER_MINUTE", "0"))
+LLM_RATE_LIMIT_BURST = int(os.getenv("LLM_RATE_LIMIT_BURST", "5"))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "15"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+LLM_RETRIES = metrics.counter("llm_gateway_retries_total", "Upstream LLM attempts that were retried.", ["reason"])
+LLM_COALESCED = metrics.counter("llm_gateway_coalesced_total", "Requests served by an identical in-flight call.")
+LLM_REJECTED = metrics.counter("llm_gateway_rejected_total", "Requests failed without calling the provider.", ["reason"])
+LLM_QUEUE_SECONDS = metrics.histogram(
+    "llm_gateway_queue_seconds", "Time waiting for a concurrency slot and a rate-limit token.")
+
+
+class LLMUnavailableError(Exception):
+    """The gateway gave up before or instead of calling the provider (overload or open circuit)."""
+
+
+class CircuitOpenError(LLMUnavailableError):
+    pass
+
+
+@lru_cache(maxsize=None)
+def retryable_errors() -> tuple:
+    # The groq SDK is imported on first use so importing the app stays cheap.
+    import groq
+    return groq.RateLimitError, groq.InternalServerError, groq.APITimeoutError, groq.APIConnectionError
+
+
+def is_overload_error(error: Exception) -> bool:
+    """True for failures that mean "busy, try again later" rather than "broken"."""
+    import groq
+    return isinstance(error, (LLMUnavailableError, groq.RateLimitError))
+
+
+class TokenBucket:
+    """Rate limit kept in the shared state backend, so every worker draws from the same bucket."""
+
+    def __init__(self, state, key: str, rate_per_second: float, capacity: int):
+        self.state = state
+        self.key = key
+        self.rate = rate_per_second
+        self.capacity = max(1, capacity)
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        # The lock makes this worker's waiters queue in arrival order instead of racing for each refill.
+        async with self._lock:
+            while True:
+                try:
+                    wait = await self.state.take_token(self.key, self.rate, self.capacity)
+                except Exception as e:
+                    # A shared-state outage must not take the chat down with it: fail open.
+                    log_event("llm_rate_limiter_unavailable", error=repr(e))
+                    return
+                if wait <= 0:
+                    return
+                await asyncio.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failed requests and rejects calls for
+    `reset_seconds`; then lets one probe through (half-open) and closes on its success.
+    """
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds: float = LLM_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = 0.0
+        self.state = self.CLOSED
+        self._probing = False
+
+    def before_call(self) -> bool:
+        """Raises while calls are rejected; True when this call is the half-open probe."""
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_seconds:
+                raise CircuitOpenError("LLM provider circuit is open")
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self._probing:
+                raise CircuitOpenError("LLM provider circuit is half-open; probe in flight")
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.state = self.CLOSED
+        self._probing = False
+
+    def abandon_probe(self) -> None:
+        """The probe ended without a verdict (queue timeout, cancellation): let the next call probe."""
+        if self.state == self.HALF_OPEN:
+            self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                log_event("llm_circuit_opened", consecutive_failures=self.failures)
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+def retry_delay(attempt: int, error: Exception, base: float = LLM_RETRY_BASE_DELAY, cap: float = LLM_RETRY_MAX_DELAY) -> float:
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(cap, float(retry_after))
+        except ValueError:
+            pass
+    # Full jitter: spreads the retries of a burst instead of re-synchronizing them.
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class _GuardedStream:
+    """Holds the concurrency slot until the stream is consumed or closed."""
+
+    def __init__(self, stream, release: Callable[[], None]):
+        self._stream = stream
+        self._release = release
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        try:
+            async for chunk in self._stream:
+                yield chunk
+        finally:
+            self._release()
+
+
+class LLMGateway:
+    def __init__(self, client_factory: Callable[[], Any], max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 rate_per_minute: float = LLM_RATE_LIMIT_PER_MINUTE, burst: int = LLM_RATE_LIMIT_BURST,
+                 queue_timeout: float = LLM_QUEUE_TIMEOUT_SECONDS, max_retries: int = LLM_MAX_RETRIES,
+                 breaker: Optional[CircuitBreaker] = None, state=None):
+        self.client_factory = client_factory
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        self.rate_per_minute = rate_per_minute
+        self.bucket = TokenBucket(state or shared_state, "llm", rate_per_minute / 60, burst) if rate_per_minute > 0 else None
+        self.in_flight = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._pending: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def request_key(kwargs: dict) -> str:
+        return hashlib.sha256(json.dumps(kwargs, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    async def create(self, **kwargs):
+        """Drop-in for client.chat.completions.create (streaming included)."""
+        try:
+            probe = self.breaker.before_call()
+        except CircuitOpenError:
+            LLM_REJECTED.inc(reason="circuit_open")
+            raise
+        if kwargs.get("stream"):
+            return await self._call(kwargs, hold_for_stream=True, probe=probe)
+
+        key = self.request_key(kwargs)
+        pending = self._pending.get(key)
+        if pending is not None:
+            LLM_COALESCED.inc()
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            result = await self._call(kwargs, probe=probe)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            # A cancelled leader (client went away) must not cancel the requests coalesced onto it.
+            future.set_exception(e if isinstance(e, Exception) else LLMUnavailableError("coalesced LLM call was cancelled"))
+            # Mark it retrieved: followers re-raise it, and with none the leader's own raise suffices.
+            future.exception()
+            raise
+        finally:
+            del self._pending[key]
+
+    async def _acquire(self) -> None:
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            LLM_REJECTED.inc(reason="queue_timeout")
+            raise LLMUnavailableError(f"no LLM slot free within {self.queue_timeout}s")
+        try:
+            if self.bucket is not None:
+                remaining = self.queue_timeout - (time.perf_counter() - start)
+                await asyncio.wait_for(self.bucket.acquire(), max(remaining, 0.001))
+        except asyncio.TimeoutError:
+            self._semaphore.release()
+            LLM_REJECTED.inc(reason="rate_limited")
+            raise LLMUnavailableError("LLM rate limit budget exhausted")
+        self.in_flight += 1
+        LLM_QUEUE_SECONDS.observe(time.perf_counter() - start)
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    async def _call(self, kwargs: dict, hold_for_stream: bool = False, probe: bool = False):
+        try:
+            return await self._attempts(kwargs, hold_for_stream)
+        finally:
+            # A probe that ends before the provider answers (queue timeout, rate limit,
+            # cancellation while queued or backing off) must not leave the breaker half-open forever.
+            if probe:
+                self.breaker.abandon_probe()
+
+    async def _attempts(self, kwargs: dict, hold_for_stream: bool):
+        attempt = 0
+        while True:
+            await self._acquire()
+            handed_off = False
+            try:
+                result = await self.client_factory().chat.completions.create(**kwargs)
+                self.breaker.record_success()
+                if hold_for_stream:
+                    handed_off = True
+                    return _GuardedStream(result, self._release)
+                return result
+            except retryable_errors() as e:
+                if attempt >= self.max_retries:
+                    self.breaker.record_failure()
+                    raise
+                error = e
+            except Exception:
+                # 4xx other than 429 is a bug in the request, not a provider outage.
+                self.breaker.record_success()
+                raise
+            finally:
+                if not handed_off:
+                    self._release()
+
+            LLM_RETRIES.inc(reason=type(error).__name__)
+            await asyncio.sleep(retry_delay(attempt, error))
+            attempt += 1
+            if self.breaker.state == CircuitBreaker.OPEN:
+                # Other requests tripped the breaker while this one was backing off.
+                raise CircuitOpenError("LLM provider circuit opened while retrying") from error
+
+    def register_metrics(self) -> None:
+        metrics.gauge("llm_gateway_in_flight", "LLM calls currently holding a concurrency slot.", lambda: self.in_flight)
+        metrics.gauge("llm_gateway_circuit_open", "1 while the circuit breaker rejects calls.",
+                      lambda: 0 if self.breaker.state == CircuitBreaker.CLOSED else 1)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "coalescing": len(self._pending),
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "rate_limit_per_minute": self.rate_per_minute or None,
+        }
@@ -1,31 +1,97 @@
-from fastapi import FastAPI, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, HTTPException, Query, status
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 from datetime import datetime
-from typing import List, Optional
+from typing import List, Optional, Set
 import os
-from dotenv import load_dotenv
 import json
+import asyncio
 
+from . import env  # noqa: F401  (loads .env once, before any settings are read)
 from . import models, schemas
-from .database import engine, get_db
-
-from groq import Groq
+from .database import engine, async_engine, AsyncSessionLocal, get_async_db, pool_stats
+from .archive import ARCHIVE_IDLE_HOURS, ConversationArchiver, compact, hot_messages, load_archived_messages
+from .history import build_history_window, estimate_tokens
+from .catalog import product_catalog, serialize_product
+from .fast_path import FastPathRouter
+from .snapshot import NOT_SOLD_STATUSES, SNAPSHOT_LOOKUPS, order_snapshot
+from .llm_cache import llm_response_cache
+from .llm_gateway import LLMGateway, is_overload_error
+from .pagination import NEXT_CURSOR_HEADER, decode_cursor, json_page
+from .persistence import MESSAGE_WRITE_BEHIND, ChatTurn, MessageWriteBehind, write_turns
+from .tools import (MAX_TOOL_ITERATIONS, ToolCallAccumulator, ToolRegistry, assistant_message,
+                    message_from_completion, parse_legacy_tool_call)
+from .user_context import UserProfile, user_context_cache, user_context_message
+from .telemetry import (LLM_CALLS, REQUEST_ID_HEADER, TelemetryMiddleware, current_request_id, log_event, metrics,
+                        record_usage, span)
+
+from .shared_state import shared_state
+from .startup import Startup, StartupStep, schema_step
 from fastapi.middleware.cors import CORSMiddleware
-
-load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env'))
+from starlette.background import BackgroundTask
 
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-if not GROQ_API_KEY:
-    raise ValueError("GROQ_API_KEY not found in .env file or environment variables")
 
-groq_client = Groq(api_key=GROQ_API_KEY)
-
-models.Base.metadata.create_all(bind=engine)
+# Created on first use (the benchmarks swap in a fake by assigning it).
+groq_client = None
+
+def get_groq_client():
+    global groq_client
+    if groq_client is None:
+        from groq import AsyncGroq
+        # Retries, backoff and concurrency limits live in the gateway, not in the SDK client.
+        groq_client = AsyncGroq(api_key=GROQ_API_KEY, max_retries=0)
+    return groq_client
+
+llm_gateway = LLMGateway(get_groq_client)
+llm_gateway.register_metrics()
+
+message_writer = MessageWriteBehind(AsyncSessionLocal)
+conversation_archiver = ConversationArchiver(AsyncSessionLocal)
+
+async def load_product_catalog() -> None:
+    async with AsyncSessionLocal() as db:
+        count = await product_catalog.refresh(db)
+    log_event("catalog_loaded", products=count)
+
+async def load_order_snapshot() -> None:
+    if await asyncio.to_thread(order_snapshot.refresh) is None:
+        log_event("snapshot_missing", root=order_snapshot.root)
+
+# Until the catalog (or snapshot) is loaded, product (or order) lookups query the database.
+startup = Startup([
+    schema_step(engine),
+    StartupStep("catalog", load_product_catalog, required=False),
+    StartupStep("snapshot", load_order_snapshot, required=False),
+])
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if not GROQ_API_KEY and groq_client is None:
+        raise ValueError("GROQ_API_KEY not found in .env file or environment variables")
+    await startup.start()
+    if MESSAGE_WRITE_BEHIND:
+        message_writer.start()
+    conversation_archiver.start()
+    order_snapshot.start()
+    yield
+    await startup.stop()
+    await conversation_archiver.stop()
+    await order_snapshot.stop()
+    # Turns still queued are written before the engine goes away.
+    await asyncio.gather(*stream_writes, return_exceptions=True)
+    await message_writer.stop()
+    await shared_state.close()
+    await async_engine.dispose()
 
 app = FastAPI(
     title="AI Conversational Agent Backend",
     description="Backend service for handling user conversations and product queries.",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 origins = [
@@ -39,74 +105,162 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, REQUEST_ID_HEADER],
 )
+# Added last so it wraps CORS too and times every request end to end.
+app.add_middleware(TelemetryMiddleware)
 
 @app.get("/")
 async def read_root():
     return {"message": "Welcome to the AI Conversational Agent API!"}
 
+# Readiness probe: 503 until the schema check and catalog load have finished.
+@app.get("/ready")
+async def read_ready():
+    return JSONResponse(startup.status(), status_code=status.HTTP_200_OK if startup.ready else status.HTTP_503_SERVICE_UNAVAILABLE)
+
+# Listing endpoints use keyset pagination: pass the X-Next-Cursor response header back as `cursor`.
+# They select exactly the response_model's columns and encode the rows with json_page
+# (no ORM objects, no per-row Pydantic validation); response_model still documents the body.
+def listing_columns(model, schema) -> list:
+    return [model.__table__.c[field] for field in schema.model_fields]
+
+USER_COLUMNS = listing_columns(models.User, schemas.User)
+USER_FIELDS = list(schemas.User.model_fields)
+CONVERSATION_SUMMARY_COLUMNS = listing_columns(models.Conversation, schemas.ConversationSummary)
+CONVERSATION_SUMMARY_FIELDS = list(schemas.ConversationSummary.model_fields)
+MESSAGE_COLUMNS = listing_columns(models.Message, schemas.Message)
+MESSAGE_FIELDS = list(schemas.Message.model_fields)
+
 @app.get("/users/", response_model=List[schemas.User])
-async def get_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    users = db.query(models.User).offset(skip).limit(limit).all()
-    return users
+async def get_users(
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_async_db),
+):
+    query = select(*USER_COLUMNS).order_by(models.User.id).limit(limit + 1)
+    after = decode_cursor(cursor, int)
+    if after:
+        query = query.where(models.User.id > after[0])
+    return await json_page(db, USER_FIELDS, query, limit, "id")
 
 # --- NEW: Get all conversations for a user ---
-@app.get("/users/{user_id}/conversations", response_model=List[schemas.Conversation])
-async def get_user_conversations(user_id: int, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+@app.get("/users/{user_id}/conversations", response_model=List[schemas.ConversationSummary])
+async def get_user_conversations(
+    user_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_async_db),
+):
+    user = await db.scalar(select(models.User.id).where(models.User.id == user_id))
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
     
-    conversations = db.query(models.Conversation).filter(models.Conversation.user_id == user_id).order_by(models.Conversation.start_time.desc()).all()
-    return conversations
+    # Summary columns only, so the (user_id, start_time, title) index covers the whole query.
+    query = (
+        select(*CONVERSATION_SUMMARY_COLUMNS)
+        .where(models.Conversation.user_id == user_id)
+        .order_by(models.Conversation.start_time.desc(), models.Conversation.id.desc())
+        .limit(limit + 1)
+    )
+    after = decode_cursor(cursor, datetime, int)
+    if after:
+        start_time, conversation_id = after
+        query = query.where(or_(
+            models.Conversation.start_time < start_time,
+            and_(models.Conversation.start_time == start_time, models.Conversation.id < conversation_id),
+        ))
+    return await json_page(db, CONVERSATION_SUMMARY_FIELDS, query, limit, "start_time", "id")
 
 # --- NEW: Get messages for a specific conversation ---
 @app.get("/conversations/{conversation_id}/messages", response_model=List[schemas.Message])
-async def get_conversation_messages(conversation_id: int, db: Session = Depends(get_db)):
-    conversation = db.query(models.Conversation).filter(models.Conversation.id == conversation_id).first()
+async def get_conversation_messages(
+    conversation_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=1000),
+    db: AsyncSession = Depends(get_async_db),
+):
+    conversation = (await db.execute(
+        select(models.Conversation.id, models.Conversation.archived_until_id).where(models.Conversation.id == conversation_id)
+    )).first()
     if not conversation:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Conversation not found")
     
-    messages = db.query(models.Message).filter(models.Message.conversation_id == conversation_id).order_by(models.Message.timestamp).all()
-    return messages
-
+    after = decode_cursor(cursor, datetime, int)
+    # Archived messages all precede the ones still in the messages table; pages can span both.
+    archived = []
+    if conversation.archived_until_id:
+        archived = [
+            tuple(getattr(msg, field) for field in MESSAGE_FIELDS)
+            for msg in await load_archived_messages(db, conversation_id)
+            if not after or (msg.timestamp, msg.id) > tuple(after)
+        ][:limit + 1]
+        if len(archived) > limit:
+            return await json_page(db, MESSAGE_FIELDS, None, limit, "timestamp", "id", head=archived)
+
+    query = (
+        select(*MESSAGE_COLUMNS)
+        .where(hot_messages(conversation_id, conversation.archived_until_id))
+        .order_by(models.Message.timestamp, models.Message.id)
+        .limit(limit + 1 - len(archived))
+    )
+    if after:
+        timestamp, message_id = after
+        query = query.where(or_(
+            models.Message.timestamp > timestamp,
+            and_(models.Message.timestamp == timestamp, models.Message.id > message_id),
+        ))
+    return await json_page(db, MESSAGE_FIELDS, query, limit, "timestamp", "id", head=archived)
+
+
+PRODUCT_SEARCH_LIMIT = 5
+
+async def get_product_details(db: AsyncSession, product_name: str = None, product_id: int = None, sku: str = None):
+    # Free-text queries go to the snapshot's vector index when there is one; no match
+    # above the relevance cut-off falls through to the catalog's keyword search.
+    snapshot = order_snapshot.catalog() if product_name and not (product_id or sku) else None
+    if snapshot is not None and snapshot.product_index is not None:
+        matches = snapshot.search_products([product_name], limit=PRODUCT_SEARCH_LIMIT)[0]
+        SNAPSHOT_LOOKUPS.inc(kind="product_search", result="hit" if matches else "miss")
+        if matches:
+            return matches
+
+    # Served from the in-memory catalog; the DB is only hit when the index isn't loaded.
+    if product_catalog.is_loaded:
+        if product_id:
+            return product_catalog.get(int(product_id))
+        if sku:
+            return product_catalog.get_by_sku(sku)
+        if product_name:
+            return product_catalog.search(product_name, limit=PRODUCT_SEARCH_LIMIT) or None
+        return None
 
-def get_product_details(db: Session, product_name: str = None, product_id: int = None):
-    query = db.query(models.Product)
+    query = select(models.Product)
     if product_id:
-        product = query.filter(models.Product.id == product_id).first()
+        product = await db.scalar(query.where(models.Product.id == product_id))
+        return serialize_product(product) if product else None
+    elif sku:
+        product = await db.scalar(query.where(models.Product.sku == sku))
+        return serialize_product(product) if product else None
     elif product_name:
-        product = query.filter(models.Product.name.ilike(f"%{product_name}%")).first()
-    else:
-        return None
-    
-    if product:
-        return {
-            "id": product.id,
-            "name": product.name,
-            "category": product.category,
-            "brand": product.brand,
-            "retail_price": float(product.retail_price),
-            "department": product.department,
-            "sku": product.sku
-        }
+        products = (await db.scalars(query.where(models.Product.name.ilike(f"%{product_name}%")).limit(PRODUCT_SEARCH_LIMIT))).all()
+        return [serialize_product(product) for product in products] or None
     return None
 
-def get_order_details(db: Session, order_id: int, user_id: int):
-    order = db.query(models.Order).filter(models.Order.order_id == order_id, models.Order.user_id == user_id).first()
-    if not order:
-        return None
+def order_details_query():
+    # Order, its items and their products come back in one LEFT OUTER JOIN instead of 1 + 1 + N queries.
+    return select(models.Order).options(
+        joinedload(models.Order.items).joinedload(models.OrderItem.product)
+    )
 
-    order_items = db.query(models.OrderItem).filter(models.OrderItem.order_id == order_id).all()
-    
+def serialize_order(order: models.Order) -> dict:
     items_summary = []
-    for item in order_items:
-        product = db.query(models.Product).filter(models.Product.id == item.product_id).first()
-        product_name = product.name if product else "Unknown Product"
+    for item in order.items:
+        product_name = item.product.name if item.product else "Unknown Product"
         items_summary.append({
             "product_name": product_name,
             "status": item.status,
-            "sale_price": float(item.sale_price)
+            "sale_price": float(item.sale_price) if item.sale_price is not None else None
         })
 
     return {
@@ -117,134 +271,546 @@ def get_order_details(db: Session, order_id: int, user_id: int):
         "items": items_summary
     }
 
-@app.post("/api/chat", response_model=schemas.ChatResponse, status_code=status.HTTP_200_OK)
-async def chat_endpoint(request: schemas.ChatRequest, db: Session = Depends(get_db)):
-    user_id = request.user_id
-    user_message_content = request.message
-    conversation_id = request.conversation_id
+async def get_order_details(db: AsyncSession, order_id: int, user_id: int):
+    # Answered from the columnar snapshot when there is one; orders placed after it was
+    # written aren't in it, so a miss still goes to the database.
+    snapshot = order_snapshot.current()
+    if snapshot is not None:
+        details = snapshot.order_details(order_id, user_id)
+        SNAPSHOT_LOOKUPS.inc(kind="order", result="hit" if details else "miss")
+        if details:
+            return details
+    order = (await db.scalars(
+        order_details_query().where(models.Order.order_id == order_id, models.Order.user_id == user_id)
+    )).unique().first()
+    if not order:
+        return None
+    return serialize_order(order)
+
+async def get_orders_details(db: AsyncSession, user_id: int, order_ids: Optional[List[int]] = None, limit: int = 10):
+    # The snapshot can only answer when it holds every order the DB would return, i.e. for a
+    # specific set of order ids that it has in full; "latest N" always reads the live tables.
+    snapshot = order_snapshot.current()
+    if snapshot is not None and order_ids:
+        orders = snapshot.user_orders(user_id, order_ids=order_ids, limit=limit)
+        found = len(orders) == min(len(set(order_ids)), limit)
+        SNAPSHOT_LOOKUPS.inc(kind="orders", result="hit" if found else "miss")
+        if found:
+            return orders
+
+    # Limit on the distinct orders first (a LIMIT on the joined query would cut off item rows).
+    # MySQL rejects LIMIT inside IN (...), so the page of keys is joined as a derived table.
+    order_keys = select(models.Order.order_id).where(models.Order.user_id == user_id)
+    if order_ids:
+        order_keys = order_keys.where(models.Order.order_id.in_(order_ids))
+    order_keys = order_keys.order_by(models.Order.created_at.desc()).limit(limit).subquery()
+
+    orders = (await db.scalars(
+        order_details_query()
+        .join(order_keys, models.Order.order_id == order_keys.c.order_id)
+        .order_by(models.Order.created_at.desc())
+    )).unique().all()
+    return [serialize_order(order) for order in orders]
+
+TOP_PRODUCTS_LIMIT = 5
+
+async def get_top_products(db: AsyncSession, category: str = None, department: str = None, limit: int = TOP_PRODUCTS_LIMIT):
+    snapshot = order_snapshot.catalog()
+    if snapshot is not None:
+        SNAPSHOT_LOOKUPS.inc(kind="top_products", result="hit")
+        return snapshot.top_products(category=category, department=department, limit=limit)
+
+    sold = or_(models.OrderItem.status.is_(None), models.OrderItem.status.notin_(NOT_SOLD_STATUSES))
+    units = func.count(models.OrderItem.id).label("units_sold")
+    revenue = func.coalesce(func.sum(models.OrderItem.sale_price), 0).label("revenue")
+    query = (
+        select(models.Product, units, revenue)
+        .join(models.OrderItem, models.OrderItem.product_id == models.Product.id)
+        .where(sold)
+        .group_by(models.Product.id)
+        .order_by(units.desc(), revenue.desc())
+        .limit(limit)
+    )
+    if category:
+        query = query.where(models.Product.category == category)
+    if department:
+        query = query.where(models.Product.department == department)
+    rows = (await db.execute(query)).all()
+    in_stock = dict((await db.execute(
+        select(models.InventoryItem.product_id, func.count())
+        .where(models.InventoryItem.product_id.in_([product.id for product, _, _ in rows]),
+               models.InventoryItem.sold_at.is_(None))
+        .group_by(models.InventoryItem.product_id)
+    )).all()) if rows else {}
+    return [
+        {
+            "id": product.id,
+            "name": product.name,
+            "category": product.category,
+            "brand": product.brand,
+            "department": product.department,
+            "retail_price": float(product.retail_price) if product.retail_price is not None else None,
+            "units_sold": units_sold,
+            "revenue": round(float(product_revenue), 2),
+            "in_stock": in_stock.get(product.id, 0),
+        }
+        for product, units_sold, product_revenue in rows
+    ]
 
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+# --- Best-selling products, optionally within a category or department ---
+@app.get("/products/top")
+async def get_top_products_endpoint(
+    category: Optional[str] = None,
+    department: Optional[str] = None,
+    limit: int = Query(TOP_PRODUCTS_LIMIT, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await get_top_products(db, category=category, department=department, limit=limit)
+
+# --- Several of a user's orders (most recent first) in one round trip ---
+@app.get("/users/{user_id}/orders", response_model=List[schemas.OrderDetails])
+async def get_user_orders(
+    user_id: int,
+    order_ids: Optional[List[int]] = Query(None),
+    limit: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db),
+):
+    user = await db.scalar(select(models.User).where(models.User.id == user_id))
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    return await get_orders_details(db, user_id, order_ids=order_ids, limit=limit)
+
+# --- Rebuild the in-memory product index after the catalog is reloaded ---
+@app.post("/admin/catalog/refresh")
+async def refresh_product_catalog(db: AsyncSession = Depends(get_async_db)):
+    count = await product_catalog.refresh(db)
+    return {"products": count, "loaded_at": datetime.fromtimestamp(product_catalog.loaded_at)}
+
+# --- Columnar snapshot version and age; refresh picks up a new CURRENT version immediately ---
+@app.get("/admin/snapshot")
+async def get_snapshot_stats():
+    return order_snapshot.stats()
+
+@app.post("/admin/snapshot/refresh")
+async def refresh_order_snapshot():
+    await asyncio.to_thread(order_snapshot.refresh)
+    return order_snapshot.stats()
+
+# --- Hit/miss counters for the classification response cache ---
+@app.get("/admin/llm-cache")
+async def get_llm_cache_stats():
+    return llm_response_cache.stats()
+
+@app.post("/admin/conversations/archive")
+async def archive_idle_conversations(idle_hours: float = Query(ARCHIVE_IDLE_HOURS, ge=0)):
+    return await compact(AsyncSessionLocal, idle_hours=idle_hours)
+
+# --- Share of chat turns answered by the rule-based fast path (no LLM call) ---
+@app.get("/admin/fast-path")
+async def get_fast_path_stats():
+    return fast_path.stats()
+
+# --- LLM gateway state: in-flight calls, circuit breaker, rate-limit tokens ---
+@app.get("/admin/llm-gateway")
+async def get_llm_gateway_stats():
+    return llm_gateway.stats()
+
+# --- Connection pool occupancy and checkout waits, for sizing workers against max_connections ---
+@app.get("/admin/db-pool")
+async def get_db_pool_stats():
+    return {"async": pool_stats(async_engine.pool), "sync": pool_stats(engine.pool)}
+
+# --- Prometheus scrape endpoint (latency histograms, token and tool counters) ---
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+tool_registry = ToolRegistry()
+
+@tool_registry.register(
+    "get_product_details",
+    "Finds products matching a description, name or category (typo tolerant), or looks one up by exact SKU or product id.",
+    {
+        "type": "object",
+        "properties": {
+            "product_name": {"type": "string", "description": "What the user is looking for, e.g. 'warm jacket for hiking', 'jeans'."},
+            "sku": {"type": "string", "description": "Exact product SKU."},
+            "product_id": {"type": "integer", "description": "Numeric product id."},
+        },
+    },
+)
+async def product_details_tool(db: AsyncSession, user_id: int, product_name: str = None, sku: str = None, product_id: int = None):
+    return await get_product_details(db, product_name=product_name, product_id=product_id, sku=sku)
+
+@tool_registry.register(
+    "get_order_details",
+    "Returns the status and items of one of the current user's orders.",
+    {
+        "type": "object",
+        "properties": {"order_id": {"type": "integer", "description": "The order id."}},
+        "required": ["order_id"],
+    },
+)
+async def order_details_tool(db: AsyncSession, user_id: int, order_id: int = None):
+    return await get_order_details(db, order_id=int(order_id), user_id=user_id)
+
+@tool_registry.register(
+    "get_top_products",
+    "Returns the best-selling products, optionally within a category or department, with units sold and stock.",
+    {
+        "type": "object",
+        "properties": {
+            "category": {"type": "string", "description": "Product category, e.g. 'Jeans', 'Tops & Tees'."},
+            "department": {"type": "string", "description": "'Men' or 'Women'."},
+            "limit": {"type": "integer", "description": "How many products to return (default 5)."},
+        },
+    },
+)
+async def top_products_tool(db: AsyncSession, user_id: int, category: str = None, department: str = None, limit: int = None):
+    return await get_top_products(db, category=category, department=department,
+                                  limit=max(1, min(int(limit or TOP_PRODUCTS_LIMIT), 20)))
+
+fast_path = FastPathRouter(tool_registry)
+
+LLM_MODEL = "llama3-8b-8192"
+# A turn waits this long for the previous turn on its conversation before answering 409.
+CONVERSATION_LOCK_WAIT_SECONDS = float(os.getenv("CONVERSATION_LOCK_WAIT_SECONDS", "30"))
+# Expiry of a shared-state lock whose worker died mid-turn; longer than any turn should take.
+CONVERSATION_LOCK_TTL_SECONDS = float(os.getenv("CONVERSATION_LOCK_TTL_SECONDS", "120"))
+FALLBACK_AI_RESPONSE = "I'm sorry, I encountered an internal issue. Please try again later."
+BUSY_AI_RESPONSE = "I'm getting a lot of requests right now. Please try again in a moment."
+
+def failure_response(error: Exception) -> str:
+    # Overload (rate limited, queue full, circuit open) is temporary; tell the user so.
+    return BUSY_AI_RESPONSE if is_overload_error(error) else FALLBACK_AI_RESPONSE
+
+# Identical for every user and turn, so it's built once and the provider can reuse the prompt
+# prefix; the user's name and today's date follow in a short second system message.
+SYSTEM_PROMPT = {"role": "system", "content": (
+    "You are an e-commerce AI assistant named Bolt. Your primary goal is to help users find products and get order statuses. "
+    "Always be polite and conversational. Follow these steps:\n"
+    "1. Analyze the user's message to determine their intent: 'product_search', 'order_status', or 'general_chat'.\n"
+    "2. If 'product_search', extract the product name or category (e.g., 't-shirt', 'laptop', 'shoes'), or the SKU if one is given.\n"
+    "3. If 'order_status', extract the Order ID.\n"
+    "4. If you need more information (e.g., product name for search, Order ID for status), ask clarifying questions.\n"
+    "5. Based on intent and extracted entities, use the provided tools (get_product_details, get_order_details, get_top_products) to fetch data. "
+    "   When the user asks about several orders or products, request all the tool calls you need at once. "
+    "   If a tool returns 'None' or empty data, inform the user you couldn't find it.\n"
+    "6. Formulate a helpful response to the user based on the retrieved data or clarifying questions."
+)}
+SYSTEM_PROMPT_TOKENS = estimate_tokens(SYSTEM_PROMPT["content"])
+
+def build_system_messages(profile: UserProfile) -> List[dict]:
+    return [SYSTEM_PROMPT, user_context_message(profile)]
+
+async def acquire_conversation_lock(conversation_id: Optional[int]):
+    """
+    Serializes turns on one conversation across all workers, so two concurrent requests
+    can't build on the same history or interleave their messages. New conversations need no lock.
+    """
+    if not conversation_id:
+        return None
+    lock = shared_state.lock(f"conversation:{conversation_id}", ttl=CONVERSATION_LOCK_TTL_SECONDS)
+    if not await lock.acquire(wait=CONVERSATION_LOCK_WAIT_SECONDS):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail="Another message in this conversation is still being answered")
+    return lock
+
+async def release_conversation_lock(lock) -> None:
+    if lock is not None:
+        await lock.release()
+
+async def prepare_chat_turn(request: schemas.ChatRequest, db: AsyncSession):
+    """
+    Validates the user/conversation and builds the LLM prompt. Nothing is written here:
+    the returned ChatTurn collects the turn's writes for persist_chat_turn.
+    """
+    user_id = request.user_id
+    user_message_content = request.message
+    conversation_id = request.conversation_id
 
-    conversation = None
-    if conversation_id:
-        conversation = db.query(models.Conversation).filter(models.Conversation.id == conversation_id, models.Conversation.user_id == user_id).first()
-        if not conversation:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Conversation not found for this user")
-    else:
-        conversation = models.Conversation(user_id=user_id)
-        db.add(conversation)
-        db.commit()
-        db.refresh(conversation)
-        print(f"Created new conversation with ID: {conversation.id}")
-
-    user_message = models.Message(
-        conversation_id=conversation.id,
-        sender="user",
-        content=user_message_content,
-        timestamp=datetime.now()
+    with span("user_lookup"):
+        user = await user_context_cache.get(db, user_id)
+        if not user:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+
+        conversation = None
+        if conversation_id:
+            conversation = await db.scalar(
+                select(models.Conversation).where(models.Conversation.id == conversation_id, models.Conversation.user_id == user_id)
+            )
+            if not conversation:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Conversation not found for this user")
+
+    turn = ChatTurn(user_id, conversation_id, user_message_content)
+    turn.reopen = conversation is not None and conversation.end_time is not None
+    system_messages = build_system_messages(user)
+    history = []
+    if conversation:
+        with span("history_load"):
+            history, turn.summary_update = await build_history_window(
+                db, conversation,
+                reserved_tokens=SYSTEM_PROMPT_TOKENS + estimate_tokens(system_messages[1]["content"])
+                + estimate_tokens(user_message_content),
+            )
+    messages_for_llm = [*system_messages, *history, {"role": "user", "content": user_message_content}]
+
+    return turn, messages_for_llm
+
+def tool_options(iteration: int) -> dict:
+    # Tools stay advertised on the last round (the history contains tool messages) but can't be called again.
+    if MAX_TOOL_ITERATIONS <= 0:
+        return {}
+    return {"tools": tool_registry.definitions(), "tool_choice": "auto" if iteration < MAX_TOOL_ITERATIONS else "none"}
+
+def pending_tool_calls(message: dict) -> List[dict]:
+    return message.get("tool_calls") or parse_legacy_tool_call(message.get("content")) or []
+
+async def run_tool_round(messages_for_llm: list, tool_calls: List[dict], user_id: int) -> None:
+    """Executes every tool call of one model response concurrently and appends the results to the prompt."""
+    messages_for_llm.append(assistant_message(None, tool_calls))
+    messages_for_llm.extend(await tool_registry.call_all(AsyncSessionLocal, tool_calls, user_id))
+
+async def persist_chat_turn(db: AsyncSession, turn: ChatTurn, ai_response_content: str) -> ChatTurn:
+    """Writes the conversation (if new), both messages and any summary update in one transaction."""
+    turn.set_ai_message(ai_response_content)
+    with span("persist", write_behind=message_writer.running):
+        if message_writer.running:
+            # Hand the pooled connection back first; the writer needs one while this request waits.
+            await db.close()
+            return await message_writer.submit(turn)
+        await write_turns(db, [turn])
+    return turn
+
+async def complete(messages_for_llm: list, temperature: float, iteration: int) -> dict:
+    chat_completion = await llm_gateway.create(
+        messages=messages_for_llm,
+        model=LLM_MODEL,
+        temperature=temperature,
+        max_tokens=250,
+        **tool_options(iteration),
     )
-    db.add(user_message)
-    db.commit()
-    db.refresh(user_message)
-
-    history_messages = db.query(models.Message).filter(
-        models.Message.conversation_id == conversation.id
-    ).order_by(models.Message.timestamp).all()
-
-    messages_for_llm = [
-        {"role": "system", "content": (
-            "You are an e-commerce AI assistant named Bolt. Your primary goal is to help users find products and get order statuses. "
-            "Always be polite and conversational. Follow these steps:\n"
-            "1. Analyze the user's message to determine their intent: 'product_search', 'order_status', or 'general_chat'.\n"
-            "2. If 'product_search', extract the product name or category (e.g., 't-shirt', 'laptop', 'shoes').\n"
-            "3. If 'order_status', extract the Order ID.\n"
-            "4. If you need more information (e.g., product name for search, Order ID for status), ask clarifying questions.\n"
-            "5. Based on intent and extracted entities, use the provided tools (e.g., get_product_details, get_order_details) to fetch data. "
-            "   If a tool returns 'None' or empty data, inform the user you couldn't find it.\n"
-            "6. Formulate a helpful response to the user based on the retrieved data or clarifying questions.\n"
-            "7. Crucially, if you need to call a tool, respond ONLY with a JSON object like this:\n"
-            "   ```json\n"
-            "   {\n"
-            "     \"tool_call\": {\n"
-            "       \"function_name\": \"get_product_details\" | \"get_order_details\",\n"
-            "       \"parameters\": {\"product_name\": \"value\"} | {\"order_id\": value, \"user_id\": value}\n"
-            "     }\n"
-            "   }\n"
-            "   ```\n"
-            "   If no tool call is needed, respond with natural language.\n"
-            f"   The current user's first name is {user.first_name}. Today's date is {datetime.now().strftime('%Y-%m-%d')}."
-        )}
-    ]
-    for msg in history_messages:
-        llm_role = msg.sender
-        if llm_role == "ai":
-            llm_role = "assistant"
-        messages_for_llm.append({"role": llm_role, "content": msg.content})
+    LLM_CALLS.inc(model=LLM_MODEL, stream="false")
+    record_usage(LLM_MODEL, getattr(chat_completion, "usage", None))
+    return message_from_completion(chat_completion.choices[0].message)
+
+def first_pass_cache_key(messages_for_llm: list) -> str:
+    return llm_response_cache.make_key(messages_for_llm, LLM_MODEL, 0.0, 250, tool_options(0).get("tools"))
+
+async def fast_path_message(request: schemas.ChatRequest) -> Optional[dict]:
+    """A templated answer standing in for the first LLM pass, for order/SKU lookups the fast path recognizes."""
+    with span("fast_path"):
+        content = await fast_path.answer(AsyncSessionLocal, request.message, request.user_id)
+    return assistant_message(content) if content is not None else None
+
+async def classify_turn(messages_for_llm: list) -> dict:
+    """First (temperature 0) completion of a turn, served from the response cache when possible."""
+    cache_key = first_pass_cache_key(messages_for_llm)
+    cached = await llm_response_cache.get(cache_key)
+    if cached is not None:
+        return json.loads(cached)
+
+    with span("llm_first"):
+        message = await complete(messages_for_llm, temperature=0.0, iteration=0)
+    await llm_response_cache.set(cache_key, json.dumps(message))
+    return message
+
+# --- Endpoint for Chat Interactions ---
+@app.post("/api/chat", response_model=schemas.ChatResponse, status_code=status.HTTP_200_OK)
+async def chat_endpoint(request: schemas.ChatRequest, db: AsyncSession = Depends(get_async_db)):
+    lock = await acquire_conversation_lock(request.conversation_id)
+    try:
+        return await run_chat_turn(request, db)
+    finally:
+        await release_conversation_lock(lock)
 
-    messages_for_llm.append({"role": "user", "content": user_message_content})
+async def run_chat_turn(request: schemas.ChatRequest, db: AsyncSession) -> schemas.ChatResponse:
+    turn, messages_for_llm = await prepare_chat_turn(request, db)
+    # Hand the connection back to the pool for the LLM calls (seconds); tools use their own
+    # short sessions and persist_chat_turn checks a connection out again for the write.
+    await db.close()
 
-    ai_response_content = "I'm sorry, I encountered an internal issue. Please try again later."
+    ai_response_content = FALLBACK_AI_RESPONSE
 
     try:
-        chat_completion = groq_client.chat.completions.create(
-            messages=messages_for_llm,
-            model="llama3-8b-8192",
-            temperature=0.0,
-            max_tokens=250,
-        )
-        llm_raw_response = chat_completion.choices[0].message.content
+        message = await fast_path_message(request) or await classify_turn(messages_for_llm)
+        tool_calls = pending_tool_calls(message)
+        iteration = 0
+        while tool_calls and iteration < MAX_TOOL_ITERATIONS:
+            await run_tool_round(messages_for_llm, tool_calls, request.user_id)
+            iteration += 1
+            with span("llm_followup", iteration=iteration):
+                message = await complete(messages_for_llm, temperature=0.7, iteration=iteration)
+            tool_calls = pending_tool_calls(message)
+        ai_response_content = message["content"] if not tool_calls and message["content"] else FALLBACK_AI_RESPONSE
 
-        try:
-            parsed_response = json.loads(llm_raw_response)
-            if "tool_call" in parsed_response:
-                tool_call = parsed_response["tool_call"]
-                function_name = tool_call["function_name"]
-                parameters = tool_call["parameters"]
-                
-                tool_output = None
-                if function_name == "get_product_details":
-                    product_name = parameters.get("product_name")
-                    product_id = parameters.get("product_id")
-                    tool_output = get_product_details(db, product_name=product_name, product_id=product_id)
-                elif function_name == "get_order_details":
-                    order_id = parameters.get("order_id")
-                    tool_output = get_order_details(db, order_id=order_id, user_id=user_id)
-                
-                messages_for_llm.append({"role": "tool", "content": json.dumps(tool_output)})
-                
-                final_chat_completion = groq_client.chat.completions.create(
-                    messages=messages_for_llm,
-                    model="llama3-8b-8192",
-                    temperature=0.7,
-                    max_tokens=250,
-                )
-                ai_response_content = final_chat_completion.choices[0].message.content
-
-            else:
-                ai_response_content = llm_raw_response
-
-        except json.JSONDecodeError:
-            ai_response_content = llm_raw_response
-            
     except Exception as e:
-        print(f"Error during LLM call or data retrieval: {e}")
-        ai_response_content = "I'm sorry, I encountered an internal issue. Please try again later."
-
-    ai_message = models.Message(
-        conversation_id=conversation.id,
-        sender="ai",
-        content=ai_response_content,
-        timestamp=datetime.now()
-    )
-    db.add(ai_message)
-    db.commit()
-    db.refresh(ai_message)
+        log_event("chat_error", request_id=current_request_id(), error=repr(e))
+        ai_response_content = failure_response(e)
+
+    await persist_chat_turn(db, turn, ai_response_content)
 
     return schemas.ChatResponse(
-        conversation_id=conversation.id,
-        user_message=user_message_content,
+        conversation_id=turn.conversation_id,
+        user_message=request.message,
         ai_response=ai_response_content,
-        message_id=ai_message.id
-    )
\ No newline at end of file
+        message_id=turn.ai_message_id
+    )
+
+# Streamed turns being saved; referenced here so a write outlives the cancelled stream that started it.
+stream_writes: Set[asyncio.Task] = set()
+
+async def persist_stream_turn(turn: ChatTurn, ai_response_content: str) -> ChatTurn:
+    """Saves a streamed turn in its own task, so a client disconnect can't cancel the write."""
+    async def write() -> ChatTurn:
+        # The stream owns its session: it outlives the request dependency.
+        async with AsyncSessionLocal() as db:
+            return await persist_chat_turn(db, turn, ai_response_content)
+
+    task = asyncio.create_task(write())
+    stream_writes.add(task)
+    task.add_done_callback(stream_writes.discard)
+    return await asyncio.shield(task)
+
+def sse_event(payload: dict) -> str:
+    return f"data: {json.dumps(payload, default=str)}\n\n"
+
+async def stream_completion(messages_for_llm: list, temperature: float, iteration: int, tool_calls: ToolCallAccumulator):
+    """Yields content deltas; streamed tool-call fragments are collected into `tool_calls`."""
+    stream = await llm_gateway.create(
+        messages=messages_for_llm,
+        model=LLM_MODEL,
+        temperature=temperature,
+        max_tokens=250,
+        stream=True,
+        **tool_options(iteration),
+    )
+    LLM_CALLS.inc(model=LLM_MODEL, stream="true")
+    async for chunk in stream:
+        # Groq reports usage on the final chunk under x_groq; OpenAI-style APIs use chunk.usage.
+        usage = getattr(chunk, "usage", None) or getattr(getattr(chunk, "x_groq", None), "usage", None)
+        if usage is not None:
+            record_usage(LLM_MODEL, usage)
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+        tool_calls.add(getattr(delta, "tool_calls", None))
+        if delta.content:
+            yield delta.content
+
+async def span_stream(stage: str, deltas, **attributes):
+    # The span covers the whole stream (first token to last), not just the request.
+    with span(stage, **attributes):
+        async for delta in deltas:
+            yield delta
+
+async def single_chunk(content: str):
+    yield content
+
+def looks_like_tool_call(prefix: str) -> bool:
+    stripped = prefix.lstrip()
+    return stripped.startswith("{") or stripped.startswith("```")
+
+# --- Streaming variant of /api/chat (Server-Sent Events) ---
+@app.post("/api/chat/stream", status_code=status.HTTP_200_OK)
+async def chat_stream_endpoint(request: schemas.ChatRequest, db: AsyncSession = Depends(get_async_db)):
+    lock = await acquire_conversation_lock(request.conversation_id)
+    try:
+        turn, messages_for_llm = await prepare_chat_turn(request, db)
+    except BaseException:
+        await release_conversation_lock(lock)
+        raise
+    # End the read transaction so the request's connection isn't held for the whole stream.
+    await db.close()
+
+    async def event_stream():
+        try:
+            async for event in turn_events():
+                yield event
+        finally:
+            await release_conversation_lock(lock)
+
+    async def turn_events():
+        ai_response_content = ""
+        try:
+            # conversation_id is null for a new conversation until the turn is saved (see the end event).
+            yield sse_event({"type": "start", "conversation_id": turn.conversation_id})
+            try:
+                # Plain answers are forwarded token by token; anything that starts like the legacy JSON
+                # tool-call envelope is buffered until complete so it never reaches the client.
+                # A fast-path answer is replayed like a cached first pass (and isn't cached itself).
+                cache_key = first_pass_cache_key(messages_for_llm)
+                cached = await fast_path_message(request)
+                if cached is None:
+                    cached = await llm_response_cache.get(cache_key)
+                    cached = json.loads(cached) if cached is not None else None
+                accumulator = ToolCallAccumulator()
+                if cached is not None:
+                    first_pass = single_chunk(cached["content"] or "")
+                else:
+                    first_pass = span_stream("llm_first", stream_completion(messages_for_llm, temperature=0.0, iteration=0, tool_calls=accumulator))
+
+                buffered = ""
+                streaming_text = False
+                async for delta in first_pass:
+                    if streaming_text:
+                        ai_response_content += delta
+                        yield sse_event({"type": "token", "content": delta})
+                        continue
+                    buffered += delta
+                    if buffered.strip() and not looks_like_tool_call(buffered):
+                        streaming_text = True
+                        ai_response_content = buffered
+                        yield sse_event({"type": "token", "content": buffered})
+
+                if cached is None:
+                    tool_calls = accumulator.tool_calls()
+                    content = ai_response_content if streaming_text else buffered
+                    await llm_response_cache.set(cache_key, json.dumps(assistant_message(content or None, tool_calls)))
+                else:
+                    tool_calls = cached.get("tool_calls") or []
+                if not tool_calls and not streaming_text:
+                    tool_calls = parse_legacy_tool_call(buffered) or []
+
+                iteration = 0
+                while tool_calls and iteration < MAX_TOOL_ITERATIONS:
+                    await run_tool_round(messages_for_llm, tool_calls, request.user_id)
+                    iteration += 1
+                    accumulator = ToolCallAccumulator()
+                    followup = stream_completion(messages_for_llm, temperature=0.7, iteration=iteration, tool_calls=accumulator)
+                    async for delta in span_stream("llm_followup", followup, iteration=iteration):
+                        ai_response_content += delta
+                        yield sse_event({"type": "token", "content": delta})
+                    tool_calls = accumulator.tool_calls()
+
+                if iteration == 0 and not streaming_text:
+                    ai_response_content = buffered
+                    if buffered:
+                        yield sse_event({"type": "token", "content": buffered})
+                if not ai_response_content:
+                    ai_response_content = FALLBACK_AI_RESPONSE
+                    yield sse_event({"type": "token", "content": ai_response_content})
+
+            except Exception as e:
+                log_event("chat_error", request_id=current_request_id(), error=repr(e))
+                ai_response_content = failure_response(e)
+                yield sse_event({"type": "error", "content": ai_response_content})
+        finally:
+            # Also runs when the client disconnects and the stream is cancelled: the user
+            # message and whatever was streamed so far are still saved.
+            await persist_stream_turn(turn, ai_response_content or FALLBACK_AI_RESPONSE)
+
+        yield sse_event({
+            "type": "end",
+            "conversation_id": turn.conversation_id,
+            "message_id": turn.ai_message_id,
+            "ai_response": ai_response_content,
+        })
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Also covers a client that disconnects before the stream starts (release is idempotent).
+        background=BackgroundTask(release_conversation_lock, lock),
+    )
@@ -0,0 +1,205 @@
+"""
+Versioned schema migrations for the chat/e-commerce database.
+
+Each migration runs once, in order, and is recorded in `schema_migrations`.
+Migrations are idempotent against databases created from data/database_creation.txt
+(tables, columns and indexes are only added when missing), so an existing MySQL
+instance can be brought up to date in place.
+
+    python -m backend.backend.migrations status
+    python -m backend.backend.migrations upgrade
+"""
+import sys
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, List, NamedTuple, Sequence, Tuple
+
+from sqlalchemy import Index, MetaData, Table, inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+from .telemetry import log_event
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    upgrade: Callable[[Connection], None]
+
+
+# Indexes the hot paths rely on: table -> column prefixes that some index must start with.
+REQUIRED_INDEXES: Dict[str, List[Tuple[str, ...]]] = {
+    "conversations": [("user_id", "start_time")],
+    "messages": [("conversation_id", "timestamp")],
+    "orders": [("user_id", "created_at")],
+    "order_items": [("order_id",)],
+}
+
+
+def _columns(conn: Connection, table: str) -> List[str]:
+    return [column["name"] for column in inspect(conn).get_columns(table)]
+
+
+def _index_column_lists(conn: Connection, table: str) -> List[List[str]]:
+    inspector = inspect(conn)
+    column_lists = [index["column_names"] for index in inspector.get_indexes(table)]
+    column_lists.append(inspector.get_pk_constraint(table)["constrained_columns"])
+    return column_lists
+
+
+def has_index_prefix(conn: Connection, table: str, columns: Sequence[str]) -> bool:
+    columns = list(columns)
+    return any(existing[:len(columns)] == columns for existing in _index_column_lists(conn, table))
+
+
+def add_column_if_missing(conn: Connection, table: str, column: str, ddl_type: str) -> None:
+    if column not in _columns(conn, table):
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"))
+
+
+def create_index_if_missing(conn: Connection, table: str, name: str, columns: Sequence[str]) -> None:
+    # Matching on the column prefix also accepts equivalent indexes MySQL created for FKs.
+    if has_index_prefix(conn, table, columns):
+        return
+    reflected = Table(table, MetaData(), autoload_with=conn)
+    Index(name, *(reflected.c[column] for column in columns)).create(conn)
+
+
+def _0001_baseline(conn: Connection) -> None:
+    # Imported here so the migration set can run without importing the app.
+    from . import models
+    models.Base.metadata.create_all(bind=conn, checkfirst=True)
+
+
+def _0002_conversation_summary(conn: Connection) -> None:
+    add_column_if_missing(conn, "conversations", "summary", "TEXT NULL")
+    add_column_if_missing(conn, "conversations", "summarized_until_id", "INTEGER NULL")
+
+
+def _0003_hot_path_indexes(conn: Connection) -> None:
+    # Sidebar listing: WHERE user_id = ? ORDER BY start_time DESC; title makes it index-only.
+    create_index_if_missing(conn, "conversations", "ix_conversations_user_id_start_time", ["user_id", "start_time", "title"])
+    # History window and transcript: WHERE conversation_id = ? ORDER BY timestamp.
+    create_index_if_missing(conn, "messages", "ix_messages_conversation_id_timestamp", ["conversation_id", "timestamp"])
+    # Order lookups by (order_id, user_id) are served by the PK; a user's recent orders need this one.
+    create_index_if_missing(conn, "orders", "ix_orders_user_id_created_at", ["user_id", "created_at"])
+    create_index_if_missing(conn, "order_items", "ix_order_items_order_id", ["order_id"])
+
+
+def _0004_conversation_archive(conn: Connection) -> None:
+    from . import models
+    add_column_if_missing(conn, "conversations", "archived_until_id", "INTEGER NULL")
+    models.ConversationArchive.__table__.create(bind=conn, checkfirst=True)
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "baseline tables", _0001_baseline),
+    Migration(2, "conversation rolling summary columns", _0002_conversation_summary),
+    Migration(3, "composite indexes for chat and order hot paths", _0003_hot_path_indexes),
+    Migration(4, "compressed archive for idle conversations", _0004_conversation_archive),
+]
+
+
+def _ensure_version_table(conn: Connection) -> None:
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        " version INTEGER PRIMARY KEY,"
+        " description VARCHAR(255) NOT NULL,"
+        " applied_at DATETIME NOT NULL)"
+    ))
+
+
+def applied_versions(conn: Connection) -> List[int]:
+    if not inspect(conn).has_table("schema_migrations"):
+        return []
+    return [row[0] for row in conn.execute(text("SELECT version FROM schema_migrations ORDER BY version"))]
+
+
+def pending_migrations(engine: Engine) -> List[Migration]:
+    with engine.connect() as conn:
+        applied = set(applied_versions(conn))
+    return [migration for migration in MIGRATIONS if migration.version not in applied]
+
+
+@contextmanager
+def migration_lock(engine: Engine, timeout: int = 300):
+    """
+    Serializes upgrades across processes (every worker migrates at startup). MySQL
+    only: a named lock held by a dedicated connection; SQLite serializes writers itself.
+    """
+    if engine.dialect.name != "mysql":
+        yield
+        return
+    with engine.connect() as conn:
+        if conn.execute(text("SELECT GET_LOCK('schema_migrations', :t)"), {"t": timeout}).scalar() != 1:
+            raise RuntimeError(f"Timed out after {timeout}s waiting for another process to finish migrating")
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT RELEASE_LOCK('schema_migrations')"))
+
+
+def upgrade(engine: Engine) -> List[int]:
+    """Applies pending migrations in order, each in its own transaction."""
+    applied = []
+    with migration_lock(engine):
+        with engine.begin() as conn:
+            _ensure_version_table(conn)
+        for migration in pending_migrations(engine):
+            with engine.begin() as conn:
+                migration.upgrade(conn)
+                conn.execute(
+                    text("INSERT INTO schema_migrations (version, description, applied_at) VALUES (:v, :d, :t)"),
+                    {"v": migration.version, "d": migration.description, "t": datetime.now()},
+                )
+            log_event("migration_applied", version=migration.version, description=migration.description)
+            applied.append(migration.version)
+    return applied
+
+
+def missing_required_indexes(conn: Connection) -> List[str]:
+    inspector = inspect(conn)
+    missing = []
+    for table, prefixes in REQUIRED_INDEXES.items():
+        if not inspector.has_table(table):
+            missing.append(f"{table} (table missing)")
+            continue
+        for columns in prefixes:
+            if not has_index_prefix(conn, table, columns):
+                missing.append(f"{table}({', '.join(columns)})")
+    return missing
+
+
+def verify_required_indexes(engine: Engine) -> None:
+    """Raises at startup if a hot-path index is missing, instead of surfacing as slow queries."""
+    with engine.connect() as conn:
+        missing = missing_required_indexes(conn)
+    if missing:
+        raise RuntimeError(
+            "Required database indexes are missing: " + "; ".join(missing)
+            + ". Run `python -m backend.backend.migrations upgrade`."
+        )
+
+
+def main(argv: List[str]) -> int:
+    from .database import engine
+
+    command = argv[0] if argv else "status"
+    if command == "upgrade":
+        applied = upgrade(engine)
+        print(f"{len(applied)} migration(s) applied.")
+    elif command == "status":
+        pending = pending_migrations(engine)
+        for migration in MIGRATIONS:
+            state = "pending" if migration in pending else "applied"
+            print(f"{migration.version:04d} {state:8} {migration.description}")
+        with engine.connect() as conn:
+            missing = missing_required_indexes(conn)
+        print("Missing required indexes: " + ("; ".join(missing) if missing else "none"))
+    else:
+        print(f"Unknown command: {command} (expected 'status' or 'upgrade')")
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
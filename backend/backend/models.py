@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, DateTime, Enum, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, DateTime, Enum, ForeignKey, Text, Numeric, Index, LargeBinary
+from sqlalchemy.dialects.mysql import LONGBLOB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
@@ -17,27 +18,40 @@ class User(Base):
     postal_code = Column(String(50))
     city = Column(String(255))
     country = Column(String(255))
-    latitude = Column(String(10,8))
-    longitude = Column(String(11,8))
+    latitude = Column(Numeric(10, 8))
+    longitude = Column(Numeric(11, 8))
     traffic_source = Column(String(255))
     created_at = Column(DateTime)
 
     conversations = relationship("Conversation", back_populates="user")
+    orders = relationship("Order", back_populates="user")
 
 class Conversation(Base):
     __tablename__ = "conversations"
+    __table_args__ = (
+        # Covers the sidebar listing (summary columns, newest first) without touching the table rows.
+        Index("ix_conversations_user_id_start_time", "user_id", "start_time", "title"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     start_time = Column(DateTime, default=func.now())
     end_time = Column(DateTime, nullable=True)
     title = Column(String(255), nullable=True)
+    # Rolling summary of messages that have aged out of the LLM history window.
+    summary = Column(Text, nullable=True)
+    summarized_until_id = Column(Integer, nullable=True)
+    # Messages with ids up to this one live in conversation_archives, not in messages.
+    archived_until_id = Column(Integer, nullable=True)
 
     user = relationship("User", back_populates="conversations")
     messages = relationship("Message", back_populates="conversation")
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        Index("ix_messages_conversation_id_timestamp", "conversation_id", "timestamp"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     conversation_id = Column(Integer, ForeignKey("conversations.id"))
@@ -45,4 +59,86 @@ class Message(Base):
     content = Column(Text, nullable=False)
     timestamp = Column(DateTime, default=func.now())
 
-    conversation = relationship("Conversation", back_populates="messages")
\ No newline at end of file
+    conversation = relationship("Conversation", back_populates="messages")
+
+class ConversationArchive(Base):
+    """Compacted messages of an idle conversation: one compressed blob instead of a row per message."""
+    __tablename__ = "conversation_archives"
+
+    conversation_id = Column(Integer, ForeignKey("conversations.id"), primary_key=True)
+    codec = Column(String(16), nullable=False)
+    message_count = Column(Integer, nullable=False)
+    last_message_id = Column(Integer, nullable=False)
+    payload = Column(LargeBinary().with_variant(LONGBLOB, "mysql"), nullable=False)
+    archived_at = Column(DateTime, nullable=False)
+
+class Product(Base):
+    __tablename__ = "products"
+
+    id = Column(Integer, primary_key=True, index=True)
+    cost = Column(Numeric(10, 4))
+    category = Column(String(255))
+    name = Column(String(255))
+    brand = Column(String(255))
+    retail_price = Column(Numeric(10, 4))
+    department = Column(String(255))
+    sku = Column(String(255))
+    distribution_center_id = Column(Integer)
+
+class InventoryItem(Base):
+    __tablename__ = "inventory_items"
+
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"))
+    created_at = Column(DateTime)
+    sold_at = Column(DateTime, nullable=True)
+    cost = Column(Numeric(10, 4))
+    product_category = Column(String(255))
+    product_name = Column(String(255))
+    product_brand = Column(String(255))
+    product_retail_price = Column(Numeric(10, 4))
+    product_department = Column(String(255))
+    product_sku = Column(String(255))
+    product_distribution_center_id = Column(Integer)
+
+    product = relationship("Product")
+
+class Order(Base):
+    __tablename__ = "orders"
+    __table_args__ = (
+        Index("ix_orders_user_id_created_at", "user_id", "created_at"),
+    )
+
+    order_id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    status = Column(String(50))
+    gender = Column(String(1))
+    created_at = Column(DateTime)
+    returned_at = Column(DateTime, nullable=True)
+    shipped_at = Column(DateTime, nullable=True)
+    delivered_at = Column(DateTime, nullable=True)
+    num_of_item = Column(Integer)
+
+    user = relationship("User", back_populates="orders")
+    items = relationship("OrderItem", back_populates="order")
+
+class OrderItem(Base):
+    __tablename__ = "order_items"
+    __table_args__ = (
+        Index("ix_order_items_order_id", "order_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    order_id = Column(Integer, ForeignKey("orders.order_id"))
+    user_id = Column(Integer, ForeignKey("users.id"))
+    product_id = Column(Integer, ForeignKey("products.id"))
+    inventory_item_id = Column(Integer, ForeignKey("inventory_items.id"))
+    status = Column(String(50))
+    created_at = Column(DateTime)
+    shipped_at = Column(DateTime, nullable=True)
+    delivered_at = Column(DateTime, nullable=True)
+    returned_at = Column(DateTime, nullable=True)
+    sale_price = Column(Numeric(10, 4))
+
+    order = relationship("Order", back_populates="items")
+    product = relationship("Product")
@@ -0,0 +1,179 @@
+import asyncio
+import os
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from . import models
+from .telemetry import current_request_id, log_event
+
+# Group-commit message writes from concurrent requests (one transaction per batch).
+MESSAGE_WRITE_BEHIND = os.getenv("MESSAGE_WRITE_BEHIND", "false").lower() == "true"
+WRITE_BEHIND_MAX_BATCH = int(os.getenv("WRITE_BEHIND_MAX_BATCH", "200"))
+WRITE_BEHIND_MAX_DELAY_MS = int(os.getenv("WRITE_BEHIND_MAX_DELAY_MS", "20"))
+
+
+class ChatTurn:
+    """Everything one chat turn writes, collected so it can be persisted in a single transaction."""
+
+    def __init__(self, user_id: int, conversation_id: Optional[int], user_message: str):
+        self.user_id = user_id
+        self.conversation_id = conversation_id
+        self.user_message = user_message
+        self.user_timestamp = datetime.now()
+        self.summary_update: Optional[Tuple[str, int]] = None
+        # Set when the turn continues an archived (ended) conversation.
+        self.reopen = False
+        self.ai_message: Optional[str] = None
+        self.ai_timestamp: Optional[datetime] = None
+        self.ai_message_id: Optional[int] = None
+
+    @property
+    def is_new_conversation(self) -> bool:
+        return self.conversation_id is None
+
+    def set_ai_message(self, content: str) -> None:
+        self.ai_message = content
+        self.ai_timestamp = datetime.now()
+
+
+async def write_turns(db: AsyncSession, turns: List[ChatTurn]) -> None:
+    """
+    Inserts the conversations and messages of `turns` and commits once. Generated ids
+    are read back from the flush and stored on each turn; no refresh round trips.
+    """
+    pending = []
+    for turn in turns:
+        messages = [
+            models.Message(sender="user", content=turn.user_message, timestamp=turn.user_timestamp),
+            models.Message(sender="ai", content=turn.ai_message, timestamp=turn.ai_timestamp),
+        ]
+        conversation = None
+        if turn.is_new_conversation:
+            conversation = models.Conversation(user_id=turn.user_id, messages=messages)
+            db.add(conversation)
+        else:
+            for message in messages:
+                message.conversation_id = turn.conversation_id
+            db.add_all(messages)
+            values = {}
+            if turn.summary_update:
+                values["summary"], values["summarized_until_id"] = turn.summary_update
+            if turn.reopen:
+                values["end_time"] = None
+            if values:
+                await db.execute(
+                    update(models.Conversation)
+                    .where(models.Conversation.id == turn.conversation_id)
+                    .values(**values)
+                )
+        pending.append((turn, conversation, messages))
+
+    await db.flush()
+    ids = [(conversation.id if conversation is not None else turn.conversation_id, messages[1].id)
+           for turn, conversation, messages in pending]
+    await db.commit()
+
+    # Ids are only handed out once the transaction is durable, so a failed batch can be retried.
+    for (turn, conversation, _), (conversation_id, ai_message_id) in zip(pending, ids):
+        if conversation is not None:
+            log_event("conversation_created", request_id=current_request_id(), conversation_id=conversation_id,
+                      user_id=turn.user_id)
+        turn.conversation_id = conversation_id
+        turn.ai_message_id = ai_message_id
+
+
+class MessageWriteBehind:
+    """
+    Background group-commit queue for chat turns. Requests still await their own
+    write, so ids and durability are unchanged, but turns arriving within
+    WRITE_BEHIND_MAX_DELAY_MS share one transaction (and one fsync).
+    """
+
+    def __init__(self, session_factory: async_sessionmaker, max_batch: int = WRITE_BEHIND_MAX_BATCH,
+                 max_delay_ms: int = WRITE_BEHIND_MAX_DELAY_MS):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self.batches_written = 0
+        self.turns_written = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def submit(self, turn: ChatTurn) -> ChatTurn:
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((turn, future))
+        await future
+        return turn
+
+    async def stop(self) -> None:
+        """Flushes everything still queued, then stops the writer."""
+        if not self.running:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._write(batch)
+
+        # Anything queued behind the stop marker is still written before shutdown completes.
+        leftovers = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                leftovers.append(item)
+        if leftovers:
+            await self._write(leftovers)
+
+    async def _write(self, batch) -> None:
+        turns = [turn for turn, _ in batch]
+        try:
+            async with self.session_factory() as db:
+                await write_turns(db, turns)
+        except Exception as e:
+            log_event("write_behind_failed", turns=len(batch), error=repr(e))
+            if len(batch) > 1:
+                # Retry one by one so a single bad turn doesn't fail the whole batch.
+                for item in batch:
+                    await self._write([item])
+                return
+            _, future = batch[0]
+            if not future.done():
+                future.set_exception(e)
+            return
+        self.batches_written += 1
+        self.turns_written += len(batch)
+        for _, future in batch:
+            if not future.done():
+                future.set_result(None)
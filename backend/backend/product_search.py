@@ -0,0 +1,89 @@
+"""
+Query side of the product vector index built by data/product_embeddings.py.
+
+Queries are hashed exactly like the product text was (hashed TF-IDF; see FEATURIZER),
+scored against the k-means centroids, and then against the rows of the
+PRODUCT_SEARCH_NPROBE closest lists only. Several queries are scored together as one
+matrix product over the union of their lists.
+
+The featurizer is duplicated here so the backend doesn't import the offline builder;
+backend/tests/test_product_featurizer.py fails when the two sides disagree.
+"""
+import hashlib
+import os
+from functools import lru_cache
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from .catalog import tokenize
+
+FEATURIZER = "hashed-tfidf-v1"
+TRIGRAM_WEIGHT = 0.5
+STOPWORDS = frozenset("a an and for in of on or the to with".split())
+
+PRODUCT_SEARCH_NPROBE = int(os.getenv("PRODUCT_SEARCH_NPROBE", "8"))
+# Cosine similarity below which a product isn't returned at all.
+PRODUCT_SEARCH_MIN_SCORE = float(os.getenv("PRODUCT_SEARCH_MIN_SCORE", "0.1"))
+
+
+@lru_cache(maxsize=65536)
+def token_features(token: str, dim: int) -> Tuple[Tuple[int, float], ...]:
+    padded = f" {token} "
+    features = [("w:" + token, 1.0)] + [("c:" + padded[i:i + 3], TRIGRAM_WEIGHT) for i in range(len(padded) - 2)]
+    hashed = []
+    for feature, weight in features:
+        value = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+        hashed.append((value % dim, weight if value >> 63 == 0 else -weight))
+    return tuple(hashed)
+
+
+class ProductVectorIndex:
+    def __init__(self, path: str, spec: Dict):
+        if spec.get("featurizer") != FEATURIZER:
+            raise ValueError(f"Unsupported product index featurizer {spec.get('featurizer')!r}")
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r", allow_pickle=False)
+            for name in ("vectors", "product_ids", "centroids", "list_offsets", "idf")
+        }
+        self.vectors = arrays["vectors"]
+        self.product_ids = arrays["product_ids"]
+        # Small and touched by every query, so these are read into memory.
+        self.centroids = np.array(arrays["centroids"])
+        self.offsets = np.array(arrays["list_offsets"])
+        self.idf = np.array(arrays["idf"])
+        self.dim = spec["dim"]
+
+    def embed(self, queries: Sequence[str]) -> np.ndarray:
+        matrix = np.zeros((len(queries), self.dim), dtype=np.float32)
+        for row, query in enumerate(queries):
+            for token in tokenize(query):
+                if token in STOPWORDS or token.isdigit():
+                    continue
+                for bucket, weight in token_features(token, self.dim):
+                    matrix[row, bucket] += weight
+        matrix *= self.idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+    def search(self, queries: Sequence[str], limit: int = 5, nprobe: int = PRODUCT_SEARCH_NPROBE,
+               min_score: float = PRODUCT_SEARCH_MIN_SCORE) -> List[List[Tuple[int, float]]]:
+        """(product id, cosine score) of the best `limit` matches for each query, best first."""
+        if not queries or self.vectors.shape[0] == 0:
+            return [[] for _ in queries]
+        embedded = self.embed(queries)
+        lists = len(self.offsets) - 1
+        probed = np.argpartition(-(embedded @ self.centroids.T), min(nprobe, lists) - 1, axis=1)[:, :nprobe]
+        rows = np.concatenate([np.arange(self.offsets[i], self.offsets[i + 1]) for i in np.unique(probed)])
+        scores = np.asarray(self.vectors[rows]) @ embedded.T
+
+        results = []
+        for column in range(len(queries)):
+            column_scores = scores[:, column]
+            top = np.argpartition(-column_scores, min(limit, len(rows)) - 1)[:limit] if len(rows) > limit else np.arange(len(rows))
+            top = top[np.argsort(-column_scores[top], kind="stable")]
+            results.append([
+                (int(self.product_ids[rows[i]]), float(column_scores[i]))
+                for i in top if column_scores[i] >= min_score
+            ])
+        return results
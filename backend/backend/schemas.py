@@ -77,4 +77,17 @@ class ChatResponse(BaseModel):
     conversation_id: int
     user_message: str
     ai_response: str
-    message_id: int
\ No newline at end of file
+    message_id: int
+
+# --- Order details returned by get_order_details and the batched orders endpoint ---
+class OrderItemSummary(BaseModel):
+    product_name: str
+    status: Optional[str] = None
+    sale_price: Optional[float] = None
+
+class OrderDetails(BaseModel):
+    order_id: int
+    status: Optional[str] = None
+    num_of_item: Optional[int] = None
+    created_at: Optional[datetime] = None
+    items: List[OrderItemSummary] = []
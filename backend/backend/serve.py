@@ -0,0 +1,53 @@
+"""
+Production entry point: one uvicorn worker process per core.
+
+    python -m backend.backend.serve
+
+WEB_CONCURRENCY overrides the worker count (the variable uvicorn and gunicorn
+also use). Each worker has its own connection pools, so (DB_POOL_SIZE +
+DB_MAX_OVERFLOW) * workers must fit in MySQL's max_connections. Caches, rate
+limits and conversation locks are only shared across workers with
+SHARED_STATE_BACKEND=redis, so the in-memory backend always runs one worker.
+"""
+import os
+
+from . import env  # noqa: F401
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+
+
+def worker_count() -> int:
+    configured = os.getenv("WEB_CONCURRENCY")
+    if configured:
+        return max(1, int(configured))
+    # Respect CPU quotas/affinity (containers), not just the host's core count.
+    try:
+        return max(1, len(os.sched_getaffinity(0)))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def main() -> None:
+    import uvicorn
+
+    from .shared_state import SHARED_STATE_BACKEND
+
+    workers = worker_count()
+    # Per-process state can't serialize a conversation's turns across workers.
+    if workers > 1 and SHARED_STATE_BACKEND == "memory":
+        print(f"SHARED_STATE_BACKEND=memory: starting 1 worker instead of {workers}. "
+              "Set SHARED_STATE_BACKEND=redis to run one per core.")
+        workers = 1
+    uvicorn.run(
+        "backend.backend.main:app",
+        host=HOST,
+        port=PORT,
+        workers=workers,
+        proxy_headers=True,
+        timeout_graceful_shutdown=30,
+    )
+
+
+if __name__ == "__main__":
+    main()
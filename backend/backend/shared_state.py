@@ -0,0 +1,174 @@
+"""
+State that has to be shared by every worker process (and replica): rate-limit
+buckets, locks and small cached values.
+
+SHARED_STATE_BACKEND=memory keeps it in the process, which is correct for a single
+worker and is the stand-in for tests; SHARED_STATE_BACKEND=redis shares it through
+REDIS_URL and is what multi-worker deployments (see serve.py) should use.
+"""
+import asyncio
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+from . import env  # noqa: F401
+
+SHARED_STATE_BACKEND = os.getenv("SHARED_STATE_BACKEND", "memory")  # memory | redis
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+class InMemoryLock:
+    def __init__(self, state: "InMemorySharedState", key: str):
+        self.state = state
+        self.key = key
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def acquire(self, wait: float) -> bool:
+        # Holders and waiters are counted so the last one out can drop the lock object.
+        lock, users = self.state._locks.get(self.key) or (asyncio.Lock(), 0)
+        self.state._locks[self.key] = (lock, users + 1)
+        try:
+            if wait > 0:
+                await asyncio.wait_for(lock.acquire(), wait)
+            elif lock.locked():
+                raise asyncio.TimeoutError
+            else:
+                await lock.acquire()
+        except BaseException as e:
+            self._forget()
+            if isinstance(e, asyncio.TimeoutError):
+                return False
+            raise
+        self._lock = lock
+        return True
+
+    async def release(self) -> None:
+        if self._lock is not None:
+            self._lock.release()
+            self._lock = None
+            self._forget()
+
+    def _forget(self) -> None:
+        lock, users = self.state._locks[self.key]
+        if users <= 1:
+            del self.state._locks[self.key]
+        else:
+            self.state._locks[self.key] = (lock, users - 1)
+
+
+class InMemorySharedState:
+    """Per-process implementation; lock TTLs are not needed since a crashed holder takes the process with it."""
+
+    def __init__(self):
+        self._values: Dict[str, Tuple[float, str]] = {}
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._locks: Dict[str, Tuple[asyncio.Lock, int]] = {}
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._values.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._values[key]
+            return None
+        return entry[1]
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        self._values[key] = (time.monotonic() + ttl, value)
+
+    async def delete(self, key: str) -> None:
+        self._values.pop(key, None)
+
+    async def take_token(self, key: str, rate: float, capacity: int) -> float:
+        """Takes one token from the bucket; returns 0, or the seconds until one is available."""
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (float(capacity), now))
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        return wait
+
+    def lock(self, key: str, ttl: float) -> InMemoryLock:
+        return InMemoryLock(self, key)
+
+    async def close(self) -> None:
+        pass
+
+
+# Refill and take in one round trip; Redis' clock is used so workers on different hosts agree.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisLock:
+    def __init__(self, lock):
+        self._lock = lock
+
+    async def acquire(self, wait: float) -> bool:
+        return await self._lock.acquire(blocking=wait > 0, blocking_timeout=wait if wait > 0 else None)
+
+    async def release(self) -> None:
+        from redis.exceptions import LockError
+        try:
+            await self._lock.release()
+        except LockError:
+            # Held past its TTL and already expired; nothing left to release.
+            pass
+
+
+class RedisSharedState:
+    """Needs the optional `redis` package."""
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = "agent:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("SHARED_STATE_BACKEND=redis requires the 'redis' package") from e
+        self.prefix = prefix
+        self._client = redis.from_url(url, decode_responses=True)
+        self._take_token = self._client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self._client.get(self.prefix + key)
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        await self._client.set(self.prefix + key, value, px=int(ttl * 1000))
+
+    async def delete(self, key: str) -> None:
+        await self._client.delete(self.prefix + key)
+
+    async def take_token(self, key: str, rate: float, capacity: int) -> float:
+        return float(await self._take_token(keys=[self.prefix + "bucket:" + key], args=[rate, capacity]))
+
+    def lock(self, key: str, ttl: float) -> RedisLock:
+        # The TTL frees the lock if the holding worker dies mid-request.
+        return RedisLock(self._client.lock(self.prefix + "lock:" + key, timeout=ttl))
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+def create_shared_state(name: str = SHARED_STATE_BACKEND):
+    if name == "redis":
+        return RedisSharedState()
+    return InMemorySharedState()
+
+
+shared_state = create_shared_state()
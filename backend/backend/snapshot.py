@@ -0,0 +1,331 @@
+"""
+Read side of the columnar snapshot written by data/columnar_snapshot.py.
+
+Column files are memory-mapped, so every worker shares one copy through the page
+cache and only the pages a lookup touches are read. Lookups are binary searches
+over the sorted key columns and aggregations are single vectorized passes
+(bincount) instead of SQL round trips. A background task re-checks the CURRENT
+pointer every SNAPSHOT_CHECK_INTERVAL_SECONDS (file reads stay off the event loop)
+and a new version is swapped in with one attribute assignment. Callers fall back to
+MySQL, or the catalog, while no usable snapshot exists: none loaded, an empty one,
+or one older than its max age.
+"""
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .product_search import ProductVectorIndex
+from .telemetry import log_event, metrics
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "snapshot"))
+SNAPSHOT_CHECK_INTERVAL_SECONDS = float(os.getenv("SNAPSHOT_CHECK_INTERVAL_SECONDS", "60"))
+# Older snapshots are ignored and lookups go to MySQL; 0 accepts any age. Order status
+# changes within minutes, products and sales totals far more slowly.
+SNAPSHOT_MAX_AGE_SECONDS = float(os.getenv("SNAPSHOT_MAX_AGE_SECONDS", "900"))
+SNAPSHOT_CATALOG_MAX_AGE_SECONDS = float(os.getenv("SNAPSHOT_CATALOG_MAX_AGE_SECONDS", "86400"))
+SUPPORTED_FORMAT_VERSION = 1
+# Item statuses that don't count as a sale in the aggregations.
+NOT_SOLD_STATUSES = ("Cancelled", "Returned")
+
+SNAPSHOT_LOOKUPS = metrics.counter("snapshot_lookups_total", "Lookups answered from the columnar snapshot.", ["kind", "result"])
+
+
+class Table:
+    def __init__(self, path: str, columns: Dict[str, str], rows: int):
+        self.path = path
+        self.kinds = columns
+        self.rows = rows
+        self._arrays: Dict[str, np.ndarray] = {}
+
+    def _load(self, name: str) -> np.ndarray:
+        array = self._arrays.get(name)
+        if array is None:
+            array = np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r", allow_pickle=False)
+            self._arrays[name] = array
+        return array
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        """Numeric and datetime columns as-is; for strings, the dictionary codes."""
+        return self._load(f"{column}.codes" if self.kinds[column] == "str" else column)
+
+    def values(self, column: str) -> np.ndarray:
+        return self._load(f"{column}.values")
+
+    def index(self, name: str) -> np.ndarray:
+        return self._load(f"_{name}")
+
+    def code_of(self, column: str, value: str) -> int:
+        """Dictionary code of `value` (case-insensitive), or -1."""
+        matches = np.flatnonzero(np.char.lower(np.asarray(self.values(column))) == value.lower())
+        return int(matches[0]) if matches.size else -1
+
+    def string(self, column: str, row: int) -> Optional[str]:
+        code = int(self[column][row])
+        return str(self.values(column)[code]) if code >= 0 else None
+
+
+def _datetime(value) -> Optional[datetime]:
+    return None if np.isnat(value) else value.astype("datetime64[s]").item()
+
+
+def _float(value) -> Optional[float]:
+    return None if np.isnan(value) else float(value)
+
+
+class ColumnarSnapshot:
+    """One immutable snapshot version."""
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, "manifest.json")) as handle:
+            self.manifest = json.load(handle)
+        if self.manifest["format_version"] != SUPPORTED_FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot format {self.manifest['format_version']}")
+        self.version = self.manifest["version"]
+        self.created_at = datetime.fromisoformat(self.manifest["created_at"])
+        self.tables = {
+            name: Table(os.path.join(path, name), table["columns"], table["rows"])
+            for name, table in self.manifest["tables"].items()
+        }
+        self._derived: Dict[str, np.ndarray] = {}
+        spec = self.manifest.get("product_index")
+        self.product_index = ProductVectorIndex(os.path.join(path, "product_index"), spec) if spec else None
+
+    @property
+    def empty(self) -> bool:
+        """No products or no order items, e.g. written by a load that inserted nothing."""
+        return self.tables["products"].rows == 0 or self.tables["order_items"].rows == 0
+
+    @property
+    def age_seconds(self) -> float:
+        return (datetime.now(timezone.utc) - self.created_at).total_seconds()
+
+    def _product_rows(self, product_ids: np.ndarray) -> np.ndarray:
+        ids = self.tables["products"]["id"]
+        if ids.size == 0:
+            return np.full(len(product_ids), -1)
+        rows = np.minimum(np.searchsorted(ids, product_ids), ids.size - 1)
+        return np.where(ids[rows] == product_ids, rows, -1)
+
+    def derived(self, name: str) -> np.ndarray:
+        """Per-snapshot arrays computed once on first use (product row of every item, stock per product)."""
+        array = self._derived.get(name)
+        if array is None:
+            products = self.tables["products"].rows
+            if name == "item_product_rows":
+                array = self._product_rows(np.asarray(self.tables["order_items"]["product_id"]))
+            elif name == "sold_item":
+                items = self.tables["order_items"]
+                excluded = [items.code_of("status", status) for status in NOT_SOLD_STATUSES]
+                array = ~np.isin(items["status"], [code for code in excluded if code >= 0])
+            elif name == "in_stock":
+                inventory = self.tables["inventory_items"]
+                rows = self._product_rows(np.asarray(inventory["product_id"]))
+                unsold = np.isnat(inventory["sold_at"]) & (rows >= 0)
+                array = np.bincount(rows[unsold], minlength=products)
+            else:
+                raise KeyError(name)
+            self._derived[name] = array
+        return array
+
+    def product(self, row: int) -> dict:
+        """Same shape as catalog.serialize_product."""
+        products = self.tables["products"]
+        return {
+            "id": int(products["id"][row]),
+            "name": products.string("name", row),
+            "category": products.string("category", row),
+            "brand": products.string("brand", row),
+            "retail_price": _float(products["retail_price"][row]),
+            "department": products.string("department", row),
+            "sku": products.string("sku", row),
+        }
+
+    def search_products(self, queries: List[str], limit: int = 5) -> List[List[dict]]:
+        """Nearest products to each query by vector similarity."""
+        results = []
+        for matches in self.product_index.search(queries, limit=limit):
+            rows = self._product_rows(np.array([product_id for product_id, _ in matches], dtype=np.int64))
+            results.append([self.product(int(row)) for row in rows if row >= 0])
+        return results
+
+    def order_rows(self, order_ids) -> np.ndarray:
+        ids = self.tables["orders"]["order_id"]
+        order_ids = np.asarray(order_ids, dtype=np.int64)
+        if ids.size == 0:
+            return np.array([], dtype=np.int64)
+        rows = np.minimum(np.searchsorted(ids, order_ids), ids.size - 1)
+        return rows[ids[rows] == order_ids]
+
+    def serialize_order(self, row: int) -> dict:
+        orders, items, products = self.tables["orders"], self.tables["order_items"], self.tables["products"]
+        order_id = int(orders["order_id"][row])
+        start, end = np.searchsorted(items["order_id"], [order_id, order_id + 1])
+        product_rows = self.derived("item_product_rows")[start:end]
+        names = products.values("name")
+        name_codes = products["name"]
+        return {
+            "order_id": order_id,
+            "status": orders.string("status", row),
+            "num_of_item": int(orders["num_of_item"][row]),
+            "created_at": _datetime(orders["created_at"][row]),
+            "items": [
+                {
+                    "product_name": str(names[name_codes[product_row]]) if product_row >= 0 and name_codes[product_row] >= 0
+                    else "Unknown Product",
+                    "status": items.string("status", start + offset),
+                    "sale_price": _float(items["sale_price"][start + offset]),
+                }
+                for offset, product_row in enumerate(product_rows)
+            ],
+        }
+
+    def order_details(self, order_id: int, user_id: int) -> Optional[dict]:
+        rows = self.order_rows([order_id])
+        if rows.size == 0 or int(self.tables["orders"]["user_id"][rows[0]]) != user_id:
+            return None
+        return self.serialize_order(int(rows[0]))
+
+    def user_orders(self, user_id: int, order_ids: Optional[List[int]] = None, limit: int = 10) -> List[dict]:
+        """A user's orders, newest first (optionally only `order_ids`)."""
+        orders = self.tables["orders"]
+        keys = orders.index("by_user.user_id")
+        start, end = np.searchsorted(keys, [user_id, user_id + 1])
+        rows = orders.index("by_user")[start:end]
+        if order_ids:
+            rows = rows[np.isin(orders["order_id"][rows], np.asarray(order_ids, dtype=np.int64))]
+        return [self.serialize_order(int(row)) for row in rows[:limit]]
+
+    def top_products(self, category: Optional[str] = None, department: Optional[str] = None, limit: int = 5) -> List[dict]:
+        """Best sellers by units sold (cancelled and returned items excluded), with revenue and stock."""
+        products, items = self.tables["products"], self.tables["order_items"]
+        product_rows = self.derived("item_product_rows")
+        sold = self.derived("sold_item") & (product_rows >= 0)
+        units = np.bincount(product_rows[sold], minlength=products.rows)
+        revenue = np.bincount(product_rows[sold], weights=np.nan_to_num(items["sale_price"][sold]), minlength=products.rows)
+
+        eligible = np.ones(products.rows, dtype=bool)
+        for column, value in (("category", category), ("department", department)):
+            if value:
+                eligible &= np.asarray(products[column]) == products.code_of(column, value)
+        candidates = np.flatnonzero(eligible & (units > 0))
+        if candidates.size > limit:
+            # Partial selection of the top `limit` unit counts, keeping ties at the cut-off for the revenue tie-break.
+            cutoff = -np.partition(-units[candidates], limit - 1)[limit - 1]
+            candidates = candidates[units[candidates] >= cutoff]
+        candidates = candidates[np.lexsort((-revenue[candidates], -units[candidates]))][:limit]
+
+        in_stock = self.derived("in_stock")
+        return [
+            {
+                "id": int(products["id"][row]),
+                "name": products.string("name", row),
+                "category": products.string("category", row),
+                "brand": products.string("brand", row),
+                "department": products.string("department", row),
+                "retail_price": _float(products["retail_price"][row]),
+                "units_sold": int(units[row]),
+                "revenue": round(float(revenue[row]), 2),
+                "in_stock": int(in_stock[row]),
+            }
+            for row in candidates
+        ]
+
+
+class SnapshotStore:
+    """Holds the current snapshot version and swaps in new ones as the loader writes them."""
+
+    def __init__(self, root: str = SNAPSHOT_DIR, check_interval: float = SNAPSHOT_CHECK_INTERVAL_SECONDS,
+                 max_age: float = SNAPSHOT_MAX_AGE_SECONDS, catalog_max_age: float = SNAPSHOT_CATALOG_MAX_AGE_SECONDS):
+        self.root = os.path.abspath(root)
+        self.check_interval = check_interval
+        self.max_age = max_age
+        self.catalog_max_age = catalog_max_age
+        self.snapshot: Optional[ColumnarSnapshot] = None
+        self.error: Optional[str] = None
+        self.checked_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self.check_interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                log_event("snapshot_refresh_failed", root=self.root, error=repr(e))
+
+    def refresh(self) -> Optional[str]:
+        """
+        Loads the version named in CURRENT if it isn't loaded yet; returns the current version.
+        Blocking (file reads, np.load): call it from a thread, not the event loop.
+        """
+        self.checked_at = time.monotonic()
+        try:
+            with open(os.path.join(self.root, "CURRENT")) as handle:
+                version = handle.read().strip()
+        except FileNotFoundError:
+            return self.snapshot.version if self.snapshot else None
+        if self.snapshot is None or self.snapshot.version != version:
+            try:
+                snapshot = ColumnarSnapshot(os.path.join(self.root, version))
+            except (OSError, ValueError, KeyError) as e:
+                self.error = f"{version}: {e}"
+                log_event("snapshot_load_failed", version=version, error=repr(e))
+                return self.snapshot.version if self.snapshot else None
+            self.snapshot, self.error = snapshot, None
+            log_event("snapshot_loaded", version=version, created_at=snapshot.created_at.isoformat())
+        return version
+
+    def current(self, max_age: Optional[float] = None) -> Optional[ColumnarSnapshot]:
+        """
+        The snapshot to answer from, or None when there is none, it is empty or it is older
+        than `max_age` (default: the order max age). Never touches the filesystem.
+        """
+        snapshot = self.snapshot
+        max_age = self.max_age if max_age is None else max_age
+        if snapshot is None or snapshot.empty or (max_age and snapshot.age_seconds > max_age):
+            return None
+        return snapshot
+
+    def catalog(self) -> Optional[ColumnarSnapshot]:
+        """The snapshot for product search and sales aggregations, which tolerate more staleness."""
+        return self.current(self.catalog_max_age)
+
+    def stats(self) -> dict:
+        snapshot = self.snapshot
+        if snapshot is None:
+            return {"loaded": False, "root": self.root, "error": self.error}
+        return {
+            "loaded": True,
+            "usable": self.current() is not None,
+            "catalog_usable": self.catalog() is not None,
+            "empty": snapshot.empty,
+            "version": snapshot.version,
+            "created_at": snapshot.created_at,
+            "age_seconds": round(snapshot.age_seconds, 1),
+            "source": snapshot.manifest.get("source"),
+            "rows": {name: table.rows for name, table in snapshot.tables.items()},
+            "product_index": snapshot.manifest.get("product_index"),
+            "error": self.error,
+        }
+
+
+order_snapshot = SnapshotStore()
@@ -0,0 +1,119 @@
+"""
+Deferred startup work. Importing the app touches neither the database nor the LLM
+provider: the lifespan runs these steps in a background task, retrying while the
+database is unreachable, and /ready answers 503 until they have all succeeded. So a
+replica can start (and pass liveness) before MySQL is up.
+"""
+import asyncio
+import os
+import random
+import time
+from typing import Awaitable, Callable, List, NamedTuple, Optional
+
+from sqlalchemy import exc
+
+from . import migrations
+from .telemetry import log_event
+
+# Schema changes go through the versioned migration set; set SCHEMA_AUTO_MIGRATE=false to
+# apply them out of band. SCHEMA_VERIFY_INDEXES=false skips the index check as well.
+SCHEMA_AUTO_MIGRATE = os.getenv("SCHEMA_AUTO_MIGRATE", "true").lower() == "true"
+SCHEMA_VERIFY_INDEXES = os.getenv("SCHEMA_VERIFY_INDEXES", "true").lower() == "true"
+# How long the lifespan waits for startup before serving anyway (not ready yet).
+STARTUP_WAIT_SECONDS = float(os.getenv("STARTUP_WAIT_SECONDS", "5"))
+STARTUP_RETRY_MAX_DELAY = float(os.getenv("STARTUP_RETRY_MAX_DELAY", "30"))
+
+# Worth retrying: the database is down, still booting or unreachable.
+TRANSIENT_ERRORS = (exc.OperationalError, exc.InterfaceError, exc.TimeoutError, ConnectionError, OSError)
+
+
+class StartupStep(NamedTuple):
+    name: str
+    run: Callable[[], Awaitable[None]]
+    # Optional steps log and move on after a failure instead of holding readiness back.
+    required: bool = True
+
+
+def schema_step(engine) -> StartupStep:
+    async def run() -> None:
+        if SCHEMA_AUTO_MIGRATE:
+            await asyncio.to_thread(migrations.upgrade, engine)
+        if SCHEMA_VERIFY_INDEXES:
+            # A missing hot-path index is a deployment error, not a transient one: no retry.
+            await asyncio.to_thread(migrations.verify_required_indexes, engine)
+    return StartupStep("schema", run)
+
+
+class Startup:
+    """Runs the startup steps in order; `status()` backs the readiness endpoint."""
+
+    def __init__(self, steps: List[StartupStep], max_delay: float = STARTUP_RETRY_MAX_DELAY):
+        self.steps = steps
+        self.max_delay = max_delay
+        self.state = "starting"
+        self.error: Optional[str] = None
+        self.attempts = 0
+        self.started_at = time.monotonic()
+        self.ready_after: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    async def start(self, wait: float = STARTUP_WAIT_SECONDS) -> None:
+        """Starts the steps and waits up to `wait` seconds; whatever is left keeps running."""
+        self.started_at = time.monotonic()
+        self._task = asyncio.create_task(self._run())
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), wait)
+        except asyncio.TimeoutError:
+            log_event("startup_pending", wait_s=wait, error=self.error)
+
+    async def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self) -> None:
+        for step in self.steps:
+            if not await self._run_step(step):
+                return
+        self.state, self.error = "ready", None
+        self.ready_after = time.monotonic() - self.started_at
+        log_event("startup_complete", duration_s=round(self.ready_after, 2))
+
+    async def _run_step(self, step: StartupStep) -> bool:
+        attempt = 0
+        while True:
+            self.attempts += 1
+            try:
+                await step.run()
+                return True
+            except TRANSIENT_ERRORS as e:
+                self.error = f"{step.name}: {e.__class__.__name__}: {e}"
+                if not step.required:
+                    log_event("startup_step_skipped", step=step.name, error=repr(e))
+                    return True
+                delay = random.uniform(0, min(self.max_delay, 0.5 * 2 ** attempt))
+                log_event("startup_retry", step=step.name, attempt=attempt + 1, delay_s=round(delay, 2), error=repr(e))
+                await asyncio.sleep(delay)
+                attempt += 1
+            except Exception as e:
+                if not step.required:
+                    log_event("startup_step_skipped", step=step.name, error=repr(e))
+                    return True
+                self.state, self.error = "failed", f"{step.name}: {e}"
+                log_event("startup_failed", step=step.name, error=repr(e))
+                return False
+
+    def status(self) -> dict:
+        return {
+            "status": self.state,
+            "error": self.error,
+            "attempts": self.attempts,
+            "ready_after_seconds": round(self.ready_after, 3) if self.ready_after is not None else None,
+        }
@@ -0,0 +1,265 @@
+"""
+Request tracing and Prometheus-style metrics without an external client library.
+
+Each HTTP request gets a Trace (kept in a context variable, so tool calls running in
+gathered tasks record into the same one). `span(stage)` times a stage into both the
+trace and the chat_stage_duration_seconds histogram; the trace is emitted as one
+structured JSON log line when the response has been fully sent.
+"""
+import json
+import os
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from . import env  # noqa: F401
+
+REQUEST_ID_HEADER = "X-Request-ID"
+# Requests without spans (health checks, listings) are only logged when this is on.
+LOG_ALL_REQUESTS = os.getenv("LOG_ALL_REQUESTS", "false").lower() == "true"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labelnames: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels.get(name, "")) for name in self.labelnames), 0)
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(self._values.items())]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def totals(self) -> Dict[Tuple[str, ...], Tuple[int, float]]:
+        """(count, sum) per label combination."""
+        return {key: (series[2], series[1]) for key, series in self._series.items()}
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, float("inf")), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total!r}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Gauge:
+    """
+    Read at scrape time from a callback, e.g. cache or pool statistics. With labels the
+    callback returns {label values tuple: value}.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], object], labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+        self.labelnames = tuple(labelnames)
+
+    def samples(self) -> List[str]:
+        try:
+            value = self.read()
+        except Exception:
+            return []
+        if not self.labelnames:
+            return [f"{self.name} {_format_value(value)}"]
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(series_value)}"
+                for key, series_value in sorted(value.items())]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, read: Callable[[], object], labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, read, labelnames))
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    "http_request_duration_seconds", "Time from request start to the last byte of the response.", ["method", "route", "status"])
+CHAT_STAGE_SECONDS = metrics.histogram(
+    "chat_stage_duration_seconds", "Time spent in each stage of a chat turn.", ["stage"])
+LLM_TOKENS = metrics.counter("llm_tokens_total", "Tokens reported by the LLM API usage field.", ["model", "type"])
+LLM_CALLS = metrics.counter("llm_calls_total", "Completions requested from the LLM API.", ["model", "stream"])
+TOOL_CALLS = metrics.counter("tool_calls_total", "Tool calls executed for the LLM.", ["tool", "outcome"])
+TOOL_SECONDS = metrics.histogram("tool_call_duration_seconds", "Time spent executing each tool.", ["tool"])
+DB_POOL_WAIT_SECONDS = metrics.histogram(
+    "db_pool_checkout_seconds", "Time to check a connection out of the pool (queueing, connect, pre-ping).", ["pool"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0, 30.0))
+DB_POOL_TIMEOUTS = metrics.counter("db_pool_timeouts_total", "Checkouts that gave up after pool_timeout.", ["pool"])
+
+
+class Trace:
+    def __init__(self, request_id: str, method: str, path: str):
+        self.request_id = request_id
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.spans: List[dict] = []
+        self.tokens: Dict[str, int] = {}
+
+    def add_tokens(self, prompt: int, completion: int) -> None:
+        self.tokens["prompt"] = self.tokens.get("prompt", 0) + prompt
+        self.tokens["completion"] = self.tokens.get("completion", 0) + completion
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+
+def current_request_id() -> Optional[str]:
+    trace = _current_trace.get()
+    return trace.request_id if trace is not None else None
+
+
+@contextmanager
+def span(stage: str, **attributes):
+    trace = _current_trace.get()
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        CHAT_STAGE_SECONDS.observe(duration, stage=stage)
+        if trace is not None:
+            entry = {"stage": stage, "offset_ms": round((start - trace.started) * 1000, 2),
+                     "ms": round(duration * 1000, 2), **attributes}
+            if error:
+                entry["error"] = error
+            trace.spans.append(entry)
+
+
+def record_usage(model: str, usage) -> None:
+    """Counts tokens from a completion's `usage` (a missing usage is ignored)."""
+    if usage is None:
+        return
+    prompt = getattr(usage, "prompt_tokens", 0) or 0
+    completion = getattr(usage, "completion_tokens", 0) or 0
+    LLM_TOKENS.inc(prompt, model=model, type="prompt")
+    LLM_TOKENS.inc(completion, model=model, type="completion")
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_tokens(prompt, completion)
+
+
+def log_event(event: str, **fields) -> None:
+    """One JSON object per line so log shippers can index the fields."""
+    print(json.dumps({"ts": round(time.time(), 3), "event": event, **fields}, default=str), flush=True)
+
+
+class TelemetryMiddleware:
+    """
+    Pure ASGI middleware (unlike BaseHTTPMiddleware it sees the end of streamed bodies)
+    that times every request, tags it with a request id and logs its trace.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        request_id = headers.get(REQUEST_ID_HEADER.lower().encode(), b"").decode() or uuid.uuid4().hex
+        trace = Trace(request_id, scope["method"], scope["path"])
+        token = _current_trace.set(trace)
+        status_code = 500
+
+        async def send_with_request_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = [*message["headers"], (REQUEST_ID_HEADER.lower().encode(), request_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            duration = time.perf_counter() - trace.started
+            route = scope.get("route")
+            # Route templates, not raw paths, keep the label cardinality bounded.
+            route_path = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_SECONDS.observe(duration, method=trace.method, route=route_path, status=status_code)
+            if trace.spans or LOG_ALL_REQUESTS:
+                log_event(
+                    "request", request_id=request_id, method=trace.method, route=route_path, status=status_code,
+                    duration_ms=round(duration * 1000, 2), tokens=trace.tokens, spans=trace.spans,
+                )
+            _current_trace.reset(token)
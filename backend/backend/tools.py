@@ -0,0 +1,162 @@
+import asyncio
+import json
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from .telemetry import TOOL_CALLS, TOOL_SECONDS, current_request_id, log_event, span
+
+# Rounds of "model asks for tools -> tools run -> model sees results" per chat turn.
+MAX_TOOL_ITERATIONS = int(os.getenv("MAX_TOOL_ITERATIONS", "2"))
+# Tool calls of one round run concurrently, each on its own session.
+TOOL_MAX_CONCURRENCY = int(os.getenv("TOOL_MAX_CONCURRENCY", "4"))
+
+ToolHandler = Callable[..., Awaitable[Any]]
+
+
+class Tool(NamedTuple):
+    name: str
+    description: str
+    parameters: dict
+    handler: ToolHandler
+
+
+class ToolRegistry:
+    """
+    Tools the LLM may call, advertised through the native `tools` API parameter.
+    Handlers are called as handler(db, user_id, **arguments); user_id always comes from
+    the request, never from the model.
+    """
+
+    def __init__(self):
+        self._tools: Dict[str, Tool] = {}
+
+    def register(self, name: str, description: str, parameters: dict):
+        def decorator(handler: ToolHandler) -> ToolHandler:
+            self._tools[name] = Tool(name, description, parameters, handler)
+            return handler
+        return decorator
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._tools
+
+    def definitions(self) -> List[dict]:
+        return [
+            {"type": "function", "function": {"name": tool.name, "description": tool.description, "parameters": tool.parameters}}
+            for tool in self._tools.values()
+        ]
+
+    async def call(self, session_factory: async_sessionmaker, tool_call: dict, user_id: int) -> dict:
+        """Runs one tool call and returns the `tool` message answering it; failures become error payloads."""
+        function = tool_call["function"]
+        name = function["name"]
+        tool = self._tools.get(name)
+        # Model-supplied names are not used as labels unless registered (bounded cardinality).
+        label = name if tool is not None else "unknown"
+        start = time.perf_counter()
+        outcome = "ok"
+        with span("tool", tool=name):
+            try:
+                if tool is None:
+                    raise ValueError(f"unknown tool '{name}'")
+                arguments = function.get("arguments") or {}
+                if isinstance(arguments, str):
+                    arguments = json.loads(arguments or "{}")
+                arguments = {key: value for key, value in arguments.items() if key in tool.parameters["properties"]}
+                # Sessions are lazy: tools answered from memory never check out a connection.
+                async with session_factory() as db:
+                    output = await tool.handler(db, user_id, **arguments)
+            except Exception as e:
+                log_event("tool_failed", request_id=current_request_id(), tool=name, error=repr(e))
+                outcome = "error"
+                output = {"error": str(e)}
+        TOOL_SECONDS.observe(time.perf_counter() - start, tool=label)
+        TOOL_CALLS.inc(tool=label, outcome=outcome)
+        return {
+            "role": "tool",
+            "tool_call_id": tool_call["id"],
+            "name": name,
+            "content": json.dumps(output, default=str),
+        }
+
+    async def call_all(self, session_factory: async_sessionmaker, tool_calls: List[dict], user_id: int,
+                       max_concurrency: int = TOOL_MAX_CONCURRENCY) -> List[dict]:
+        """Runs every tool call of one model response concurrently; results keep the call order."""
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def bounded(tool_call: dict) -> dict:
+            async with semaphore:
+                return await self.call(session_factory, tool_call, user_id)
+
+        return list(await asyncio.gather(*(bounded(tool_call) for tool_call in tool_calls)))
+
+
+def assistant_message(content: Optional[str], tool_calls: Optional[List[dict]] = None) -> dict:
+    message = {"role": "assistant", "content": content}
+    if tool_calls:
+        message["tool_calls"] = tool_calls
+    return message
+
+
+def message_from_completion(message) -> dict:
+    """Plain-dict copy of an SDK completion message, so it can be cached and sent back as history."""
+    tool_calls = [
+        {"id": call.id, "type": "function", "function": {"name": call.function.name, "arguments": call.function.arguments}}
+        for call in (getattr(message, "tool_calls", None) or [])
+    ]
+    return assistant_message(message.content, tool_calls)
+
+
+def parse_legacy_tool_call(content: Optional[str]) -> Optional[List[dict]]:
+    """
+    Models sometimes still answer with the old {"tool_call": {...}} JSON envelope in the
+    message text; it is converted to a structured call so it goes through the same loop.
+    """
+    if not content:
+        return None
+    text = content.strip()
+    if text.startswith("```"):
+        text = text.strip("`")
+        if text.startswith("json"):
+            text = text[4:]
+    try:
+        parsed = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(parsed, dict) or not isinstance(parsed.get("tool_call"), dict):
+        return None
+    call = parsed["tool_call"]
+    return [{
+        "id": "call_legacy_0",
+        "type": "function",
+        "function": {"name": call.get("function_name"), "arguments": json.dumps(call.get("parameters") or {})},
+    }]
+
+
+class ToolCallAccumulator:
+    """Reassembles tool calls from streamed deltas (they arrive split across chunks by index)."""
+
+    def __init__(self):
+        self._calls: Dict[int, dict] = {}
+
+    def add(self, deltas) -> None:
+        for delta in deltas or []:
+            call = self._calls.setdefault(delta.index, {"id": None, "type": "function", "function": {"name": "", "arguments": ""}})
+            if delta.id:
+                call["id"] = delta.id
+            function = getattr(delta, "function", None)
+            if function is not None:
+                if function.name:
+                    call["function"]["name"] += function.name
+                if function.arguments:
+                    call["function"]["arguments"] += function.arguments
+
+    def tool_calls(self) -> List[dict]:
+        calls = []
+        for index in sorted(self._calls):
+            call = self._calls[index]
+            call["id"] = call["id"] or f"call_{index}"
+            calls.append(call)
+        return calls
@@ -0,0 +1,174 @@
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import date
+from typing import NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, object_session
+
+from . import models
+from .shared_state import shared_state
+from .telemetry import log_event, metrics
+
+# Upper bound on staleness for user changes the ORM doesn't see (e.g. the CSV loader).
+USER_CONTEXT_TTL_SECONDS = int(os.getenv("USER_CONTEXT_TTL_SECONDS", "60"))
+USER_CONTEXT_MAX_ENTRIES = int(os.getenv("USER_CONTEXT_MAX_ENTRIES", "10000"))
+# How often a worker checks whether another worker has invalidated users.
+USER_CONTEXT_SYNC_SECONDS = float(os.getenv("USER_CONTEXT_SYNC_SECONDS", "2"))
+USER_CONTEXT_GENERATION_KEY = "user_context:generation"
+USER_CONTEXT_GENERATION_TTL_SECONDS = 24 * 3600
+# Session.info flag set by the ORM hooks and published once the transaction commits.
+USERS_CHANGED = "user_context_changed"
+
+USER_CONTEXT_LOOKUPS = metrics.counter("user_context_lookups_total", "User profile lookups for chat turns.", ["result"])
+
+
+class UserProfile(NamedTuple):
+    """The user fields the agent prompt needs; kept small so the cache stays cheap."""
+    id: int
+    first_name: Optional[str]
+
+
+class UserContextCache:
+    """
+    Per-worker TTL/LRU cache of UserProfile by user id. When the ORM updates or deletes
+    a user (see the listeners below) the entry is dropped here, and after the commit a
+    new generation is published through shared_state; every worker drops its entries
+    within USER_CONTEXT_SYNC_SECONDS of seeing it. Changes made without the ORM (e.g.
+    the CSV loader) are picked up once the TTL runs out.
+    """
+
+    def __init__(self, ttl: int = USER_CONTEXT_TTL_SECONDS, max_entries: int = USER_CONTEXT_MAX_ENTRIES,
+                 sync_seconds: float = USER_CONTEXT_SYNC_SECONDS, state=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.sync_seconds = sync_seconds
+        self.state = state or shared_state
+        self.generation: Optional[str] = None
+        self.synced_at: Optional[float] = None
+        self._entries: "OrderedDict[int, Tuple[float, UserProfile]]" = OrderedDict()
+        self._publishing: Set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _lookup(self, user_id: int) -> Optional[UserProfile]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        expires_at, profile = entry
+        if expires_at <= time.monotonic():
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return profile
+
+    def put(self, profile: UserProfile) -> None:
+        self._entries[profile.id] = (time.monotonic() + self.ttl, profile)
+        self._entries.move_to_end(profile.id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, db: AsyncSession, user_id: int) -> Optional[UserProfile]:
+        """Cached profile, or one column-only query on a miss. Unknown users are not cached."""
+        profile = None
+        if self.ttl > 0:
+            await self.sync()
+            profile = self._lookup(user_id)
+        if profile is not None:
+            USER_CONTEXT_LOOKUPS.inc(result="hit")
+            return profile
+        USER_CONTEXT_LOOKUPS.inc(result="miss")
+        row = (await db.execute(
+            select(models.User.id, models.User.first_name).where(models.User.id == user_id)
+        )).first()
+        if row is None:
+            return None
+        profile = UserProfile(row.id, row.first_name)
+        if self.ttl > 0:
+            self.put(profile)
+        return profile
+
+    def invalidate(self, user_id: int) -> None:
+        self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    async def sync(self) -> None:
+        """Drops every entry if another worker has published an invalidation since the last check."""
+        now = time.monotonic()
+        if self.synced_at is not None and now - self.synced_at < self.sync_seconds:
+            return
+        self.synced_at = now
+        try:
+            generation = await self.state.get(USER_CONTEXT_GENERATION_KEY)
+        except Exception as e:
+            # Fall back to the TTL bound rather than failing the chat turn.
+            log_event("user_context_sync_failed", error=repr(e))
+            return
+        if generation != self.generation:
+            self.generation = generation
+            self.clear()
+
+    async def publish(self) -> None:
+        """Tells every worker (this one included, on its next sync) to drop its entries."""
+        try:
+            await self.state.set(USER_CONTEXT_GENERATION_KEY, uuid.uuid4().hex, USER_CONTEXT_GENERATION_TTL_SECONDS)
+        except Exception as e:
+            log_event("user_context_publish_failed", error=repr(e))
+
+    def publish_soon(self) -> None:
+        """publish() from the synchronous ORM hooks; without a running loop only the TTL applies."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        task = loop.create_task(self.publish())
+        self._publishing.add(task)
+        task.add_done_callback(self._publishing.discard)
+
+
+user_context_cache = UserContextCache()
+
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _invalidate_user(mapper, connection, target) -> None:
+    user_context_cache.invalidate(target.id)
+    session = object_session(target)
+    if session is not None:
+        session.info[USERS_CHANGED] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _invalidate_on_bulk_change(orm_execute_state) -> None:
+    # update(User)/delete(User) statements don't say which rows they touch; drop everything.
+    if (orm_execute_state.is_update or orm_execute_state.is_delete) and any(
+        mapper.class_ is models.User for mapper in orm_execute_state.all_mappers
+    ):
+        user_context_cache.clear()
+        orm_execute_state.session.info[USERS_CHANGED] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_user_changes(session) -> None:
+    # Published only once committed, so other workers can't re-read the old row.
+    if session.info.pop(USERS_CHANGED, False):
+        user_context_cache.publish_soon()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_user_changes(session) -> None:
+    session.info.pop(USERS_CHANGED, None)
+
+
+def user_context_message(profile: UserProfile) -> dict:
+    """The per-user, per-day tail that follows the static system prompt."""
+    return {"role": "system", "content": (
+        f"The current user's first name is {profile.first_name}. Today's date is {date.today().isoformat()}."
+    )}
@@ -0,0 +1,169 @@
+"""
+Small, seeded e-commerce dataset in the schema of data/database_creation.txt.
+
+`generate` returns the rows per table; `write_csvs` writes them in the layout of the
+original CSV export (UTC timestamps, plus a few duplicate e-mails and orphaned
+order items so the loader's dedupe and FK filters have work to do), and
+`seed_database` inserts them, together with chat history, through the app's models.
+"""
+import csv
+import os
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+CATEGORIES = [
+    ("Tops & Tees", "Women"), ("Jeans", "Men"), ("Outerwear & Coats", "Men"), ("Sweaters", "Women"),
+    ("Active", "Women"), ("Shorts", "Men"), ("Dresses", "Women"), ("Socks", "Men"),
+]
+NOUNS = {
+    "Tops & Tees": "T-Shirt", "Jeans": "Jeans", "Outerwear & Coats": "Jacket", "Sweaters": "Sweater",
+    "Active": "Leggings", "Shorts": "Shorts", "Dresses": "Dress", "Socks": "Socks",
+}
+ADJECTIVES = ["Classic", "Slim Fit", "Relaxed", "Vintage", "Organic Cotton", "Performance", "Wool Blend", "Striped"]
+BRANDS = ["Allegra K", "Calvin Klein", "Carhartt", "Levi's", "Nike", "Patagonia", "Tommy Hilfiger", "Wrangler"]
+FIRST_NAMES = ["Ava", "Ben", "Chloe", "Dev", "Emma", "Felix", "Grace", "Hiro", "Isla", "Jon", "Kira", "Liam"]
+LAST_NAMES = ["Smith", "Garcia", "Chen", "Patel", "Kim", "Nguyen", "Brown", "Silva", "Okafor", "Muller"]
+STATUSES = ["Complete", "Shipped", "Processing", "Cancelled", "Returned"]
+CENTERS = [
+    (1, "Memphis TN", 35.1174, -89.9711), (2, "Chicago IL", 41.8369, -87.6847),
+    (3, "Houston TX", 29.7604, -95.3698), (4, "Los Angeles CA", 34.05, -118.25),
+]
+EPOCH = datetime(2023, 1, 1)
+
+
+def generate(users=200, products=300, orders_per_user=3, items_per_order=2, seed=42):
+    rng = random.Random(seed)
+    tables = {"distribution_centers": [
+        {"id": id_, "name": name, "latitude": lat, "longitude": lon} for id_, name, lat, lon in CENTERS
+    ]}
+
+    tables["products"] = []
+    for product_id in range(1, products + 1):
+        category, department = rng.choice(CATEGORIES)
+        cost = round(rng.uniform(3, 60), 2)
+        tables["products"].append({
+            "id": product_id, "cost": cost, "category": category,
+            "name": f"{rng.choice(ADJECTIVES)} {NOUNS[category]} {product_id}", "brand": rng.choice(BRANDS),
+            "retail_price": round(cost * rng.uniform(1.5, 3), 2), "department": department,
+            "sku": f"SKU{product_id:06d}", "distribution_center_id": rng.choice(CENTERS)[0],
+        })
+
+    tables["users"] = []
+    for user_id in range(1, users + 1):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        tables["users"].append({
+            "id": user_id, "first_name": first, "last_name": last,
+            "email": f"{first.lower()}.{last.lower()}{user_id}@example.com", "age": rng.randint(18, 70),
+            "gender": rng.choice("MF"), "state": "California", "street_address": f"{rng.randint(1, 999)} Main St",
+            "postal_code": f"9{rng.randint(1000, 9999)}", "city": "Los Angeles", "country": "United States",
+            "latitude": round(rng.uniform(33, 35), 8), "longitude": round(rng.uniform(-119, -117), 8),
+            "traffic_source": rng.choice(["Search", "Organic", "Email", "Facebook"]),
+            "created_at": EPOCH + timedelta(days=rng.randint(0, 200), seconds=rng.randint(0, 86399)),
+        })
+
+    tables["inventory_items"], tables["orders"], tables["order_items"] = [], [], []
+    order_id = 0
+    for user in tables["users"]:
+        for _ in range(orders_per_user):
+            order_id += 1
+            created = user["created_at"] + timedelta(days=rng.randint(1, 300), seconds=rng.randint(0, 86399))
+            status = rng.choice(STATUSES)
+            shipped = created + timedelta(days=1) if status in ("Complete", "Shipped", "Returned") else None
+            delivered = created + timedelta(days=4) if status in ("Complete", "Returned") else None
+            tables["orders"].append({
+                "order_id": order_id, "user_id": user["id"], "status": status, "gender": user["gender"],
+                "created_at": created, "returned_at": created + timedelta(days=9) if status == "Returned" else None,
+                "shipped_at": shipped, "delivered_at": delivered, "num_of_item": items_per_order,
+            })
+            for _ in range(items_per_order):
+                product = rng.choice(tables["products"])
+                item_id = len(tables["inventory_items"]) + 1
+                tables["inventory_items"].append({
+                    "id": item_id, "product_id": product["id"], "created_at": created - timedelta(days=30),
+                    "sold_at": created, "cost": product["cost"], "product_category": product["category"],
+                    "product_name": product["name"], "product_brand": product["brand"],
+                    "product_retail_price": product["retail_price"], "product_department": product["department"],
+                    "product_sku": product["sku"], "product_distribution_center_id": product["distribution_center_id"],
+                })
+                tables["order_items"].append({
+                    "id": len(tables["order_items"]) + 1, "order_id": order_id, "user_id": user["id"],
+                    "product_id": product["id"], "inventory_item_id": item_id, "status": status,
+                    "created_at": created, "shipped_at": shipped, "delivered_at": delivered,
+                    "returned_at": created + timedelta(days=9) if status == "Returned" else None,
+                    "sale_price": product["retail_price"],
+                })
+    return tables
+
+
+def _csv_value(value):
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S+00:00")
+    return "" if value is None else value
+
+
+def write_csvs(tables, data_dir, noise=0.02, seed=42):
+    """Writes one CSV per table; `noise` adds that fraction of duplicate users and orphaned order items."""
+    rng = random.Random(seed)
+    os.makedirs(data_dir, exist_ok=True)
+    rows_by_table = {name: list(rows) for name, rows in tables.items()}
+
+    users = rows_by_table["users"]
+    next_user_id = max(user["id"] for user in users) + 1
+    for user in rng.sample(users, int(len(users) * noise)):
+        users.append(dict(user, id=next_user_id))
+        next_user_id += 1
+
+    items = rows_by_table["order_items"]
+    next_item_id = max(item["id"] for item in items) + 1
+    missing_order = max(order["order_id"] for order in rows_by_table["orders"]) + 1000
+    for item in rng.sample(items, int(len(items) * noise)):
+        items.append(dict(item, id=next_item_id, order_id=missing_order))
+        next_item_id += 1
+
+    paths = {}
+    for name, rows in rows_by_table.items():
+        path = os.path.join(data_dir, f"{name}.csv")
+        with open(path, "w", newline="") as handle:
+            writer = csv.DictWriter(handle, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows({key: _csv_value(value) for key, value in row.items()} for row in rows)
+        paths[name] = path
+    return paths
+
+
+def seed_database(engine, tables, conversations_per_user=2, messages_per_conversation=20, seed=42):
+    """Inserts the dataset and a chat history for every user; returns the row counts."""
+    from backend.backend import models
+
+    rng = random.Random(seed)
+    model_tables = {
+        "users": models.User, "products": models.Product, "inventory_items": models.InventoryItem,
+        "orders": models.Order, "order_items": models.OrderItem,
+    }
+    counts = {}
+    with engine.begin() as conn:
+        for name, model in model_tables.items():
+            columns = set(model.__table__.columns.keys())
+            rows = [{key: value for key, value in row.items() if key in columns} for row in tables[name]]
+            conn.execute(insert(model.__table__), rows)
+            counts[name] = len(rows)
+
+        conversations, messages = [], []
+        for user in tables["users"]:
+            for _ in range(conversations_per_user):
+                conversation_id = len(conversations) + 1
+                start = EPOCH + timedelta(days=rng.randint(200, 400), seconds=rng.randint(0, 86399))
+                conversations.append({"id": conversation_id, "user_id": user["id"], "start_time": start,
+                                      "title": f"Chat {conversation_id}"})
+                for index in range(messages_per_conversation):
+                    sender = "user" if index % 2 == 0 else "ai"
+                    content = (f"Where is order {rng.randint(1, len(tables['orders']))}?" if sender == "user"
+                               else "Your order has shipped and should arrive within a few days.")
+                    messages.append({"conversation_id": conversation_id, "sender": sender, "content": content,
+                                     "timestamp": start + timedelta(seconds=30 * index)})
+        conn.execute(insert(models.Conversation.__table__), conversations)
+        conn.execute(insert(models.Message.__table__), messages)
+        counts["conversations"], counts["messages"] = len(conversations), len(messages)
+    return counts
@@ -0,0 +1,107 @@
+"""
+Deterministic, offline stand-in for the AsyncGroq client.
+
+The first completion of a turn asks for tools when the user mentions an order id
+("order 123") or a SKU ("SKU ABC-1"); once tool results are in the prompt it
+answers in plain text. Latency is `latency_ms` +/- `jitter_ms`, drawn from a
+seeded RNG, and streamed answers are split into `chunk_chars` pieces.
+"""
+import asyncio
+import json
+import random
+import re
+from types import SimpleNamespace
+
+ORDER_RE = re.compile(r"\border\s*#?\s*(\d+)", re.IGNORECASE)
+SKU_RE = re.compile(r"\bsku\s*([A-Za-z0-9-]+)", re.IGNORECASE)
+PRODUCT_RE = re.compile(r"\bdo you (?:have|sell)\s+(.+?)[?.!]*$", re.IGNORECASE)
+
+
+def _usage(messages, text):
+    prompt = sum(len(message.get("content") or "") for message in messages) // 4 + 1
+    completion = len(text) // 4 + 1
+    return SimpleNamespace(prompt_tokens=prompt, completion_tokens=completion, total_tokens=prompt + completion)
+
+
+def _tool_call(index, name, arguments):
+    return SimpleNamespace(id=f"call_{index}", type="function",
+                           function=SimpleNamespace(name=name, arguments=json.dumps(arguments)))
+
+
+def plan_tool_calls(user_message):
+    calls = [("get_order_details", {"order_id": int(order_id)}) for order_id in ORDER_RE.findall(user_message)]
+    calls += [("get_product_details", {"sku": sku}) for sku in SKU_RE.findall(user_message)]
+    product = PRODUCT_RE.search(user_message)
+    if product and not calls:
+        calls.append(("get_product_details", {"product_name": product.group(1)}))
+    return [_tool_call(index, name, arguments) for index, (name, arguments) in enumerate(calls)]
+
+
+def plan_answer(messages):
+    tool_results = [message for message in messages if message.get("role") == "tool"]
+    if tool_results:
+        found = sum(1 for message in tool_results if message["content"] not in ("null", "[]"))
+        return f"I looked that up for you: {found} of {len(tool_results)} lookups returned data. " \
+               "Let me know if you need anything else about your orders or our products."
+    return "Hi! I can help you find products or check the status of your orders. What would you like to do?"
+
+
+class FakeStream:
+    def __init__(self, text, tool_calls, usage, chunk_chars, delay):
+        self.text = text
+        self.tool_calls = tool_calls
+        self.usage = usage
+        self.chunk_chars = chunk_chars
+        self.delay = delay
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        for index, call in enumerate(self.tool_calls):
+            delta = SimpleNamespace(content=None, tool_calls=[SimpleNamespace(
+                index=index, id=call.id, type="function",
+                function=SimpleNamespace(name=call.function.name, arguments=call.function.arguments))])
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None, x_groq=None)
+        for start in range(0, len(self.text), self.chunk_chars):
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            delta = SimpleNamespace(content=self.text[start:start + self.chunk_chars], tool_calls=None)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None, x_groq=None)
+        yield SimpleNamespace(choices=[], usage=None, x_groq=SimpleNamespace(usage=self.usage))
+
+
+class FakeCompletions:
+    def __init__(self, latency_ms=300.0, jitter_ms=50.0, token_delay_ms=0.0, chunk_chars=8, seed=0):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.token_delay = token_delay_ms / 1000
+        self.chunk_chars = chunk_chars
+        self.random = random.Random(seed)
+        self.calls = 0
+
+    async def create(self, messages, model, temperature=None, max_tokens=None, stream=False,
+                     tools=None, tool_choice=None, **kwargs):
+        self.calls += 1
+        delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+        if delay:
+            await asyncio.sleep(delay)
+
+        last = messages[-1]
+        tool_calls = []
+        if tools and tool_choice != "none" and last.get("role") == "user":
+            tool_calls = plan_tool_calls(last.get("content") or "")
+        text = "" if tool_calls else plan_answer(messages)
+        usage = _usage(messages, text)
+
+        if stream:
+            return FakeStream(text, tool_calls, usage, self.chunk_chars, self.token_delay)
+        message = SimpleNamespace(role="assistant", content=text or None, tool_calls=tool_calls or None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason="stop")], usage=usage)
+
+
+class FakeGroq:
+    """Drop-in for `main.groq_client` (only chat.completions.create is used)."""
+
+    def __init__(self, **options):
+        self.chat = SimpleNamespace(completions=FakeCompletions(**options))
@@ -0,0 +1,465 @@
+"""
+Offline benchmark for the chat API, the history endpoints, the listing read path and the CSV loader.
+
+Runs the FastAPI app in-process against a freshly seeded database (SQLite by
+default, or an empty database given with --database-url) with a deterministic fake
+LLM, and writes throughput and latency percentiles as JSON:
+
+    python -m backend.bench.run --output bench-results.json
+    python -m backend.bench.run --requests 500 --concurrency 32 --llm-latency-ms 0
+    python -m backend.bench.run compare before.json after.json
+
+Run from the repository root. Needs aiosqlite and httpx (bench/requirements.txt).
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+SCENARIOS = ["chat", "chat_stream", "history", "read_path", "loader"]
+RESULTS_SCHEMA_VERSION = 1
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def latency_summary(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    ms = lambda value: round(value * 1000, 3) if value is not None else None
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "mean_ms": ms(sum(latencies) / len(latencies)) if latencies else None,
+        "p50_ms": ms(percentile(latencies, 0.50)),
+        "p90_ms": ms(percentile(latencies, 0.90)),
+        "p99_ms": ms(percentile(latencies, 0.99)),
+        "max_ms": ms(latencies[-1]) if latencies else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+# --- Workloads ---
+
+def chat_workload(tables, conversations_per_user, count, seed):
+    """Deterministic mix of order, multi-order, SKU, product and small-talk turns."""
+    rng = random.Random(seed)
+    orders_by_user = {}
+    for order in tables["orders"]:
+        orders_by_user.setdefault(order["user_id"], []).append(order["order_id"])
+    products = tables["products"]
+    requests = []
+    for _ in range(count):
+        user_id = rng.choice(tables["users"])["id"]
+        orders = orders_by_user.get(user_id) or [1]
+        kind = rng.random()
+        if kind < 0.40:
+            message = f"Where is my order {rng.choice(orders)}?"
+        elif kind < 0.60:
+            first, second = rng.choice(orders), rng.choice(orders)
+            message = f"Can you check order {first} and order {second}?"
+        elif kind < 0.75:
+            message = f"What is the price of SKU {rng.choice(products)['sku']}?"
+        elif kind < 0.85:
+            message = f"Do you have {rng.choice(products)['name'].split()[-2].lower()}?"
+        else:
+            message = "Hi there, what can you help me with?"
+        conversation_id = None
+        if conversations_per_user and rng.random() < 0.5:
+            conversation_id = (user_id - 1) * conversations_per_user + rng.randint(1, conversations_per_user)
+        requests.append({"user_id": user_id, "message": message, "conversation_id": conversation_id})
+    return requests
+
+
+def history_workload(tables, conversations_per_user, count, seed):
+    rng = random.Random(seed)
+    requests = []
+    for _ in range(count):
+        user_id = rng.choice(tables["users"])["id"]
+        if rng.random() < 0.5 or not conversations_per_user:
+            requests.append(f"/users/{user_id}/conversations")
+        else:
+            conversation_id = (user_id - 1) * conversations_per_user + rng.randint(1, conversations_per_user)
+            requests.append(f"/conversations/{conversation_id}/messages")
+    return requests
+
+
+async def run_closed_loop(items, concurrency, send):
+    """`concurrency` workers issue `send(item)` back to back; returns (latencies, errors, elapsed)."""
+    queue = list(reversed(items))
+    latencies, errors = [], 0
+
+    async def worker():
+        nonlocal errors
+        while queue:
+            item = queue.pop()
+            start = time.perf_counter()
+            try:
+                ok = await send(item)
+            except Exception as e:
+                log(f"request failed: {e!r}")
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+async def run_read_path(args, tables):
+    """
+    Rows/second of the listing endpoints' query + serialization, called directly (no HTTP):
+    the previous path (rows validated through the from_attributes response models and rendered
+    like FastAPI's JSONResponse) against json_page (Core tuples + orjson). The previous path
+    loaded ORM entities for users and messages, and column tuples for conversations.
+    """
+    from sqlalchemy import select
+    from pydantic import TypeAdapter
+    from backend.backend import main, models, schemas
+    from backend.backend.database import AsyncSessionLocal
+    from backend.backend.pagination import json_page
+
+    conversation_ids = list(range(1, len(tables["users"]) * args.conversations_per_user + 1))
+    listings = {
+        # name: (schema, columns, previous select and how it was loaded, scopes, filter, order, endpoint's default limit)
+        "users": (schemas.User, main.USER_COLUMNS, select(models.User), "scalars", list(range(0, len(tables["users"]), 100)),
+                  lambda after_id: models.User.id > after_id, [models.User.id], 100),
+        "conversations": (schemas.ConversationSummary, main.CONVERSATION_SUMMARY_COLUMNS,
+                          select(*main.CONVERSATION_SUMMARY_COLUMNS), "execute",
+                          [user["id"] for user in tables["users"]],
+                          lambda user_id: models.Conversation.user_id == user_id,
+                          [models.Conversation.start_time.desc(), models.Conversation.id.desc()], 50),
+        "messages": (schemas.Message, main.MESSAGE_COLUMNS, select(models.Message), "scalars", conversation_ids,
+                     lambda conversation_id: models.Message.conversation_id == conversation_id,
+                     [models.Message.timestamp, models.Message.id], 500),
+    }
+    results = {}
+    for listing, (schema, columns, previous, load, scopes, where, order_by, limit) in listings.items():
+        adapter = TypeAdapter(list[schema])
+        fields = list(schema.model_fields)
+
+        async def previous_page(db, scope):
+            query = previous.where(where(scope)).order_by(*order_by).limit(limit + 1)
+            rows = (await getattr(db, load)(query)).all()[:limit]
+            return json.dumps(adapter.dump_python(adapter.validate_python(rows, from_attributes=True), mode="json"),
+                              ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+        async def lean_page(db, scope):
+            query = select(*columns).where(where(scope)).order_by(*order_by).limit(limit + 1)
+            return (await json_page(db, fields, query, limit)).body
+
+        bodies = {}
+        for variant, page in (("orm", previous_page), ("lean", lean_page)):
+            async def one_pass():
+                async with AsyncSessionLocal() as db:
+                    return [await page(db, scope) for scope in scopes]
+            await one_pass()  # warm-up: statement caches, SQLite page cache
+            started = time.perf_counter()
+            bodies[variant] = [body for _ in range(args.read_repeat) for body in await one_pass()]
+            elapsed = time.perf_counter() - started
+            rows = sum(len(json.loads(body)) for body in bodies[variant])
+            results[f"read_{listing}_{variant}"] = {"rows": rows, "elapsed_s": round(elapsed, 3),
+                                                    "rows_per_s": round(rows / elapsed, 1) if elapsed else None}
+        if [json.loads(body) for body in bodies["orm"]] != [json.loads(body) for body in bodies["lean"]]:
+            log(f"read_path {listing}: the two paths returned different bodies")
+        orm, lean = results[f"read_{listing}_orm"], results[f"read_{listing}_lean"]
+        log(f"read_path {listing}: {orm['rows_per_s']} rows/s (previous) -> {lean['rows_per_s']} rows/s "
+            f"(Core + orjson), x{lean['rows_per_s'] / orm['rows_per_s']:.1f}")
+    return results
+
+
+def stage_breakdown(before, after):
+    """Mean server-side time per chat stage between two CHAT_STAGE_SECONDS snapshots."""
+    stages = {}
+    for key, (count, total) in after.items():
+        previous_count, previous_total = before.get(key, (0, 0.0))
+        if count > previous_count:
+            stages[key[0]] = {"count": count - previous_count,
+                              "mean_ms": round((total - previous_total) / (count - previous_count) * 1000, 3)}
+    return stages
+
+
+async def run_api_scenarios(args, tables, scenarios):
+    import httpx
+    from backend.backend import main, telemetry
+    from .fake_llm import FakeGroq
+
+    main.groq_client = FakeGroq(latency_ms=args.llm_latency_ms, jitter_ms=args.llm_jitter_ms,
+                                token_delay_ms=args.token_delay_ms, seed=args.seed)
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+    # App logs (one JSON line per chat request) would drown the report; they are discarded.
+    with contextlib.redirect_stdout(io.StringIO()):
+        async with main.app.router.lifespan_context(main.app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+                async def post_chat(path, body):
+                    response = await client.post(path, json=body)
+                    return response.status_code == 200
+
+                async def get(path):
+                    response = await client.get(path)
+                    return response.status_code == 200
+
+                for name in scenarios:
+                    if name == "read_path":
+                        results.update(await run_read_path(args, tables))
+                        continue
+                    if name in ("chat", "chat_stream"):
+                        path = "/api/chat" if name == "chat" else "/api/chat/stream"
+                        items = chat_workload(tables, args.conversations_per_user, args.warmup + args.requests,
+                                              args.seed + SCENARIOS.index(name))
+                        send = lambda body, path=path: post_chat(path, body)
+                    elif name == "history":
+                        items = history_workload(tables, args.conversations_per_user, args.warmup + args.requests,
+                                                 args.seed + SCENARIOS.index(name))
+                        send = get
+                    else:
+                        continue
+                    await run_closed_loop(items[:args.warmup], args.concurrency, send)
+                    before = telemetry.CHAT_STAGE_SECONDS.totals()
+                    fast_path_before = (main.fast_path.turns, main.fast_path.answered)
+                    latencies, errors, elapsed = await run_closed_loop(items[args.warmup:], args.concurrency, send)
+                    results[name] = latency_summary(latencies, errors, elapsed)
+                    turns = main.fast_path.turns - fast_path_before[0]
+                    if turns:
+                        results[name]["fast_path_fraction"] = round((main.fast_path.answered - fast_path_before[1]) / turns, 4)
+                    stages = stage_breakdown(before, telemetry.CHAT_STAGE_SECONDS.totals())
+                    if stages:
+                        results[name]["stages"] = stages
+                    log(f"{name}: {results[name]['throughput_rps']} req/s, p50 {results[name]['p50_ms']} ms, "
+                        f"p99 {results[name]['p99_ms']} ms, {errors} errors")
+    return results
+
+
+def run_loader_pipeline(data_dir, chunk_size):
+    """
+    Times the loader's per-chunk work (read, dedupe, FK filter, date parsing, row
+    conversion) for every table without a MySQL server.
+    """
+    data_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+    if data_path not in sys.path:
+        sys.path.insert(0, data_path)
+    import numpy as np
+    import pandas as pd
+    from bulk_loader import TABLE_SPECS, chunk_rows, key_columns, prepare_chunk
+    from load_data import filter_orphans, sorted_keys
+
+    keys, done, tables = {}, set(), {}
+    order = []
+    while len(order) < len(TABLE_SPECS):
+        ready = [name for name in TABLE_SPECS if name not in done
+                 and all(dep in done for dep in TABLE_SPECS[name]["depends_on"])]
+        order.extend(sorted(ready))
+        done.update(ready)
+
+    started = time.perf_counter()
+    for table_name in order:
+        spec = TABLE_SPECS[table_name]
+        table_started = time.perf_counter()
+        rows_read = rows_out = 0
+        seen = set()
+        produced = {column: [] for column in key_columns(table_name)}
+        fk_keys = {column: keys.get(target, sorted_keys([])) for column, target in spec.get("fk_filters", {}).items()}
+        for chunk in pd.read_csv(os.path.join(data_dir, spec["file"]), chunksize=chunk_size):
+            rows_read += len(chunk)
+            dedupe_on = spec.get("dedupe_on")
+            if dedupe_on:
+                chunk = chunk.drop_duplicates(subset=[dedupe_on], keep="first")
+                chunk = chunk[~chunk[dedupe_on].isin(seen)]
+                seen.update(chunk[dedupe_on].dropna())
+            if fk_keys:
+                chunk, _ = filter_orphans(chunk, fk_keys)
+            chunk = prepare_chunk(chunk, spec)
+            rows_out += len(chunk_rows(chunk))
+            for column in produced:
+                produced[column].append(sorted_keys(chunk[column]))
+        for column, arrays in produced.items():
+            keys[(table_name, column)] = sorted_keys(np.concatenate(arrays)) if arrays else sorted_keys([])
+        elapsed = time.perf_counter() - table_started
+        tables[table_name] = {"rows_read": rows_read, "rows_out": rows_out, "duration_s": round(elapsed, 4),
+                              "rows_per_s": round(rows_read / elapsed, 1) if elapsed else None}
+    elapsed = time.perf_counter() - started
+    total = sum(table["rows_read"] for table in tables.values())
+    return {"mode": "pipeline", "duration_s": round(elapsed, 4), "rows": total,
+            "rows_per_s": round(total / elapsed, 1) if elapsed else None, "tables": tables}
+
+
+def run_loader_mysql(data_dir, chunk_size, workers, method):
+    """Full streaming load into the MySQL database configured in data/load_data.py."""
+    data_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+    if data_path not in sys.path:
+        sys.path.insert(0, data_path)
+    from bulk_loader import run_streaming_load
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        stats = run_streaming_load(chunk_size=chunk_size, max_workers=workers, method=method, reset=True,
+                                   data_dir=data_dir)
+    elapsed = time.perf_counter() - started
+    rows = sum(table["inserted"] for table in stats.values())
+    return {"mode": f"mysql-{method}", "duration_s": round(elapsed, 4), "rows": rows,
+            "rows_per_s": round(rows / elapsed, 1) if elapsed else None,
+            "tables": {name: {"inserted": table["inserted"]} for name, table in stats.items()}}
+
+
+def configure_environment(args, workdir):
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+        os.environ["ASYNC_DATABASE_URL"] = args.async_database_url or args.database_url
+    else:
+        path = os.path.join(workdir, "bench.db")
+        if os.path.exists(path):
+            os.remove(path)
+        os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+        os.environ["ASYNC_DATABASE_URL"] = f"sqlite+aiosqlite:///{path}"
+    os.environ.setdefault("GROQ_API_KEY", "offline-benchmark")
+    # Every turn should pay the fake LLM latency unless the cache is what's being measured.
+    os.environ["LLM_CACHE_BACKEND"] = "memory" if args.llm_cache else "none"
+    os.environ["FAST_PATH_ENABLED"] = "true" if args.fast_path else "false"
+
+
+def run(args):
+    from .dataset import generate, seed_database, write_csvs
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench-")
+    os.makedirs(workdir, exist_ok=True)
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(sorted(unknown))} (expected {', '.join(SCENARIOS)})")
+
+    tables = generate(users=args.users, products=args.products, orders_per_user=args.orders_per_user, seed=args.seed)
+    report = {
+        "schema_version": RESULTS_SCHEMA_VERSION,
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("command", "files", "output", "workdir")},
+        "dataset": {name: len(rows) for name, rows in tables.items()},
+        "results": {},
+    }
+
+    api_scenarios = [name for name in scenarios if name != "loader"]
+    if api_scenarios:
+        configure_environment(args, workdir)
+        with contextlib.redirect_stdout(io.StringIO()):
+            from backend.backend import migrations
+            from backend.backend.database import engine
+            migrations.upgrade(engine)
+            report["dataset"].update(seed_database(engine, tables, args.conversations_per_user,
+                                                   args.messages_per_conversation, args.seed))
+        log(f"Seeded {report['dataset']} into {os.environ['DATABASE_URL']}")
+        report["results"].update(asyncio.run(run_api_scenarios(args, tables, api_scenarios)))
+
+    if "loader" in scenarios:
+        data_dir = os.path.join(workdir, "csv")
+        write_csvs(tables, data_dir, seed=args.seed)
+        loader = run_loader_pipeline(data_dir, args.chunk_size)
+        if args.loader_mysql:
+            loader = {"pipeline": loader, "mysql": run_loader_mysql(data_dir, args.chunk_size, args.loader_workers,
+                                                                    args.loader_method)}
+        report["results"]["loader"] = loader
+        log(f"loader: {loader.get('rows_per_s') or loader['pipeline']['rows_per_s']} rows/s")
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as handle:
+            handle.write(output + "\n")
+        log(f"Results written to {args.output}")
+    else:
+        print(output)
+    return report
+
+
+def compare(before_path, after_path):
+    """Prints the relative change of the headline numbers between two result files."""
+    with open(before_path) as handle:
+        before = json.load(handle)["results"]
+    with open(after_path) as handle:
+        after = json.load(handle)["results"]
+    metrics = ["throughput_rps", "p50_ms", "p99_ms", "rows_per_s"]
+    print(f"{'scenario':<14}{'metric':<16}{'before':>12}{'after':>12}{'change':>10}")
+    for name in sorted(set(before) & set(after)):
+        for metric in metrics:
+            old, new = before[name].get(metric), after[name].get(metric)
+            if old is None or new is None:
+                continue
+            change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+            print(f"{name:<14}{metric:<16}{old:>12}{new:>12}{change:>10}")
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", nargs="?", default="run", choices=["run", "compare"])
+    parser.add_argument("files", nargs="*", help="compare: the two result files (before, after)")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated subset of " + ", ".join(SCENARIOS))
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    parser.add_argument("--workdir", help="where the SQLite file and CSVs go (default: a temp dir)")
+    parser.add_argument("--database-url", help="empty database to seed instead of SQLite (sync SQLAlchemy URL)")
+    parser.add_argument("--async-database-url", help="async URL for the same database (default: --database-url)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--products", type=int, default=300)
+    parser.add_argument("--orders-per-user", type=int, default=3)
+    parser.add_argument("--conversations-per-user", type=int, default=2)
+    parser.add_argument("--messages-per-conversation", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per API scenario")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=50.0)
+    parser.add_argument("--token-delay-ms", type=float, default=0.0, help="delay between streamed chunks")
+    parser.add_argument("--llm-cache", action="store_true", help="keep the LLM response cache enabled")
+    parser.add_argument("--fast-path", action="store_true", help="answer order/SKU lookups without the LLM")
+    parser.add_argument("--read-repeat", type=int, default=3, help="read_path: passes over every listing")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="loader chunk size")
+    parser.add_argument("--loader-mysql", action="store_true",
+                        help="also run the full streaming load into the MySQL database from data/load_data.py")
+    parser.add_argument("--loader-workers", type=int, default=4)
+    parser.add_argument("--loader-method", choices=["insert", "infile"], default="insert")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    if args.command == "compare":
+        if len(args.files) != 2:
+            raise SystemExit("compare needs two result files: before.json after.json")
+        compare(*args.files)
+        return 0
+    run(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,361 @@
+"""
+Streaming bulk loader for the e-commerce CSVs.
+
+Each CSV is read in chunks, so no table is ever fully materialized in memory.
+Chunks are written with multi-row INSERTs or LOAD DATA LOCAL INFILE. Tables with
+no unloaded dependency are loaded concurrently, each on its own connection.
+
+Every chunk is committed in the same transaction as its row in `load_checkpoints`,
+so a failed or interrupted run resumes after the last committed chunk instead of
+leaving a table half-loaded with no record of where it stopped.
+"""
+import csv
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import mysql.connector
+import numpy as np
+import pandas as pd
+from mysql.connector import Error
+
+from load_data import DB_CONFIG, filter_orphans, get_existing_ids, report_rejections, sorted_keys
+
+CHUNK_SIZE = 50000
+MAX_WORKERS = 4
+# Per-chunk key arrays of loaded tables, kept alongside the checkpoints for resumed runs.
+KEYS_DIR = '.load_checkpoints'
+
+# Load order is derived from `depends_on`; `fk_filters` drops rows whose key is not loaded.
+TABLE_SPECS = {
+    'distribution_centers': {
+        'file': 'distribution_centers.csv',
+        'depends_on': [],
+    },
+    'products': {
+        'file': 'products.csv',
+        'depends_on': ['distribution_centers'],
+    },
+    'users': {
+        'file': 'users.csv',
+        'depends_on': [],
+        'date_cols': ['created_at'],
+        'dedupe_on': 'email',
+    },
+    'orders': {
+        'file': 'orders.csv',
+        'depends_on': ['users'],
+        'columns': ['order_id', 'user_id', 'status', 'gender', 'created_at', 'returned_at',
+                    'shipped_at', 'delivered_at', 'num_of_item'],
+        'date_cols': ['created_at', 'returned_at', 'shipped_at', 'delivered_at'],
+        'fk_filters': {'user_id': ('users', 'id')},
+    },
+    'inventory_items': {
+        'file': 'inventory_items.csv',
+        'depends_on': ['products'],
+        'columns': ['id', 'product_id', 'created_at', 'sold_at', 'cost', 'product_category',
+                    'product_name', 'product_brand', 'product_retail_price', 'product_department',
+                    'product_sku', 'product_distribution_center_id'],
+        'date_cols': ['created_at', 'sold_at'],
+    },
+    'order_items': {
+        'file': 'order_items.csv',
+        'depends_on': ['orders', 'users', 'products', 'inventory_items'],
+        'columns': ['id', 'order_id', 'user_id', 'product_id', 'inventory_item_id', 'status',
+                    'created_at', 'shipped_at', 'delivered_at', 'returned_at', 'sale_price'],
+        'date_cols': ['created_at', 'shipped_at', 'delivered_at', 'returned_at'],
+        'fk_filters': {'order_id': ('orders', 'order_id'), 'user_id': ('users', 'id'),
+                       'product_id': ('products', 'id'), 'inventory_item_id': ('inventory_items', 'id')},
+    },
+}
+
+CHECKPOINT_TABLE_DDL = """
+CREATE TABLE IF NOT EXISTS load_checkpoints (
+    table_name VARCHAR(64) PRIMARY KEY,
+    rows_consumed BIGINT NOT NULL DEFAULT 0,
+    rows_inserted BIGINT NOT NULL DEFAULT 0,
+    chunks_done INT NOT NULL DEFAULT 0,
+    completed TINYINT(1) NOT NULL DEFAULT 0,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+)
+"""
+
+CHECKPOINT_UPSERT = (
+    "INSERT INTO load_checkpoints (table_name, rows_consumed, rows_inserted, chunks_done, completed) "
+    "VALUES (%s, %s, %s, %s, %s) "
+    "ON DUPLICATE KEY UPDATE rows_consumed = VALUES(rows_consumed), rows_inserted = VALUES(rows_inserted), "
+    "chunks_done = VALUES(chunks_done), completed = VALUES(completed)"
+)
+
+
+def connect(method='insert'):
+    config = dict(DB_CONFIG)
+    if method == 'infile':
+        config['allow_local_infile'] = True
+    return mysql.connector.connect(**config)
+
+
+def ensure_checkpoint_table(connection):
+    cursor = connection.cursor()
+    cursor.execute(CHECKPOINT_TABLE_DDL)
+    connection.commit()
+    cursor.close()
+
+
+def read_checkpoint(connection, table_name):
+    cursor = connection.cursor(dictionary=True)
+    cursor.execute("SELECT * FROM load_checkpoints WHERE table_name = %s", (table_name,))
+    row = cursor.fetchone()
+    cursor.close()
+    return row or {'rows_consumed': 0, 'rows_inserted': 0, 'chunks_done': 0, 'completed': 0}
+
+
+def reset_checkpoints(connection, tables):
+    cursor = connection.cursor()
+    for table_name in tables:
+        cursor.execute("DELETE FROM load_checkpoints WHERE table_name = %s", (table_name,))
+    connection.commit()
+    cursor.close()
+
+
+def prepare_chunk(chunk, spec):
+    if spec.get('columns'):
+        chunk = chunk[spec['columns']]
+    converted = {}
+    for col in spec.get('date_cols', []):
+        if col in chunk.columns:
+            dates = pd.to_datetime(chunk[col], errors='coerce')
+            if getattr(dates.dt, 'tz', None) is not None:
+                dates = dates.dt.tz_convert(None)
+            converted[col] = dates
+    return chunk.assign(**converted) if converted else chunk
+
+
+def chunk_rows(chunk):
+    # One object-dtype pass turns NaN/NaT into None without extra DataFrame copies.
+    values = chunk.to_numpy(dtype=object)
+    values[pd.isna(values)] = None
+    return list(map(tuple, values))
+
+
+def insert_chunk(cursor, table_name, chunk):
+    columns = list(chunk.columns)
+    placeholders = ', '.join(['%s'] * len(columns))
+    # mysql-connector rewrites executemany on a plain INSERT into one multi-row INSERT.
+    query = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders})"
+    rows = chunk_rows(chunk)
+    if rows:
+        cursor.executemany(query, rows)
+    return len(rows)
+
+
+def infile_chunk(cursor, table_name, chunk):
+    columns = list(chunk.columns)
+    fd, path = tempfile.mkstemp(suffix='.csv', prefix=f'{table_name}_')
+    os.close(fd)
+    try:
+        # With ESCAPED BY '' MySQL reads the bare word NULL as SQL NULL and leaves backslashes alone.
+        chunk.to_csv(path, index=False, header=False, na_rep='NULL', quoting=csv.QUOTE_MINIMAL,
+                     date_format='%Y-%m-%d %H:%M:%S')
+        cursor.execute(
+            f"LOAD DATA LOCAL INFILE '{path}' INTO TABLE {table_name} "
+            "FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' ESCAPED BY '' "
+            f"LINES TERMINATED BY '\\n' ({', '.join(columns)})"
+        )
+        return len(chunk)
+    finally:
+        os.remove(path)
+
+
+def key_file(keys_dir, table_name, column, chunk_no):
+    return os.path.join(keys_dir, f"{table_name}.{column}.{chunk_no:06d}.npy")
+
+
+def key_columns(table_name):
+    """Columns of `table_name` that other tables filter their foreign keys against."""
+    return sorted({column for spec in TABLE_SPECS.values()
+                   for target_table, column in spec.get('fk_filters', {}).values()
+                   if target_table == table_name})
+
+
+class KeyRegistry:
+    """
+    Sorted int64 key arrays of the tables loaded so far, shared between loader threads.
+
+    Keys come from the chunks this loader committed (saved per chunk next to the
+    checkpoints, so a resumed run can rebuild them). MySQL is only queried when a
+    table was loaded some other way and no key files exist.
+    """
+
+    def __init__(self, method, keys_dir):
+        self.method = method
+        self.keys_dir = keys_dir
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def publish(self, table_name, column, keys):
+        with self._lock:
+            self._keys[(table_name, column)] = keys
+
+    def load_chunk_keys(self, table_name, column, chunks_done):
+        paths = [key_file(self.keys_dir, table_name, column, n) for n in range(1, chunks_done + 1)]
+        if not all(os.path.exists(path) for path in paths):
+            return None
+        return [np.load(path) for path in paths]
+
+    def get(self, table_name, column):
+        with self._lock:
+            if (table_name, column) not in self._keys:
+                connection = connect(self.method)
+                try:
+                    checkpoint = read_checkpoint(connection, table_name)
+                    arrays = self.load_chunk_keys(table_name, column, checkpoint['chunks_done'])
+                    if checkpoint['completed'] and arrays is not None:
+                        keys = sorted_keys(np.concatenate(arrays)) if arrays else sorted_keys([])
+                    else:
+                        print(f"No key files for {table_name}.{column}; reading them from MySQL.")
+                        keys = sorted_keys(list(get_existing_ids(connection, table_name, column)))
+                finally:
+                    connection.close()
+                self._keys[(table_name, column)] = keys
+            return self._keys[(table_name, column)]
+
+    def reset(self, tables):
+        if not os.path.isdir(self.keys_dir):
+            return
+        for name in os.listdir(self.keys_dir):
+            if name.split('.', 1)[0] in tables:
+                os.remove(os.path.join(self.keys_dir, name))
+
+
+def load_table(table_name, spec, key_registry, chunk_size=CHUNK_SIZE, method='insert', data_dir='.'):
+    connection = connect(method)
+    writer = infile_chunk if method == 'infile' else insert_chunk
+    stats = {'inserted': 0, 'duplicates': 0, 'rejected': {column: 0 for column in spec.get('fk_filters', {})}}
+    stats['rejected']['total'] = 0
+    try:
+        checkpoint = read_checkpoint(connection, table_name)
+        if checkpoint['completed']:
+            print(f"[{table_name}] already loaded ({checkpoint['rows_inserted']} rows), skipping.")
+            stats['inserted'] = checkpoint['rows_inserted']
+            return stats
+
+        file_path = os.path.join(data_dir, spec['file'])
+        rows_consumed = checkpoint['rows_consumed']
+        rows_inserted = checkpoint['rows_inserted']
+        chunks_done = checkpoint['chunks_done']
+        if rows_consumed:
+            print(f"[{table_name}] resuming after {rows_consumed} CSV rows ({chunks_done} chunks).")
+
+        seen = set()
+        dedupe_on = spec.get('dedupe_on')
+        if dedupe_on and rows_consumed:
+            # Rebuild the dedupe set from the already-loaded prefix of the file.
+            seen.update(pd.read_csv(file_path, usecols=[dedupe_on], nrows=rows_consumed)[dedupe_on].dropna())
+
+        produced = {}
+        for column in key_columns(table_name):
+            produced[column] = key_registry.load_chunk_keys(table_name, column, chunks_done)
+            if produced[column] is None:
+                raise RuntimeError(f"Key files for {table_name}.{column} are missing; rerun with --reset.")
+
+        fk_keys = {column: key_registry.get(*target) for column, target in spec.get('fk_filters', {}).items()}
+
+        reader = pd.read_csv(file_path, chunksize=chunk_size,
+                             skiprows=range(1, rows_consumed + 1) if rows_consumed else None)
+        cursor = connection.cursor()
+        rows_read = 0
+        for chunk in reader:
+            chunk_no = chunks_done + 1
+            raw_rows = len(chunk)
+            rows_read += raw_rows
+            if dedupe_on:
+                chunk = chunk.drop_duplicates(subset=[dedupe_on], keep='first')
+                chunk = chunk[~chunk[dedupe_on].isin(seen)]
+                seen.update(chunk[dedupe_on].dropna())
+                stats['duplicates'] += raw_rows - len(chunk)
+            if fk_keys:
+                chunk, rejected = filter_orphans(chunk, fk_keys)
+                for column, count in rejected.items():
+                    stats['rejected'][column] += count
+            chunk = prepare_chunk(chunk, spec)
+
+            try:
+                inserted = writer(cursor, table_name, chunk) if len(chunk) else 0
+                rows_consumed += raw_rows
+                rows_inserted += inserted
+                chunks_done = chunk_no
+                # Key files are written before the commit: an uncommitted chunk's file is simply
+                # overwritten when the chunk is retried, and never read past chunks_done.
+                for column in produced:
+                    chunk_keys = sorted_keys(chunk[column])
+                    np.save(key_file(key_registry.keys_dir, table_name, column, chunks_done), chunk_keys)
+                    produced[column].append(chunk_keys)
+                cursor.execute(CHECKPOINT_UPSERT, (table_name, rows_consumed, rows_inserted, chunks_done, 0))
+                connection.commit()
+            except Error as e:
+                connection.rollback()
+                print(f"[{table_name}] chunk {chunk_no} failed and was rolled back: {e}")
+                raise
+            print(f"[{table_name}] chunk {chunks_done}: {inserted} rows ({rows_inserted} total).")
+
+        cursor.execute(CHECKPOINT_UPSERT, (table_name, rows_consumed, rows_inserted, chunks_done, 1))
+        connection.commit()
+        cursor.close()
+
+        for column, arrays in produced.items():
+            key_registry.publish(table_name, column, sorted_keys(np.concatenate(arrays)) if arrays else sorted_keys([]))
+        stats['inserted'] = rows_inserted
+        if fk_keys:
+            report_rejections(table_name, rows_read, stats['rejected'])
+        return stats
+    finally:
+        connection.close()
+
+
+def run_streaming_load(tables=None, chunk_size=CHUNK_SIZE, max_workers=MAX_WORKERS, method='insert',
+                       reset=False, data_dir='.'):
+    """Loads `tables` (default: all) in FK-dependency order, running independent tables in parallel."""
+    tables = list(tables or TABLE_SPECS)
+    key_registry = KeyRegistry(method, os.path.join(data_dir, KEYS_DIR))
+    os.makedirs(key_registry.keys_dir, exist_ok=True)
+    connection = connect(method)
+    try:
+        ensure_checkpoint_table(connection)
+        if reset:
+            reset_checkpoints(connection, tables)
+            key_registry.reset(tables)
+    finally:
+        connection.close()
+
+    pending = set(tables)
+    done = set(TABLE_SPECS) - pending
+    results = {}
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running = {}
+        while pending or running:
+            for table_name in sorted(pending):
+                if all(dep in done for dep in TABLE_SPECS[table_name]['depends_on']):
+                    future = executor.submit(load_table, table_name, TABLE_SPECS[table_name], key_registry,
+                                             chunk_size, method, data_dir)
+                    running[future] = table_name
+                    pending.discard(table_name)
+            if not running:
+                raise RuntimeError(f"Unresolvable table dependencies: {sorted(pending)}")
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                table_name = running.pop(future)
+                # Re-raises the chunk error; committed chunks stay checkpointed for the next run.
+                results[table_name] = future.result()
+                done.add(table_name)
+
+    print(f"--- Streaming load finished in {time.perf_counter() - started:.1f}s ---")
+    for table_name, stats in results.items():
+        print(f"  {table_name}: {stats['inserted']} rows, {stats['duplicates']} duplicates, "
+              f"{stats['rejected']['total']} FK rejections")
+    return results
@@ -0,0 +1,161 @@
+"""
+Read-optimized columnar snapshot of products, orders, order_items and inventory_items.
+
+Each table is a directory of .npy files, one per column, which the backend
+memory-maps (backend/backend/snapshot.py). Strings are dictionary-encoded
+(`<col>.codes.npy` int32, -1 for NULL, plus `<col>.values.npy`), timestamps are
+datetime64[s] in UTC (NaT for NULL), and rows are sorted by the table's lookup key.
+
+Every snapshot is written to a new version directory with a manifest.json; the
+CURRENT file is then replaced atomically, so readers switch versions without
+downtime and never see a half-written snapshot. Older versions are pruned. Each
+version also carries the product search index (product_embeddings.py).
+
+    python columnar_snapshot.py            # export the current MySQL tables
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from product_embeddings import build_product_index
+
+FORMAT_VERSION = 1
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'snapshot'))
+KEEP_VERSIONS = 2
+
+# column -> kind ('int', 'float', 'datetime', 'str'); `sort` is the row order, `indexes` extra permutations.
+SNAPSHOT_TABLES = {
+    'products': {
+        'columns': {'id': 'int', 'name': 'str', 'category': 'str', 'brand': 'str', 'department': 'str',
+                    'sku': 'str', 'retail_price': 'float', 'cost': 'float'},
+        'sort': ['id'],
+    },
+    'orders': {
+        'columns': {'order_id': 'int', 'user_id': 'int', 'status': 'str', 'num_of_item': 'int',
+                    'created_at': 'datetime', 'shipped_at': 'datetime', 'delivered_at': 'datetime',
+                    'returned_at': 'datetime'},
+        'sort': ['order_id'],
+        # A user's orders, newest first: rows of orders[by_user], keyed by by_user.user_id.
+        'indexes': {'by_user': ('user_id', 'created_at')},
+    },
+    'order_items': {
+        'columns': {'id': 'int', 'order_id': 'int', 'user_id': 'int', 'product_id': 'int', 'status': 'str',
+                    'created_at': 'datetime', 'sale_price': 'float'},
+        'sort': ['order_id', 'id'],
+    },
+    'inventory_items': {
+        'columns': {'id': 'int', 'product_id': 'int', 'created_at': 'datetime', 'sold_at': 'datetime',
+                    'cost': 'float'},
+        'sort': ['product_id', 'id'],
+    },
+}
+
+
+def encode_column(series, kind):
+    """Returns {file suffix: array} for one column."""
+    if kind == 'int':
+        # Missing integer keys become -1; every key column in these tables is NOT NULL in practice.
+        return {'': pd.to_numeric(series, errors='coerce').fillna(-1).to_numpy(dtype=np.int64)}
+    if kind == 'float':
+        return {'': pd.to_numeric(series, errors='coerce').to_numpy(dtype=np.float64)}
+    if kind == 'datetime':
+        dates = pd.to_datetime(series, errors='coerce', utc=True).dt.tz_convert(None)
+        return {'': dates.to_numpy(dtype='datetime64[s]')}
+    codes, uniques = pd.factorize(series.astype(object).where(series.notna(), None))
+    values = np.array([str(value) for value in uniques], dtype=str) if len(uniques) else np.array([], dtype='<U1')
+    return {'.codes': codes.astype(np.int32), '.values': values}
+
+
+def write_table(frame, spec, table_dir):
+    frame = frame.sort_values(spec['sort'], kind='stable').reset_index(drop=True)
+    os.makedirs(table_dir)
+    for column, kind in spec['columns'].items():
+        for suffix, array in encode_column(frame[column], kind).items():
+            np.save(os.path.join(table_dir, f'{column}{suffix}.npy'), array, allow_pickle=False)
+    for name, (key, order_by) in spec.get('indexes', {}).items():
+        keys = pd.to_numeric(frame[key], errors='coerce').fillna(-1).to_numpy(dtype=np.int64)
+        order_keys = pd.to_datetime(frame[order_by], errors='coerce', utc=True).dt.tz_convert(None)
+        order_keys = order_keys.to_numpy(dtype='datetime64[s]').astype(np.int64)
+        # np.lexsort sorts by the last key first; negated timestamps give newest first.
+        permutation = np.lexsort((-order_keys, keys))
+        np.save(os.path.join(table_dir, f'_{name}.npy'), permutation.astype(np.int64))
+        np.save(os.path.join(table_dir, f'_{name}.{key}.npy'), keys[permutation])
+    return len(frame)
+
+
+def write_snapshot(frames, root=SNAPSHOT_DIR, source='load', keep=KEEP_VERSIONS):
+    """Writes `frames` (table name -> DataFrame) as a new version and makes it current; returns the version."""
+    created_at = datetime.now(timezone.utc)
+    version = f"{created_at.strftime('%Y%m%dT%H%M%SZ')}-{uuid.uuid4().hex[:8]}"
+    started = time.perf_counter()
+    os.makedirs(root, exist_ok=True)
+    staging = os.path.join(root, f'.{version}.tmp')
+    tables = {}
+    try:
+        for table_name, spec in SNAPSHOT_TABLES.items():
+            rows = write_table(frames[table_name], spec, os.path.join(staging, table_name))
+            tables[table_name] = {'rows': rows, 'columns': spec['columns'], 'sort': spec['sort'],
+                                  'indexes': {name: list(index) for name, index in spec.get('indexes', {}).items()}}
+        product_index = build_product_index(frames['products'], os.path.join(staging, 'product_index'))
+        manifest = {'format_version': FORMAT_VERSION, 'version': version, 'created_at': created_at.isoformat(),
+                    'source': source, 'tables': tables, 'product_index': product_index}
+        with open(os.path.join(staging, 'manifest.json'), 'w') as handle:
+            json.dump(manifest, handle, indent=2)
+        os.rename(staging, os.path.join(root, version))
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    pointer = os.path.join(root, 'CURRENT')
+    with open(pointer + '.tmp', 'w') as handle:
+        handle.write(version + '\n')
+    os.replace(pointer + '.tmp', pointer)
+    counts = ', '.join(f"{name}: {table['rows']}" for name, table in tables.items())
+    print(f"Wrote columnar snapshot {version} in {time.perf_counter() - started:.1f}s ({counts}).")
+    prune_versions(root, keep)
+    return version
+
+
+def prune_versions(root, keep=KEEP_VERSIONS):
+    # Readers that still map an older version keep working: unlinked files stay valid while mapped.
+    versions = sorted(name for name in os.listdir(root) if os.path.isfile(os.path.join(root, name, 'manifest.json')))
+    for name in versions[:-keep]:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def export_from_mysql(connection, root=SNAPSHOT_DIR, chunk_size=100000):
+    """Builds a snapshot from the tables already in MySQL (after a streaming load, or to refresh it)."""
+    frames = {}
+    for table_name, spec in SNAPSHOT_TABLES.items():
+        query = f"SELECT {', '.join(spec['columns'])} FROM {table_name}"
+        cursor = connection.cursor()
+        cursor.execute(query)
+        chunks = []
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            chunks.append(pd.DataFrame(rows, columns=list(spec['columns'])))
+        cursor.close()
+        frames[table_name] = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=list(spec['columns']))
+    return write_snapshot(frames, root, source='mysql')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Write a columnar snapshot of the MySQL order and product tables.")
+    parser.add_argument('--snapshot-dir', default=SNAPSHOT_DIR)
+    args = parser.parse_args()
+
+    from bulk_loader import connect
+    conn = connect()
+    try:
+        export_from_mysql(conn, args.snapshot_dir)
+    finally:
+        conn.close()
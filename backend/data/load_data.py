@@ -1,3 +1,4 @@
+import argparse
 import pandas as pd
 import mysql.connector
 from mysql.connector import Error
@@ -74,6 +75,8 @@ def load_csv_to_mysql(file_path, table_name, connection, columns_map=None, date_
                 print(f"Error inserting batch into {table_name} (starting at row {i}): {e}")
                 connection.rollback()
                 print("Stopping further insertions for this table due to error in batch.")
+                # Only the committed rows are returned, so their keys are safe to filter against.
+                df = df.iloc[:i]
                 break
 
     print(f"Successfully inserted {total_inserted} total records into {table_name}.")
@@ -81,6 +84,38 @@ def load_csv_to_mysql(file_path, table_name, connection, columns_map=None, date_
     return df
 
 
+def sorted_keys(values):
+    """Compact, sorted, de-duplicated int64 key array used for FK membership tests."""
+    values = pd.Series(values).dropna()
+    return np.unique(values.to_numpy(dtype=np.int64))
+
+
+def isin_sorted(values, keys):
+    """Vectorized membership test against a `sorted_keys` array (binary search, no Python sets)."""
+    values = np.asarray(values)
+    if keys.size == 0:
+        return np.zeros(len(values), dtype=bool)
+    positions = np.minimum(np.searchsorted(keys, values), keys.size - 1)
+    return keys[positions] == values
+
+
+def filter_orphans(df, fk_keys):
+    """Drops rows whose FK columns are not in the given key arrays; returns per-column rejection counts."""
+    keep = np.ones(len(df), dtype=bool)
+    rejected = {}
+    for column, keys in fk_keys.items():
+        present = isin_sorted(df[column].to_numpy(), keys)
+        rejected[column] = int((~present).sum())
+        keep &= present
+    rejected['total'] = int((~keep).sum())
+    return df[keep], rejected
+
+
+def report_rejections(table_name, total_rows, rejected):
+    breakdown = ', '.join(f"{column}: {count}" for column, count in rejected.items() if column != 'total')
+    print(f"{table_name}: rejected {rejected['total']} of {total_rows} rows with missing foreign keys ({breakdown}).")
+
+
 def get_existing_ids(connection, table_name, id_column):
     cursor = connection.cursor()
     query = f"SELECT {id_column} FROM {table_name}"
@@ -94,7 +129,7 @@ def get_existing_ids(connection, table_name, id_column):
     finally:
         cursor.close()
 
-if __name__ == "__main__":
+def run_full_load(snapshot_dir=None):
     conn = create_db_connection()
 
     if conn:
@@ -106,32 +141,30 @@ if __name__ == "__main__":
             conn
         )
 
-        load_csv_to_mysql(
+        products_df = load_csv_to_mysql(
             'products.csv',
             'products',
             conn,
             date_cols=[]
         )
 
-        users_df_raw = pd.read_csv('users.csv')
-        load_csv_to_mysql(
+        users_df = load_csv_to_mysql(
             'users.csv',
             'users',
             conn,
-            date_cols=['created_at'],
-            dataframe=users_df_raw
+            date_cols=['created_at']
         )
 
-        existing_user_ids = get_existing_ids(conn, 'users', 'id')
-        print(f"Found {len(existing_user_ids)} unique user IDs in the database for orders filtering.")
+        # FK key sets come from the frames the loader just inserted, not from SELECT id round trips.
+        user_ids = sorted_keys(users_df['id'])
+        product_ids = sorted_keys(products_df['id'])
+        print(f"Loaded {user_ids.size} unique user IDs for orders filtering.")
 
         orders_df_raw = pd.read_csv('orders.csv')
-        initial_orders_rows = len(orders_df_raw)
-        orders_df_filtered = orders_df_raw[orders_df_raw['user_id'].isin(existing_user_ids)].copy()
-        if len(orders_df_filtered) < initial_orders_rows:
-            print(f"Removed {initial_orders_rows - len(orders_df_filtered)} orders due to non-existent user_id.")
+        orders_df_filtered, rejected = filter_orphans(orders_df_raw, {'user_id': user_ids})
+        report_rejections('orders', len(orders_df_raw), rejected)
 
-        load_csv_to_mysql(
+        orders_df = load_csv_to_mysql(
             None,
             'orders',
             conn,
@@ -143,7 +176,7 @@ if __name__ == "__main__":
             dataframe=orders_df_filtered
         )
 
-        load_csv_to_mysql(
+        inventory_items_df = load_csv_to_mysql(
             'inventory_items.csv',
             'inventory_items',
             conn,
@@ -155,23 +188,18 @@ if __name__ == "__main__":
             date_cols=['created_at', 'sold_at']
         )
 
-        existing_product_ids = get_existing_ids(conn, 'products', 'id')
-        existing_inventory_item_ids = get_existing_ids(conn, 'inventory_items', 'id')
-        existing_order_ids = get_existing_ids(conn, 'orders', 'order_id')
-        print(f"Found {len(existing_product_ids)} product IDs, {len(existing_inventory_item_ids)} inventory item IDs, and {len(existing_order_ids)} order IDs for order_items filtering.")
+        inventory_item_ids = sorted_keys(inventory_items_df['id'])
+        order_ids = sorted_keys(orders_df['order_id'])
+        print(f"Loaded {product_ids.size} product IDs, {inventory_item_ids.size} inventory item IDs, and {order_ids.size} order IDs for order_items filtering.")
 
         order_items_df_raw = pd.read_csv('order_items.csv')
-        initial_order_items_rows = len(order_items_df_raw)
-
-        order_items_df_filtered = order_items_df_raw[
-            order_items_df_raw['order_id'].isin(existing_order_ids) &
-            order_items_df_raw['user_id'].isin(existing_user_ids) &
-            order_items_df_raw['product_id'].isin(existing_product_ids) &
-            order_items_df_raw['inventory_item_id'].isin(existing_inventory_item_ids)
-        ].copy()
-
-        if len(order_items_df_filtered) < initial_order_items_rows:
-            print(f"Removed {initial_order_items_rows - len(order_items_df_filtered)} order_items due to non-existent foreign keys.")
+        order_items_df_filtered, rejected = filter_orphans(order_items_df_raw, {
+            'order_id': order_ids,
+            'user_id': user_ids,
+            'product_id': product_ids,
+            'inventory_item_id': inventory_item_ids,
+        })
+        report_rejections('order_items', len(order_items_df_raw), rejected)
 
         load_csv_to_mysql(
             None,
@@ -186,7 +214,50 @@ if __name__ == "__main__":
             dataframe=order_items_df_filtered
         )
 
+        if snapshot_dir:
+            # Exported from the tables rather than the frames inserted above: on a re-run against
+            # an existing database every insert fails with duplicate keys and the frames are empty.
+            from columnar_snapshot import export_from_mysql
+            export_from_mysql(conn, snapshot_dir)
+
         conn.close()
         print("--- Data loading complete and MySQL connection closed. ---")
     else:
-        print("Failed to establish database connection. Data loading aborted.")
\ No newline at end of file
+        print("Failed to establish database connection. Data loading aborted.")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load the e-commerce CSVs into MySQL.")
+    parser.add_argument('--stream', action='store_true',
+                        help="Chunked, concurrent, resumable load (see bulk_loader.py).")
+    parser.add_argument('--chunk-size', type=int, default=50000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--method', choices=['insert', 'infile'], default='insert',
+                        help="'infile' uses LOAD DATA LOCAL INFILE (server needs local_infile=1).")
+    parser.add_argument('--tables', nargs='*', help="Subset of tables to load (default: all).")
+    parser.add_argument('--reset', action='store_true', help="Ignore checkpoints from previous runs.")
+    parser.add_argument('--snapshot-dir', default=None,
+                        help="Where to write the columnar snapshot the backend reads (default: SNAPSHOT_DIR or ./snapshot).")
+    parser.add_argument('--no-snapshot', action='store_true', help="Skip writing the columnar snapshot.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    snapshot_dir = None
+    if not args.no_snapshot:
+        from columnar_snapshot import SNAPSHOT_DIR
+        snapshot_dir = args.snapshot_dir or SNAPSHOT_DIR
+    if args.stream:
+        from bulk_loader import connect, run_streaming_load
+        run_streaming_load(tables=args.tables, chunk_size=args.chunk_size, max_workers=args.workers,
+                           method=args.method, reset=args.reset)
+        if snapshot_dir:
+            from columnar_snapshot import export_from_mysql
+            conn = connect()
+            try:
+                export_from_mysql(conn, snapshot_dir)
+            finally:
+                conn.close()
+    else:
+        run_full_load(snapshot_dir)
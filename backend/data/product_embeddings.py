@@ -0,0 +1,150 @@
+"""
+Product vectors and an approximate nearest-neighbour index, written into each
+columnar snapshot (`product_index/`) by columnar_snapshot.write_snapshot.
+
+Vectors are hashed TF-IDF, so nothing is downloaded and no model runs: word tokens
+and character trigrams (for typos and word variants) are hashed into DIM signed
+buckets, weighted by field and by idf, and L2-normalized. The backend hashes queries
+the same way (backend/backend/product_search.py); FEATURIZER names the scheme and
+must change whenever either side changes it.
+backend/tests/test_product_featurizer.py embeds the same text both ways and fails
+when they disagree.
+
+The index is an inverted file: rows are clustered with spherical k-means and stored
+grouped by cluster, so each list is one contiguous slice of vectors.npy. A query
+scores the centroids, then only the rows of the closest lists.
+
+    python product_embeddings.py "warm jacket for hiking"   # query the current snapshot
+"""
+import hashlib
+import math
+import os
+import re
+from functools import lru_cache
+
+import numpy as np
+
+FEATURIZER = 'hashed-tfidf-v1'
+DIM = int(os.getenv('PRODUCT_VECTOR_DIM', '512'))
+FIELD_WEIGHTS = {'name': 2.0, 'category': 2.0, 'brand': 1.0, 'department': 1.0}
+TRIGRAM_WEIGHT = 0.5
+# Stopwords and bare numbers (ids, sizes) carry no meaning to match on.
+STOPWORDS = frozenset('a an and for in of on or the to with'.split())
+# Below this many products one list holds everything and search is exact.
+MIN_INDEXED_ROWS = 1000
+KMEANS_ITERATIONS = 10
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text):
+    # Same normalization as the backend catalog: "T-Shirts" -> "tshirt", "Levi's" -> "levi".
+    if not isinstance(text, str):
+        return []
+    text = text.lower().replace('-', '').replace("'", '')
+    tokens = []
+    for token in _TOKEN_RE.findall(text):
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        if token not in STOPWORDS and not token.isdigit():
+            tokens.append(token)
+    return tokens
+
+
+@lru_cache(maxsize=None)
+def token_features(token, dim=DIM):
+    """(bucket, signed weight) pairs for one token: the word itself and its trigrams."""
+    padded = f' {token} '
+    features = [('w:' + token, 1.0)] + [('c:' + padded[i:i + 3], TRIGRAM_WEIGHT) for i in range(len(padded) - 2)]
+    hashed = []
+    for feature, weight in features:
+        value = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), 'little')
+        hashed.append((value % dim, weight if value >> 63 == 0 else -weight))
+    return tuple(hashed)
+
+
+def term_frequencies(fields, dim=DIM):
+    """Weighted, hashed term frequencies of one document: {bucket: value}."""
+    counts = {}
+    for text, field_weight in fields:
+        for token in tokenize(text):
+            for bucket, weight in token_features(token, dim):
+                counts[bucket] = counts.get(bucket, 0.0) + field_weight * weight
+    return counts
+
+
+def normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def spherical_kmeans(vectors, lists, iterations=KMEANS_ITERATIONS, seed=0):
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), lists, replace=False)].copy()
+    assignment = np.zeros(len(vectors), dtype=np.int64)
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        empty = np.bincount(assignment, minlength=lists) == 0
+        # An empty list would keep a zero centroid; re-seed it from a random row.
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        centroids = normalize(sums.astype(np.float32))
+    return centroids, np.argmax(vectors @ centroids.T, axis=1)
+
+
+def build_product_index(products, index_dir, dim=DIM):
+    """Writes vectors and the list layout for `products` (a DataFrame) to `index_dir`; returns its manifest entry."""
+    os.makedirs(index_dir)
+    documents = [
+        term_frequencies([(row.get(field), weight) for field, weight in FIELD_WEIGHTS.items()], dim)
+        for row in products.to_dict('records')
+    ]
+    rows = len(documents)
+    vectors = np.zeros((rows, dim), dtype=np.float32)
+    for row, counts in enumerate(documents):
+        if counts:
+            vectors[row, list(counts)] = list(counts.values())
+    document_frequency = np.count_nonzero(vectors, axis=0)
+    idf = np.log((1 + rows) / (1 + document_frequency)).astype(np.float32) + 1
+    vectors = normalize(vectors * idf)
+
+    lists = int(math.sqrt(rows)) if rows >= MIN_INDEXED_ROWS else 1
+    if lists > 1:
+        centroids, assignment = spherical_kmeans(vectors, lists)
+    else:
+        centroids, assignment = normalize(vectors.sum(axis=0, keepdims=True)), np.zeros(rows, dtype=np.int64)
+    order = np.argsort(assignment, kind='stable')
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=lists))]).astype(np.int64)
+    product_ids = products['id'].to_numpy(dtype=np.int64)[order] if rows else np.array([], dtype=np.int64)
+
+    for name, array in (('vectors', vectors[order]), ('product_ids', product_ids), ('centroids', centroids),
+                        ('list_offsets', offsets), ('idf', idf)):
+        np.save(os.path.join(index_dir, f'{name}.npy'), np.ascontiguousarray(array), allow_pickle=False)
+    return {'featurizer': FEATURIZER, 'dim': dim, 'rows': rows, 'lists': lists}
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    from columnar_snapshot import SNAPSHOT_DIR
+
+    parser = argparse.ArgumentParser(description="Nearest products to a query in the current snapshot (exact search).")
+    parser.add_argument('query')
+    parser.add_argument('--snapshot-dir', default=SNAPSHOT_DIR)
+    parser.add_argument('-k', type=int, default=5)
+    args = parser.parse_args()
+
+    with open(os.path.join(args.snapshot_dir, 'CURRENT')) as handle:
+        index_dir = os.path.join(args.snapshot_dir, handle.read().strip(), 'product_index')
+    vectors = np.load(os.path.join(index_dir, 'vectors.npy'), mmap_mode='r')
+    product_ids = np.load(os.path.join(index_dir, 'product_ids.npy'))
+    idf = np.load(os.path.join(index_dir, 'idf.npy'))
+    query = np.zeros(vectors.shape[1], dtype=np.float32)
+    for bucket, value in term_frequencies([(args.query, 1.0)], vectors.shape[1]).items():
+        query[bucket] = value
+    query = normalize((query * idf)[None, :])[0]
+    scores = vectors @ query
+    top = np.argsort(-scores)[:args.k]
+    print(json.dumps([{'id': int(product_ids[row]), 'score': round(float(scores[row]), 3)} for row in top], indent=2))
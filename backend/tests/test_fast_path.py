@@ -0,0 +1,51 @@
+import asyncio
+import json
+
+import pytest
+
+from backend.backend.fast_path import FastPathRouter, Route, route
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("status of order 12345", Route("order_status", "get_order_details", {"order_id": 12345})),
+    ("where is order #2?", Route("order_status", "get_order_details", {"order_id": 2})),
+    ("order number 42 status", Route("order_status", "get_order_details", {"order_id": 42})),
+    ("track my package #4521", Route("order_status", "get_order_details", {"order_id": 4521})),
+    ("price of SKU ABC-123", Route("product_sku", "get_product_details", {"sku": "ABC-123"})),
+])
+def test_routes_explicit_lookups(message, expected):
+    assert route(message) == expected
+
+
+@pytest.mark.parametrize("message", [
+    "where can I order 2 shirts?",
+    "I placed an order 2 days ago, where is it?",
+    "Can I order 3 jackets in a larger size?",
+    "what is the sku for the blue jeans?",
+    "cancel order 12345",
+    "status of order 12345 and order 12346",
+])
+def test_leaves_ordinary_sentences_to_the_llm(message):
+    assert route(message) is None
+
+
+class StubRegistry:
+    def __init__(self, output):
+        self.output = output
+
+    async def call(self, session_factory, tool_call, user_id):
+        return {"content": json.dumps(self.output)}
+
+
+def test_not_found_falls_through_to_the_llm():
+    router = FastPathRouter(StubRegistry(None), enabled=True)
+    assert asyncio.run(router.answer(None, "status of order 12345", 1)) is None
+    assert router.answered == 0
+
+
+def test_found_order_is_answered():
+    order = {"order_id": 12345, "status": "Shipped", "created_at": "2024-03-05T10:00:00", "items": []}
+    router = FastPathRouter(StubRegistry(order), enabled=True)
+    answer = asyncio.run(router.answer(None, "status of order 12345", 1))
+    assert answer.startswith("Order #12345 is currently Shipped.")
+    assert router.answered == 1
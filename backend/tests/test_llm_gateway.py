@@ -0,0 +1,88 @@
+import asyncio
+from types import SimpleNamespace
+
+import groq
+import httpx
+import pytest
+
+from backend.backend import llm_gateway
+from backend.backend.llm_gateway import CircuitBreaker, CircuitOpenError, LLMGateway, LLMUnavailableError
+
+
+class FakeClient:
+    """chat.completions.create fails with a 503 while `failing`, otherwise answers "ok"."""
+
+    def __init__(self):
+        self.failing = True
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs):
+        if self.failing:
+            request = httpx.Request("POST", "https://api.groq.com/openai/v1/chat/completions")
+            raise groq.InternalServerError("down", response=httpx.Response(503, request=request), body=None)
+        return "ok"
+
+
+def open_gateway(client, **kwargs):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.01)
+    return LLMGateway(lambda: client, max_retries=0, breaker=breaker, **kwargs)
+
+
+async def trip(gateway):
+    with pytest.raises(groq.InternalServerError):
+        await gateway.create(messages=[{"role": "user", "content": "trip"}])
+    assert gateway.breaker.state == CircuitBreaker.OPEN
+    await asyncio.sleep(0.02)
+
+
+def test_probe_failing_to_get_a_slot_lets_the_next_call_probe():
+    async def run():
+        client = FakeClient()
+        gateway = open_gateway(client, max_concurrency=1, queue_timeout=0.01)
+        await trip(gateway)
+        await gateway._semaphore.acquire()  # every slot busy: the probe times out in the queue
+        with pytest.raises(LLMUnavailableError):
+            await gateway.create(messages=[{"role": "user", "content": "probe"}])
+        gateway._semaphore.release()
+        client.failing = False
+        assert await gateway.create(messages=[{"role": "user", "content": "recover"}]) == "ok"
+        assert gateway.breaker.state == CircuitBreaker.CLOSED
+    asyncio.run(run())
+
+
+def test_cancelled_probe_lets_the_next_call_probe():
+    async def run():
+        client = FakeClient()
+        gateway = open_gateway(client, max_concurrency=1, queue_timeout=5)
+        await trip(gateway)
+        await gateway._semaphore.acquire()
+        probe = asyncio.create_task(gateway.create(messages=[{"role": "user", "content": "probe"}]))
+        await asyncio.sleep(0.01)
+        with pytest.raises(CircuitOpenError):
+            await gateway.create(messages=[{"role": "user", "content": "while probing"}])
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        gateway._semaphore.release()
+        client.failing = False
+        assert await gateway.create(messages=[{"role": "user", "content": "recover"}]) == "ok"
+        assert gateway.breaker.state == CircuitBreaker.CLOSED
+    asyncio.run(run())
+
+
+def test_probe_cancelled_during_backoff_lets_the_next_call_probe(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "retry_delay", lambda attempt, error: 5)
+
+    async def run():
+        client = FakeClient()
+        gateway = open_gateway(client)
+        await trip(gateway)
+        gateway.max_retries = 1
+        probe = asyncio.create_task(gateway.create(messages=[{"role": "user", "content": "probe"}]))
+        await asyncio.sleep(0.01)  # first attempt failed, now backing off
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        client.failing = False
+        assert await gateway.create(messages=[{"role": "user", "content": "recover"}]) == "ok"
+    asyncio.run(run())
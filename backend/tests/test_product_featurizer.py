@@ -0,0 +1,53 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data"))
+
+import product_embeddings  # noqa: E402
+from backend.backend import product_search  # noqa: E402
+
+# Hyphens, apostrophes, plurals, stopwords, bare numbers and mixed tokens: every tokenizer rule.
+TEXTS = [
+    "Levi's 501 Original Fit Jeans",
+    "T-Shirts for the Beach",
+    "warm jacket for hiking",
+    "Dress 2 Glass-Slippers XS",
+    "wool socks (3 pack)",
+    "Tops & Tees, Bags",
+    "SKU ABC-123 in stock",
+    "the and of",
+]
+
+
+def test_query_side_matches_index_side(tmp_path):
+    products = pd.DataFrame({"id": range(1, len(TEXTS) + 1), "name": TEXTS,
+                             "category": None, "brand": None, "department": None})
+    spec = product_embeddings.build_product_index(products, str(tmp_path / "index"))
+    index = product_search.ProductVectorIndex(str(tmp_path / "index"), spec)
+
+    assert spec["featurizer"] == product_search.FEATURIZER
+    assert product_embeddings.STOPWORDS == product_search.STOPWORDS
+    assert product_embeddings.TRIGRAM_WEIGHT == product_search.TRIGRAM_WEIGHT
+    # One list below MIN_INDEXED_ROWS, so vectors.npy keeps the input order.
+    np.testing.assert_allclose(index.embed(TEXTS), np.asarray(index.vectors), atol=1e-6)
+
+
+
+def test_kmeans_centroids_are_member_means():
+    rng = np.random.default_rng(3)
+    points = product_embeddings.normalize(rng.random((3, 8)).astype(np.float32))
+    vectors = product_embeddings.normalize(np.repeat(points, 4, axis=0) + rng.normal(0, 0.05, (12, 8)).astype(np.float32))
+    # Exact duplicates make tied centroids, so later lists (the last one included) start out empty.
+    vectors = np.concatenate([vectors, vectors])
+    lists = 8
+    initial = vectors[np.random.default_rng(0).choice(len(vectors), lists, replace=False)]
+    assignment = np.argmax(vectors @ initial.T, axis=1)
+    assert np.bincount(assignment, minlength=lists)[-1] == 0
+
+    centroids, _ = product_embeddings.spherical_kmeans(vectors, lists, iterations=1, seed=0)
+    for cluster in np.unique(assignment):
+        expected = product_embeddings.normalize(vectors[assignment == cluster].sum(axis=0, keepdims=True))[0]
+        np.testing.assert_allclose(centroids[cluster], expected, atol=1e-5)
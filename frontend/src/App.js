@@ -15,6 +15,22 @@ function App() {
   // Backend API URL
   const API_BASE_URL = 'http://localhost:8000';
 
+  // Listing endpoints return one page at a time; the X-Next-Cursor header points at the next one.
+  const fetchAllPages = async (url) => {
+    const rows = [];
+    let cursor = null;
+    do {
+      const pageUrl = cursor ? `${url}?cursor=${encodeURIComponent(cursor)}` : url;
+      const response = await fetch(pageUrl);
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+      }
+      rows.push(...await response.json());
+      cursor = response.headers.get('X-Next-Cursor');
+    } while (cursor);
+    return rows;
+  };
+
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
   };
@@ -30,11 +46,7 @@ function App() {
 
   const fetchConversations = async () => {
     try {
-      const response = await fetch(`${API_BASE_URL}/users/${USER_ID}/conversations`);
-      if (!response.ok) {
-        throw new Error(`HTTP error! status: ${response.status}`);
-      }
-      const data = await response.json();
+      const data = await fetchAllPages(`${API_BASE_URL}/users/${USER_ID}/conversations`);
       setConversations(data);
     } catch (error) {
       console.error("Failed to fetch conversations:", error);
@@ -46,11 +58,7 @@ function App() {
     setConversationId(id); // Set the current conversation ID
     setMessages([]); // Clear current messages
     try {
-      const response = await fetch(`${API_BASE_URL}/conversations/${id}/messages`);
-      if (!response.ok) {
-        throw new Error(`HTTP error! status: ${response.status}`);
-      }
-      const data = await response.json();
+      const data = await fetchAllPages(`${API_BASE_URL}/conversations/${id}/messages`);
       // Map API response to our local message structure
       const loadedMessages = data.map(msg => ({
         text: msg.content,